@@ -1,10 +1,12 @@
 from fastapi import APIRouter, HTTPException, status
+from starlette.responses import Response
 from common import init_logging, except2str
 from pydantic import HttpUrl
 from data.models import Graph, GraphConfig
 import data.models as m
 from typing import List, Optional
 import data.cache as cache
+from data.codec import CompactGraph
 import functools
 
 logger = init_logging('comex.api.route.graph')
@@ -29,11 +31,14 @@ def catch_errors(func):
 @catch_errors
 async def get_graph(article_ids: List[int] = None,
                     urls: List[HttpUrl] = None,
-                    override_cache: bool = False, ignore_cache: bool = False,
+                    override_cache: bool = False, ignore_cache: bool = False, refresh: bool = False,
                     conf: GraphConfig = None):
     if conf is not None:
         conf = conf.dict(exclude_unset=True)
         logger.debug(f'Graph request included config: {conf}')
     graph = await cache.get_graph(urls=urls, article_ids=article_ids, conf=conf,
-                                  override_cache=override_cache, ignore_cache=ignore_cache)
+                                  override_cache=override_cache, ignore_cache=ignore_cache, refresh=refresh)
+    if isinstance(graph, CompactGraph):
+        # cached graphs are serialised directly, without validating them against the response model
+        return Response(content=graph.to_json(), media_type='application/json')
     return graph
@@ -1,6 +1,11 @@
 from fastapi import APIRouter
 from fastapi.responses import PlainTextResponse
 from common import init_logging
+from data.processors.scheduler import init_or_get_scheduler
+from data.memcache import init_or_get_graph_cache, init_or_get_prefix_cache
+from data.singleflight import graph_builds, article_scrapes
+from data.scrapers.pool import init_or_get_scraper_pool
+from data.scrapers.http_cache import init_or_get_http_cache
 
 logger = init_logging('comex.api.route.ping')
 router = APIRouter()
@@ -18,6 +23,33 @@ async def _pong():
     return 'pong'
 
 
+@router.get('/inference')
+async def _inference_stats() -> dict:
+    scheduler = init_or_get_scheduler()
+    if scheduler is None:
+        return {'batching': False}
+    return {'batching': True, **scheduler.stats()}
+
+
+@router.get('/cache')
+async def _cache_stats() -> dict:
+    graph_cache = init_or_get_graph_cache()
+    prefix_cache = init_or_get_prefix_cache()
+    stats = {
+        'single_flight': {'graph_builds': graph_builds.stats(), 'article_scrapes': article_scrapes.stats()},
+        'prefix_cache': prefix_cache.stats() if prefix_cache is not None else False
+    }
+    if graph_cache is None:
+        return {'memory_cache': False, **stats}
+    return {'memory_cache': True, **graph_cache.stats(), **stats}
+
+
+@router.get('/scrapers')
+async def _scraper_stats() -> dict:
+    http_cache = init_or_get_http_cache()
+    return {**init_or_get_scraper_pool().stats(), 'http_cache': http_cache.stats() if http_cache is not None else False}
+
+
 @router.post('/{name}', response_class=PlainTextResponse)
 async def _ping(name: str) -> str:
     return f'Hello {name}'
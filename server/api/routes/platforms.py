@@ -2,9 +2,11 @@ from fastapi import APIRouter, HTTPException, status
 from common import init_logging, except2str
 from pydantic import HttpUrl
 from data.models import CommentedArticle, ScrapeResultStatus, ScrapeResult, ScrapeResultDetails, CacheResult
-from data.scrapers import scrape, NoScraperException, ScraperWarning, NoCommentsWarning
+from data.scrapers import NoScraperException, ScraperWarning, NoCommentsWarning
+from data.scrapers.pool import scrape
 import data.cache as cache
-from requests.exceptions import RequestException
+from aiohttp import ClientError
+import asyncio
 import functools
 from typing import Union
 
@@ -27,7 +29,7 @@ def catch_scrape_errors(func):
             raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                                 detail=ScrapeResultDetails(status=ScrapeResultStatus.NO_COMMENTS,
                                                            error=except2str(e, logger)).__dict__)
-        except (RequestException, ScraperWarning) as e:
+        except (ClientError, asyncio.TimeoutError, ScraperWarning) as e:
             raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                                 detail=ScrapeResultDetails(status=ScrapeResultStatus.SCRAPER_ERROR,
                                                            error=except2str(e, logger)).__dict__)
@@ -42,7 +44,7 @@ def catch_scrape_errors(func):
 @router.get('/scrape', response_model=ScrapeResult)
 @catch_scrape_errors
 async def direct_scrape(url: HttpUrl):
-    article, comments = scrape(url)
+    article, comments = await scrape(url)
     article = CommentedArticle(**article.dict(), comments=comments)
     return ScrapeResult(payload=article)
 
@@ -6,12 +6,12 @@ import yaml
 import math
 import traceback
 from uvicorn.logging import AccessFormatter, DefaultFormatter
-from tensorflow.keras.models import load_model as load_keras_model
 from fasttext import load_model as load_fasttext_model
 
 config = None
 fasttext_model = None
 toxicity_model = None
+toxicity_linear_model = None
 
 
 def init_config(override_args=None):
@@ -88,9 +88,26 @@ def init_or_get_fasttext_model():
 def init_or_get_toxicity_model():
     global toxicity_model
     if toxicity_model is None:
-        toxicity_model = load_keras_model(config.get('TextProcessing', 'toxicity_path'))
+        backend = config.get('TextProcessing', 'toxicity_backend', fallback='keras')
+        if backend == 'numpy':
+            # exported weights, see scripts/export_toxicity_model.py; avoids loading tensorflow in this process
+            from data.processors.inference import NumpyModel
+            toxicity_model = NumpyModel(config.get('TextProcessing', 'toxicity_npz_path'))
+        elif backend == 'keras':
+            from tensorflow.keras.models import load_model as load_keras_model
+            toxicity_model = load_keras_model(config.get('TextProcessing', 'toxicity_path'))
+        else:
+            raise ValueError(f'Unknown toxicity_backend: {backend}')
     return toxicity_model
 
 
+def init_or_get_toxicity_linear_model():
+    global toxicity_linear_model
+    if toxicity_linear_model is None:
+        from data.processors.inference import LinearToxicityModel
+        toxicity_linear_model = LinearToxicityModel(config.get('TextProcessing', 'toxicity_linear_path'))
+    return toxicity_linear_model
+
+
 __all__ = ['get_logger_config', 'config', 'init_logging', 'init_config', 'except2str', 'init_or_get_fasttext_model',
-           'init_or_get_toxicity_model']
+           'init_or_get_toxicity_model', 'init_or_get_toxicity_linear_model']
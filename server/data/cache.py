@@ -1,13 +1,20 @@
+import asyncio
+import queue
 from configparser import ConfigParser
 from common import config
 import data.database as db
 import data.models as models
+from data.codec import CompactGraph, StageData
+from data.memcache import init_or_get_graph_cache, graph_key
+from data.singleflight import graph_builds, article_scrapes
 from fastapi import Depends
-from typing import Union, Optional, Tuple, List
+from starlette.concurrency import run_in_threadpool
+from typing import Dict, Union, Optional, Tuple, List
 
-from data.scrapers import scrape, prepare_url, get_matching_scraper, \
+from data.scrapers import prepare_url, get_matching_scraper, \
     NoScraperException, ScraperWarning, NoCommentsWarning
-from data.processors.graph import GraphRepresentation
+from data.scrapers.pool import scrape
+from data.processors.graph import GraphRepresentation, CommentBatches, composable, config_hash, stage_hash
 from data.processors.graph_testing import GraphRepresentation as GraphBenchmark
 import logging
 
@@ -15,51 +22,208 @@ logger = logging.getLogger('data.cache')
 
 
 async def get_graph(urls: List[str] = None, article_ids: List[int] = None, conf: dict = None,
-                    override_cache: bool = False, ignore_cache: bool = False) -> models.Graph:
+                    override_cache: bool = False, ignore_cache: bool = False,
+                    refresh: bool = False) -> Union[models.Graph, CompactGraph]:
     if urls:
         article_ids = [await db.get_article_id(url) for url in urls]
 
+    if refresh:
+        for article_id in article_ids:
+            await article_scrapes.do(('refresh', article_id), lambda: refresh_article(article_id))
+
+    # every variant of the config is cached separately
+    conf_hash = config_hash(conf)
+
     if not ignore_cache and not override_cache:
-        graph = await db.get_graph(article_ids)
+        graph = await get_cached_graph(article_ids, conf_hash)
         if graph:
-            logger.debug(f'Found graph cache entry with {len(graph.edges)} edges '
+            logger.debug(f'Found graph cache entry with {graph.num_edges} edges '
                          f'for article_ids: {article_ids} | urls: {urls}')
-            return graph
+            if refresh:
+                cached = graph
+                graph = await graph_builds.do(('update', graph_key(article_ids, conf_hash)),
+                                              lambda: update_graph(cached, article_ids, conf, conf_hash))
+            if graph:
+                return graph
         else:
             logger.debug(f'No cached graph found for article_ids: {article_ids} | urls: {urls}')
     else:
         logger.debug('Ignoring cache for graph request.')
 
-    comments = await db.get_comments(article_ids)
+    # concurrent requests for the same uncached graph share one build
+    return await graph_builds.do(('build', graph_key(article_ids, conf_hash), ignore_cache),
+                                 lambda: build_and_store_graph(article_ids, conf, conf_hash, store=not ignore_cache))
+
 
+async def build_and_store_graph(article_ids: List[int], conf: dict, conf_hash: str,
+                                store: bool = True) -> models.Graph:
     config_parser = ConfigParser()
     config_parser.read_dict(config)
 
     use_benchmark_mode = config_parser.getboolean('mode', 'benchmark')
 
-    if use_benchmark_mode:
-        logger.info(f'Started benchmark mode.')
-        graph_rep = GraphBenchmark(comments, conf=conf)
-    else:
-        graph_rep = GraphRepresentation(comments, conf=conf)
-    graph = models.Graph(**graph_rep.__dict__())
-
-    logger.debug(f'Constructed graph with {len(graph.edges)} edges '
-                 f'for article_ids: {article_ids} | urls: {urls}')
-
-    if not ignore_cache:
-        if override_cache:
-            old_graph_id = await db.get_graph_id(article_ids)
-            if old_graph_id is not None:
-                await db.delete_edges(graph_id=old_graph_id)
-        graph_id = await db.store_graph(article_ids, graph)
+    # configs that only differ in the modifiers share split comments and edges
+    use_stage_cache = config_parser.getboolean('cache', 'stage_cache') and not use_benchmark_mode
+    stage = None
+    parts = None
+    if use_stage_cache:
+        stage_key = stage_hash(conf)
+        stage = await db.get_stage(article_ids, stage_key)
+        if stage is None and len(set(article_ids)) > 1 and composable(conf):
+            # graphs of several articles are composed from the stages of the single articles,
+            # so only pairs of comments from different articles are compared
+            parts = {article_id: await db.get_stage([article_id], stage_key) for article_id in set(article_ids)}
+
+    (graph, raw_edges, new_stage), comments = await build_graph_streamed(
+        article_ids, conf, use_benchmark_mode, stage=stage, record_stage=use_stage_cache, parts=parts)
+
+    logger.debug(f'Constructed graph with {len(graph.edges)} edges for article_ids: {article_ids}')
+
+    if use_stage_cache and new_stage is not None and new_stage is not stage:
+        await db.store_stage(article_ids, stage_key, new_stage)
+        # missing stages of single articles for later compositions
+        for article_id, part in (parts or {}).items():
+            article_comments = [comment for comment in comments if comment.article_id == article_id]
+            if part is None or not part.matches(article_comments):
+                part = new_stage.select([comment.id for comment in article_comments])
+                await db.store_stage([article_id], stage_key, part)
+
+    if store:
+        await db.delete_graphs(article_ids, conf_hash)
+        graph_id = await db.store_graph(article_ids, graph, conf_hash, raw_edges)
         graph.graph_id = graph_id
         graph.article_ids = article_ids
+        graph.version = 1
 
+    return graph
+
+
+async def get_cached_graph(article_ids: List[int], conf_hash: str) -> Optional[CompactGraph]:
+    """
+    Looks up the graph in the in-memory cache first and in the database second.
+    """
+    memory_cache = init_or_get_graph_cache()
+    if memory_cache is None:
+        return await db.get_graph(article_ids, conf_hash)
 
+    key = graph_key(article_ids, conf_hash)
+    graph = memory_cache.get(key)
+    if graph is not None:
+        db.touch_graph(graph.graph_id)
+    else:
+        # the graph isn't cached if it was invalidated while it was read
+        generation = memory_cache.generation
+        graph = await db.get_graph(article_ids, conf_hash)
+        if graph:
+            # serialise before caching, so the entry is ready to serve and its size is known
+            graph.to_json()
+            memory_cache.put(key, graph, graph.nbytes, generation=generation)
     return graph
 
 
+async def update_graph(graph: CompactGraph, article_ids: List[int], conf: dict = None,
+                       conf_hash: str = None) -> Union[models.Graph, CompactGraph, None]:
+    """
+    Extends the cached graph by the comments that were added since it was built and stores it as a new version.
+    Returns None if the graph can't be updated incrementally, e.g. because it was built in benchmark mode.
+    """
+    # the comments are only loaded if there are new ones
+    known = set(graph.arrays['comment_ids'].tolist())
+    num_new = len(await db.get_stored_comment_ids(article_ids) - known)
+    if num_new == 0:
+        logger.debug(f'No new comments for graph {graph.graph_id}')
+        return graph
+
+    raw_edges = await db.get_raw_edges(graph.graph_id)
+    if raw_edges is None:
+        logger.debug(f'Graph {graph.graph_id} has no raw edges, it has to be rebuilt')
+        return None
+
+    try:
+        (updated, raw_edges, _), _ = await build_graph_streamed(article_ids, conf,
+                                                                base=graph.to_model(), base_edges=raw_edges)
+    except ValueError as e:
+        # e.g. comments were deleted in the meantime
+        logger.warning(f'Incremental update of graph {graph.graph_id} failed, it has to be rebuilt: {e}')
+        return None
+
+    if conf_hash is None:
+        conf_hash = config_hash(conf)
+    version = (graph.version or 1) + 1
+    updated.graph_id = await db.store_graph(article_ids, updated, conf_hash, raw_edges, version=version)
+    updated.article_ids = article_ids
+    updated.version = version
+    await db.delete_graphs(article_ids, conf_hash,
+                           below_version=version - config.getint('cache', 'keep_graph_versions') + 1)
+    logger.debug(f'Updated graph {graph.graph_id} by {num_new} comments to version {version}')
+    return updated
+
+
+class _CommentStream:
+    _END = object()
+
+    def __init__(self):
+        """
+        Hands the comment batches that are loaded on the event loop to a graph build in a worker thread.
+        """
+        self.comments: List[models.CommentCached] = []
+        self._batches = queue.Queue()
+
+    def put(self, batch: List[models.CommentCached]):
+        self.comments.extend(batch)
+        self._batches.put(batch)
+
+    def close(self, error: BaseException = None):
+        self._batches.put(self._END if error is None else error)
+
+    def __iter__(self):
+        while True:
+            batch = self._batches.get()
+            if batch is self._END:
+                return
+            if isinstance(batch, BaseException):
+                raise batch
+            yield batch
+
+
+async def build_graph_streamed(article_ids: List[int], *args, **kwargs) \
+        -> Tuple[Tuple[models.Graph, Optional[List[models.Edge]], Optional[StageData]], List[models.CommentCached]]:
+    """
+    Runs build_graph in a worker thread, so that the event loop stays responsive and model calls of concurrent
+    requests can be batched by the inference scheduler. The comments are streamed from the database into the build,
+    so they are split while the next batches are loaded.
+    :return: the result of build_graph and the comments
+    """
+    stream = _CommentStream()
+    build = asyncio.ensure_future(run_in_threadpool(build_graph, stream, *args, **kwargs))
+    try:
+        async for batch in db.iter_comments(article_ids):
+            stream.put(batch)
+    except BaseException as e:
+        stream.close(e)
+        build.cancel()
+        raise
+    stream.close()
+    return await build, stream.comments
+
+
+def build_graph(comments: Union[List[models.CommentCached], CommentBatches], conf: dict = None,
+                use_benchmark_mode: bool = False,
+                base: models.Graph = None, base_edges: List[models.Edge] = None,
+                stage: StageData = None, record_stage: bool = False, parts: Dict[int, StageData] = None) \
+        -> Tuple[models.Graph, Optional[List[models.Edge]], Optional[StageData]]:
+    if use_benchmark_mode:
+        logger.info(f'Started benchmark mode.')
+        if not isinstance(comments, list):
+            comments = [comment for batch in comments for comment in batch]
+        graph_rep = GraphBenchmark(comments, conf=conf)
+        return models.Graph(**graph_rep.__dict__()), None, None
+
+    graph_rep = GraphRepresentation(comments, conf=conf, base=base, base_edges=base_edges,
+                                    stage=stage, record_stage=record_stage, parts=parts)
+    return models.Graph(**graph_rep.__dict__()), graph_rep.raw_edges, graph_rep.stage
+
+
 async def get_stored_article(article_id: int):
     return await db.get_article_with_comments(article_id=article_id)
 
@@ -72,11 +236,17 @@ async def get_article(url: str, override_cache=False, ignore_cache=False):
             article = await db.get_article_with_comments(url=url)
             logger.debug(f'Found cache entry id: {article.id} for {url}')
             return article
-    except AssertionError:
+    except db.ArticleNotFoundError:
         # nothing cached for given URL
         logger.debug(f'No cache entry for {url}')
 
-    article, comments = scrape(url)
+    # concurrent requests for the same URL share one scrape
+    return await article_scrapes.do(('scrape', url, override_cache),
+                                    lambda: scrape_and_store_article(url, override_cache))
+
+
+async def scrape_and_store_article(url: str, override_cache=False) -> models.ArticleCached:
+    article, comments = await scrape(url)
 
     # check if scraping was successful
     assert article and comments
@@ -86,7 +256,29 @@ async def get_article(url: str, override_cache=False, ignore_cache=False):
     if override_cache:
         await db.delete_article(url=url, recursive=True)
 
-    article_id = await db.insert_article(article)
-    await db.insert_comments(comments, article_id)
+    return await db.insert_article_with_comments(article, comments)
+
+
+async def refresh_article(article_id: int) -> int:
+    """
+    Scrapes the article again, stores comments that are not cached yet and updates the votes of the others.
+    If votes changed, the cached graphs of the article are deleted: incremental updates only rank the new comments,
+    so the graphs are rebuilt (from the stage cache) on the next request instead.
+    :return: number of new comments
+    """
+    article = await db.get_article(article_id=article_id)
+    if not article:
+        raise db.ArticleNotFoundError(f'No article cached for {article_id}')
 
-    return await db.get_article_with_comments(url=url)
+    _, comments = await scrape(article['url'])
+    known = await db.get_comment_votes(article_id)
+    new = [comment for comment in comments if comment.comment_id not in known]
+    changed = [comment for comment in comments if comment.comment_id in known and
+               tuple(getattr(comment, field) for field in db.VOTE_FIELDS) != known[comment.comment_id]]
+    if new:
+        await db.insert_comments(new, article_id)
+    if changed:
+        await db.update_comment_votes(changed, article_id)
+        await db.delete_edges(article_id=article_id)
+    logger.debug(f'Refreshed article {article_id} with {len(new)} new comments and {len(changed)} changed votes')
+    return len(new)
@@ -0,0 +1,311 @@
+import json
+import struct
+import zlib
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+import data.models as models
+
+# binary layout: MAGIC | format version (uint8) | header length (uint32) | JSON header | zlib compressed arrays
+MAGIC = b'CXG'
+FORMAT_VERSION = 1
+_PREAMBLE = struct.Struct('<BI')
+
+SPLIT_WEIGHT_TYPES = list(models.SplitWeights.__fields__.keys())
+EDGE_WEIGHT_TYPES = list(models.EdgeWeights.__fields__.keys())
+
+
+class GraphFormatError(ValueError):
+    pass
+
+
+def pack_arrays(arrays: Dict[str, np.ndarray], compression_level: int = 6) -> bytes:
+    """
+    Serialises named numpy arrays into one compressed binary blob.
+    """
+    header = []
+    payload = []
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        header.append({'name': name, 'dtype': array.dtype.str, 'shape': array.shape})
+        payload.append(array.tobytes())
+    header = json.dumps(header).encode('utf-8')
+    return MAGIC + _PREAMBLE.pack(FORMAT_VERSION, len(header)) + header + \
+        zlib.compress(b''.join(payload), compression_level)
+
+
+def unpack_arrays(data: bytes) -> Dict[str, np.ndarray]:
+    """
+    Inverse of pack_arrays, the arrays are read-only views on the decompressed buffer.
+    """
+    if data[:len(MAGIC)] != MAGIC:
+        raise GraphFormatError('Not a binary graph')
+    offset = len(MAGIC)
+    version, header_length = _PREAMBLE.unpack_from(data, offset)
+    if version != FORMAT_VERSION:
+        raise GraphFormatError(f'Unsupported graph format version {version}')
+    offset += _PREAMBLE.size
+    header = json.loads(data[offset:offset + header_length].decode('utf-8'))
+    payload = zlib.decompress(data[offset + header_length:])
+
+    arrays = {}
+    position = 0
+    for entry in header:
+        dtype = np.dtype(entry['dtype'])
+        count = int(np.prod(entry['shape'], dtype=np.int64))
+        arrays[entry['name']] = np.frombuffer(payload, dtype=dtype, count=count,
+                                              offset=position).reshape(entry['shape'])
+        position += count * dtype.itemsize
+    return arrays
+
+
+def _weights_to_array(weights: List, weight_types: List[str]) -> np.ndarray:
+    # missing weights are stored as NaN
+    return np.array([[np.nan if w is None else w for w in (getattr(wgts, t) for t in weight_types)]
+                     for wgts in weights], dtype=np.float64).reshape(len(weights), len(weight_types))
+
+
+def _array_to_weights(array: np.ndarray, weight_types: List[str]) -> List[dict]:
+    values = np.where(np.isnan(array), None, array).tolist()
+    return [dict(zip(weight_types, row)) for row in values]
+
+
+EDGE_FIELDS = frozenset(models.Edge.__fields__)
+
+
+def _construct(model, values: dict, fields_set: set):
+    """
+    Like BaseModel.construct without copying the values and filling defaults, values must contain all fields.
+    """
+    obj = model.__new__(model)
+    object.__setattr__(obj, '__dict__', values)
+    object.__setattr__(obj, '__fields_set__', fields_set)
+    return obj
+
+
+def encode_edges(edges: List[models.Edge]) -> Dict[str, np.ndarray]:
+    return {
+        # src comment, src split, tgt comment, tgt split
+        'edge_nodes': np.array([(*edge.src, *edge.tgt) for edge in edges], dtype=np.int32).reshape(len(edges), 4),
+        'edge_weights': _weights_to_array([edge.wgts for edge in edges], EDGE_WEIGHT_TYPES)
+    }
+
+
+def decode_edges(arrays: Dict[str, np.ndarray]) -> List[dict]:
+    nodes = arrays['edge_nodes'].tolist()
+    weights = _array_to_weights(arrays['edge_weights'], EDGE_WEIGHT_TYPES)
+    return [{'src': node[:2], 'tgt': node[2:], 'wgts': wgts} for node, wgts in zip(nodes, weights)]
+
+
+def pack_edges(edges: List[models.Edge]) -> bytes:
+    return pack_arrays(encode_edges(edges))
+
+
+def unpack_edges(data: bytes) -> List[models.Edge]:
+    return [models.Edge(**edge) for edge in decode_edges(unpack_arrays(data))]
+
+
+class CompactGraph:
+    def __init__(self, arrays: Dict[str, np.ndarray], article_ids: List[int] = None, graph_id: int = None,
+                 version: int = None):
+        """
+        Columnar representation of a models.Graph, which can be sent to clients without creating one object per
+        edge or split.
+        :param arrays: columns as written by from_graph
+        :param article_ids: see models.Graph
+        :param graph_id: see models.Graph
+        :param version: see models.Graph
+        """
+        self.arrays = arrays
+        self.article_ids = article_ids
+        self.graph_id = graph_id
+        self.version = version
+        self._json = None
+
+    @classmethod
+    def from_graph(cls, graph: models.Graph) -> 'CompactGraph':
+        splits = [split for comment in graph.comments for split in comment.splits]
+        arrays = {
+            'comment_ids': np.array([comment.id for comment in graph.comments], dtype=np.int64),
+            # missing group ids are stored as NaN
+            'group_ids': np.array([np.nan if comment.grp_id is None else comment.grp_id
+                                   for comment in graph.comments], dtype=np.float64),
+            'split_counts': np.array([len(comment.splits) for comment in graph.comments], dtype=np.int32),
+            'split_bounds': np.array([(split.s, split.e) for split in splits], dtype=np.int32).reshape(len(splits), 2),
+            'split_weights': _weights_to_array([split.wgts for split in splits], SPLIT_WEIGHT_TYPES),
+            'id2idx': np.array([(int(k), v) for k, v in graph.id2idx.items()], dtype=np.int64).reshape(-1, 2),
+            **encode_edges(graph.edges)
+        }
+        return cls(arrays, article_ids=graph.article_ids, graph_id=graph.graph_id, version=graph.version)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, **kwargs) -> 'CompactGraph':
+        return cls(unpack_arrays(data), **kwargs)
+
+    def to_bytes(self) -> bytes:
+        return pack_arrays(self.arrays)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.arrays['edge_nodes'])
+
+    def to_dict(self) -> dict:
+        """
+        Returns the graph as plain python objects in the structure of models.Graph.
+        """
+        group_ids = self.arrays['group_ids']
+        group_ids = np.where(np.isnan(group_ids), None, np.nan_to_num(group_ids).astype(np.int64)).tolist()
+        bounds = self.arrays['split_bounds'].tolist()
+        weights = _array_to_weights(self.arrays['split_weights'], SPLIT_WEIGHT_TYPES)
+        offsets = np.concatenate([[0], np.cumsum(self.arrays['split_counts'])]).tolist()
+
+        comments = [{'id': comment_id,
+                     'grp_id': group_id,
+                     'splits': [{'s': s, 'e': e, 'wgts': wgts}
+                                for (s, e), wgts in zip(bounds[start:end], weights[start:end])]}
+                    for comment_id, group_id, start, end in zip(self.arrays['comment_ids'].tolist(), group_ids,
+                                                                offsets[:-1], offsets[1:])]
+        return {
+            'article_ids': self.article_ids,
+            'graph_id': self.graph_id,
+            'version': self.version,
+            'comments': comments,
+            'id2idx': {str(k): v for k, v in self.arrays['id2idx'].tolist()},
+            'edges': decode_edges(self.arrays)
+        }
+
+    def to_json(self) -> str:
+        # the graph is immutable, so the serialisation is only done once
+        if self._json is None:
+            self._json = json.dumps(self.to_dict())
+        return self._json
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Approximate memory used by the arrays and the serialisation.
+        """
+        return sum(array.nbytes for array in self.arrays.values()) + len(self._json or '')
+
+    def to_model(self) -> models.Graph:
+        return models.Graph(**self.to_dict())
+
+
+def decode_graph(data: bytes, article_ids: List[int] = None, graph_id: int = None,
+                 version: int = None) -> Optional[CompactGraph]:
+    """
+    Returns None if the graph was stored in an outdated format.
+    """
+    try:
+        return CompactGraph.from_bytes(data, article_ids=article_ids, graph_id=graph_id, version=version)
+    except GraphFormatError:
+        return None
+
+
+class StageData:
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        """
+        Output of the stages before the modifiers: the split comments (without weights) and all edges of the
+        pairwise comparisons before any filtering.
+        :param arrays: columns as written by from_parts
+        """
+        self.arrays = arrays
+
+    @classmethod
+    def from_parts(cls, comments: List[models.SplitComment], edge_chunks: List[Dict[str, np.ndarray]]) -> 'StageData':
+        """
+        :param comments: split comments in graph order
+        :param edge_chunks: encode_edges() of every chunk of generated edges, in order
+        """
+        splits = [split for comment in comments for split in comment.splits]
+        edge_chunks = edge_chunks or [encode_edges([])]
+        return cls({
+            'comment_ids': np.array([comment.id for comment in comments], dtype=np.int64),
+            'split_counts': np.array([len(comment.splits) for comment in comments], dtype=np.int32),
+            'split_bounds': np.array([(split.s, split.e) for split in splits], dtype=np.int32).reshape(len(splits), 2),
+            'edge_nodes': np.concatenate([chunk['edge_nodes'] for chunk in edge_chunks]),
+            'edge_weights': np.concatenate([chunk['edge_weights'] for chunk in edge_chunks])
+        })
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'StageData':
+        return cls(unpack_arrays(data))
+
+    def to_bytes(self) -> bytes:
+        return pack_arrays(self.arrays)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.arrays['edge_nodes'])
+
+    def matches(self, comments: List[models.CommentCached]) -> bool:
+        """
+        True if the stage was computed for exactly these comments in this order.
+        """
+        comment_ids = self.arrays['comment_ids']
+        return len(comment_ids) == len(comments) and comment_ids.tolist() == [comment.id for comment in comments]
+
+    def split_comments(self) -> List[models.SplitComment]:
+        bounds = self.arrays['split_bounds'].tolist()
+        offsets = np.concatenate([[0], np.cumsum(self.arrays['split_counts'])]).tolist()
+        return [models.SplitComment(id=comment_id,
+                                    splits=[models.Split(s=s, e=e, wgts=models.SplitWeights())
+                                            for s, e in bounds[start:end]])
+                for comment_id, start, end in zip(self.arrays['comment_ids'].tolist(), offsets[:-1], offsets[1:])]
+
+    def select(self, comment_ids: List[int]) -> 'StageData':
+        """
+        Returns the stage of a subset of the comments, e.g. of one article, with the edges between them.
+        :param comment_ids: in the order of this stage
+        """
+        rows = self.comment_rows(comment_ids)
+        local = np.full(len(self.arrays['comment_ids']), -1, dtype=np.int64)
+        local[rows] = np.arange(len(rows))
+
+        nodes = self.arrays['edge_nodes']
+        selected = (local[nodes[:, 0]] >= 0) & (local[nodes[:, 2]] >= 0)
+        nodes = nodes[selected].copy()
+        nodes[:, 0] = local[nodes[:, 0]]
+        nodes[:, 2] = local[nodes[:, 2]]
+
+        # the split rows of every selected comment, as consecutive ranges
+        offsets = np.concatenate([[0], np.cumsum(self.arrays['split_counts'], dtype=np.int64)])
+        counts = self.arrays['split_counts'][rows].astype(np.int64)
+        split_rows = np.repeat(offsets[rows] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        return StageData({
+            'comment_ids': self.arrays['comment_ids'][rows],
+            'split_counts': self.arrays['split_counts'][rows],
+            'split_bounds': self.arrays['split_bounds'][split_rows],
+            'edge_nodes': nodes,
+            'edge_weights': self.arrays['edge_weights'][selected]
+        })
+
+    def comment_rows(self, comment_ids: List[int]) -> np.ndarray:
+        """
+        Returns the rows of the comments in this stage, raises a KeyError for comments that are not part of it.
+        """
+        stage_ids = self.arrays['comment_ids']
+        comment_ids = np.asarray(comment_ids, dtype=np.int64)
+        order = np.argsort(stage_ids, kind='stable')
+        positions = np.searchsorted(stage_ids, comment_ids, sorter=order)
+        found = positions < len(stage_ids)
+        found[found] = stage_ids[order[positions[found]]] == comment_ids[found]
+        if not found.all():
+            raise KeyError(f'Comments not in the stage: {comment_ids[~found].tolist()[:10]}')
+        return order[positions]
+
+    def iter_edge_chunks(self, chunk_size: int = 10000) -> Iterator[List[models.Edge]]:
+        """
+        Yields the edges in the order they were generated, chunk by chunk.
+        """
+        for start in range(0, self.num_edges, chunk_size):
+            nodes = self.arrays['edge_nodes'][start:start + chunk_size].tolist()
+            weights = _array_to_weights(self.arrays['edge_weights'][start:start + chunk_size], EDGE_WEIGHT_TYPES)
+            # the stage was written from valid edges, so they are constructed without validation,
+            # weights that are not set count as unset like after the comparisons
+            yield [_construct(models.Edge, {'src': (node[0], node[1]), 'tgt': (node[2], node[3]),
+                                            'wgts': _construct(models.EdgeWeights, wgts,
+                                                               {k for k, v in wgts.items() if v is not None})},
+                              set(EDGE_FIELDS))
+                   for node, wgts in zip(nodes, weights)]
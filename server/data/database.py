@@ -1,29 +1,66 @@
-from sqlalchemy import create_engine, Column, ForeignKey, MetaData, Table
-from sqlalchemy.types import DateTime, Boolean, Integer, String
+from sqlalchemy import create_engine, inspect, text, Column, ForeignKey, Index, MetaData, Table
+from sqlalchemy.types import DateTime, Boolean, Integer, String, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 import databases
-from typing import List, Optional, Mapping, Union
+from starlette.concurrency import run_in_threadpool
+from typing import AsyncIterator, Dict, List, Optional, Mapping, Union, Set, Tuple
 import logging
 import json
+from collections import Counter, defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime
 
 import data.models as models
+from data.codec import CompactGraph, StageData, GraphFormatError, decode_graph, pack_edges, unpack_edges
+from data.memcache import init_or_get_graph_cache, graph_key
+from data.processors.table import UPVOTE_FIELDS, DOWNVOTE_FIELDS
+from data.storage import connect_args
 from common import config
 
 logger = logging.getLogger('data.db')
 
 DATABASE_URL = config.get('cache', 'db_url')
 
-database = databases.Database(DATABASE_URL)
+database = databases.Database(DATABASE_URL, **connect_args(DATABASE_URL))
 metadata = MetaData()
 
 engine = create_engine(DATABASE_URL,
                        connect_args={
                            # has to be set to False if sqlite is used
-                           "check_same_thread": not DATABASE_URL.startswith('sqlite')
+                           "check_same_thread": not DATABASE_URL.startswith('sqlite'),
+                           **connect_args(DATABASE_URL)
                        })
 
 Base = declarative_base(metadata=metadata)
 
+VOTE_FIELDS = UPVOTE_FIELDS + DOWNVOTE_FIELDS
+
+
+class ArticleNotFoundError(LookupError):
+    pass
+
+
+@asynccontextmanager
+async def write_transaction():
+    """
+    Transaction that takes the write lock of SQLite when it begins (BEGIN IMMEDIATE), so its reads and writes are
+    atomic also across processes. database.transaction() begins deferred: in WAL mode such a transaction can't be
+    upgraded to a write once another connection committed after its first read.
+    """
+    if not DATABASE_URL.startswith('sqlite'):
+        async with database.transaction():
+            yield
+        return
+    async with database.connection() as connection:
+        # waits up to [cache] sqlite_busy_timeout for other writers
+        await connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            await connection.execute('ROLLBACK')
+            raise
+        await connection.execute('COMMIT')
+
 
 def init_db(app):
     @app.on_event("startup")
@@ -57,12 +94,14 @@ comments_table = Table(
     metadata,
 
     Column('id', Integer, primary_key=True, index=True),
-    Column('article_id', Integer, ForeignKey('articles.id'), nullable=False),
+    Column('article_id', Integer, ForeignKey('articles.id'), nullable=False, index=True),
     Column('comment_id', String, index=True, nullable=False),
     Column('username', String),
     Column('timestamp', DateTime),
     Column('text', String),
     Column('reply_to', String, ForeignKey('comments.comment_id'), nullable=True),
+    # id of the comment with comment_id reply_to in the same article, resolved when the comments are stored
+    Column('reply_to_id', Integer, nullable=True),
 
     # Optional details from FAZ and TAZ
     Column('num_replies', Integer, nullable=True),
@@ -83,6 +122,8 @@ comments_table = Table(
 
     # Optional details from Tagesschau
     Column('title', String, nullable=True),
+
+    Index('ix_comments_article_id_comment_id', 'article_id', 'comment_id')
 )
 
 graphs_table = Table(
@@ -91,13 +132,124 @@ graphs_table = Table(
     Column('id', Integer, primary_key=True, index=True),
     # Comma separated list of article_ids (JSON array)
     Column('article_ids', String, index=True),
-    # JSON dump of models.Graph
-    Column('graph', String)
+    # canonical key of the article set (see article_key), used for lookups
+    Column('article_key', String, nullable=True),
+    # JSON dump of models.Graph, only written by older versions
+    Column('graph', String, nullable=True),
+    # models.Graph in the binary format of data.codec
+    Column('data', LargeBinary, nullable=True),
+    # hash of the effective graph config (see data.processors.graph.config_hash)
+    Column('config_hash', String, index=True, nullable=True),
+    # incremented with every incremental update, the latest version is served
+    Column('version', Integer, nullable=False, server_default='1'),
+    # unmodified comparator edges (List[models.Edge]) in the binary format of data.codec,
+    # needed for incremental updates
+    Column('raw_edges', LargeBinary, nullable=True),
+    # last time the graph was served, for the retention (see data.retention), set lazily by flush_graph_access
+    Column('last_access', DateTime, nullable=True, index=True),
+    Index('ix_graphs_article_key_config_hash_version', 'article_key', 'config_hash', 'version')
+)
+
+# articles of each graph, to find the graphs of an article without parsing graphs.article_ids
+graph_articles_table = Table(
+    'graph_articles',
+    metadata,
+    Column('graph_id', Integer, ForeignKey('graphs.id'), primary_key=True),
+    Column('article_id', Integer, primary_key=True, index=True)
+)
+
+stages_table = Table(
+    'stages',
+    metadata,
+    Column('id', Integer, primary_key=True, index=True),
+    # Comma separated list of article_ids (JSON array)
+    Column('article_ids', String, index=True),
+    # hash of the config of the stages before the modifiers (see data.processors.graph.stage_hash)
+    Column('stage_hash', String, index=True),
+    # data.codec.StageData: split comments and unfiltered edges
+    Column('data', LargeBinary),
+    Column('created', DateTime, nullable=True)
 )
 
 Base.metadata.create_all(bind=engine)
 
 
+def migrate():
+    """
+    Adds columns that were added to the tables after the database was created.
+    """
+    inspector = inspect(engine)
+    added = set()
+    for table in metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            default = f' DEFAULT {column.server_default.arg}' if column.server_default is not None else ''
+            logger.info(f'Migrating table {table.name}: adding column {column.name}')
+            with engine.begin() as connection:
+                connection.execute(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}{default}')
+            added.add((table.name, column.name))
+
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                logger.info(f'Migrating table {table.name}: adding index {index.name}')
+                index.create(bind=engine)
+
+    _migrate_graph_articles()
+    if ('comments', 'reply_to_id') in added:
+        _migrate_reply_to_ids()
+
+
+def _migrate_reply_to_ids():
+    """
+    Resolves comments.reply_to_id for comments stored before it existed.
+    """
+    logger.info('Migrating table comments: resolving reply_to_id')
+    with engine.begin() as connection:
+        connection.execute('UPDATE comments SET reply_to_id = ('
+                           '    SELECT parent.id FROM comments parent'
+                           '    WHERE parent.article_id = comments.article_id AND parent.comment_id = comments.reply_to'
+                           '    ORDER BY parent.id LIMIT 1) '
+                           'WHERE reply_to IS NOT NULL')
+
+
+def _migrate_graph_articles():
+    """
+    Fills graphs.article_key and graph_articles for graphs stored before they existed.
+    """
+    with engine.begin() as connection:
+        graphs = connection.execute('SELECT id, article_ids FROM graphs WHERE article_key IS NULL').fetchall()
+        if not graphs:
+            return
+        logger.info(f'Migrating table graphs: adding article keys of {len(graphs)} graphs')
+        for graph in graphs:
+            article_ids = json.loads(graph['article_ids'])
+            connection.execute(graphs_table.update().where(graphs_table.c.id == graph['id']),
+                               article_key=article_key(article_ids))
+            connection.execute(graph_articles_table.delete().where(graph_articles_table.c.graph_id == graph['id']))
+            connection.execute(graph_articles_table.insert(),
+                               [{'graph_id': graph['id'], 'article_id': article_id}
+                                for article_id in _article_set(article_ids)])
+
+
+def _article_set(article_ids: List[int]) -> List[int]:
+    # make it save to inject into sql query
+    return sorted({i for i in article_ids if isinstance(i, int)})
+
+
+def article_key(article_ids: List[int]) -> str:
+    """
+    Canonical key of a set of articles: the sorted, distinct article ids separated by commas.
+    """
+    return ','.join(str(i) for i in _article_set(article_ids))
+
+
+migrate()
+
+
 async def insert_article(article: models.ArticleScraped):
     last_record_id = await database.execute(articles_table.insert().values(**article.dict()))
     logger.debug(f'INSERTed article to DB with ID: {last_record_id}!')
@@ -105,21 +257,71 @@ async def insert_article(article: models.ArticleScraped):
 
 
 async def insert_comment(comment: models.CommentScraped, article_id: int) -> int:
-    last_record_id = await database.execute(
-        comments_table.insert().values(article_id=article_id, **comment.dict()))
-    return last_record_id
+    comments = await insert_comments([comment], article_id)
+    return comments[0].id
 
 
-async def insert_comments(comments: List[models.CommentScraped], article_id: int):
-    values = [{**comment.dict(), 'article_id': article_id} for comment in comments]
-    await database.execute_many(comments_table.insert(), values=values)
+async def insert_comments(comments: List[models.CommentScraped], article_id: int) -> List[models.CommentCached]:
+    """
+    Stores the comments with resolved reply_to_id in one transaction, also for already stored replies to them.
+    :return: the stored comments with their ids, in the given order
+    """
+    async with write_transaction():
+        stored = await _store_comments(comments, article_id)
     logger.debug(f'INSERTed {len(comments)} comments into DB!')
+    return stored
+
+
+async def insert_article_with_comments(article: models.ArticleScraped,
+                                       comments: List[models.CommentScraped]) -> models.ArticleCached:
+    """
+    Stores the article and its comments in one transaction.
+    """
+    async with write_transaction():
+        article_id = await insert_article(article)
+        stored = await _store_comments(comments, article_id)
+    logger.debug(f'INSERTed {len(comments)} comments into DB!')
+    return models.ArticleCached(**article.dict(), id=article_id, comments=stored)
+
+
+async def _store_comments(comments: List[models.CommentScraped], article_id: int) -> List[models.CommentCached]:
+    """
+    Inserts the comments, SQLite assigns their ids. Then resolves reply_to_id of all comments of the article that
+    don't have one yet, i.e. of the new comments and of stored replies to them. Has to run inside a write_transaction,
+    so no other connection writes until the ids are read back.
+    """
+    await database.execute_many(comments_table.insert(),
+                                values=[{**comment.dict(), 'article_id': article_id} for comment in comments])
+    # the first comment wins if comment_ids are not unique, as in the old self-join
+    await database.execute('UPDATE comments SET reply_to_id = '
+                           '(SELECT MIN(parent.id) FROM comments parent '
+                           'WHERE parent.article_id = comments.article_id AND parent.comment_id = comments.reply_to) '
+                           'WHERE article_id = :article_id AND reply_to_id IS NULL AND reply_to IS NOT NULL',
+                           {'article_id': article_id})
+    rows = await database.fetch_all('SELECT id, comment_id, reply_to_id FROM comments '
+                                    'WHERE article_id = :article_id ORDER BY id', {'article_id': article_id})
+    # ids increase with every insert, so the last rows of each comment_id are the inserted ones, in order
+    rows_by_comment_id = defaultdict(list)
+    for row in rows:
+        rows_by_comment_id[row['comment_id']].append(row)
+    counts = Counter(comment.comment_id for comment in comments)
+    seen = Counter()
+    stored = []
+    for comment in comments:
+        occurrences = rows_by_comment_id[comment.comment_id]
+        row = occurrences[len(occurrences) - counts[comment.comment_id] + seen[comment.comment_id]]
+        seen[comment.comment_id] += 1
+        stored.append(models.CommentCached(**comment.dict(), id=row['id'], article_id=article_id,
+                                           reply_to_id=row['reply_to_id']))
+    return stored
 
 
 async def get_article_id(url: str) -> int:
     logger.debug(f'Get article id for url: {url}')
     query = 'SELECT id FROM articles WHERE url = :url'
     article_id = await database.fetch_one(query, {'url': url})
+    if article_id is None:
+        raise ArticleNotFoundError(f'No article cached for {url}')
     return article_id['id']
 
 
@@ -136,6 +338,7 @@ async def delete_article(url: str = None, article_id: int = None, recursive=Fals
     if recursive:
         await delete_comments(article_id=article_id)
         await delete_edges(article_id=article_id)
+        await delete_stages(article_id=article_id)
 
     await database.execute('DELETE FROM articles '
                            'WHERE id = :article_id;',
@@ -153,21 +356,57 @@ async def delete_comments(url: str = None, article_id: int = None):
                            {'article_id': article_id})
 
 
+def _invalidate_memory_cache(article_ids: List[int] = None, config_hash: str = None,
+                             graph_ids: Set[int] = frozenset(), article_id: int = None):
+    """
+    Called before a graph is changed in the database, so it isn't served anymore, and after, so that reads that
+    started in the meantime don't put the old graph back into the cache.
+    """
+    memory_cache = init_or_get_graph_cache()
+    if memory_cache is None:
+        return
+    if article_ids is not None:
+        memory_cache.invalidate(graph_key(article_ids, config_hash))
+    else:
+        memory_cache.invalidate_where(lambda key, graph: graph.graph_id in graph_ids or article_id in key[0])
+
+
 async def delete_edges(graph_id: int = None, article_id: int = None):
     logger.debug(f'DELETE all graphs for graph.id: {graph_id}, article_id: {article_id}')
     assert graph_id or article_id
-
-    if graph_id:
-        await database.execute('DELETE FROM graphs '
-                               'WHERE id = :graph_id',
-                               {'graph_id': graph_id})
-    else:
-        await database.execute('DELETE FROM graphs '
-                               'WHERE id in ('
-                               '    SELECT graphs.id '
-                               '    FROM graphs, json_each(graphs.article_ids) as article_ids'
-                               '    WHERE article_ids.value = :article_id)',
-                               {'article_id': article_id})
+    _invalidate_memory_cache(graph_ids={graph_id}, article_id=article_id)
+
+    async with write_transaction():
+        if graph_id:
+            await database.execute('DELETE FROM graph_articles '
+                                   'WHERE graph_id = :graph_id',
+                                   {'graph_id': graph_id})
+            await database.execute('DELETE FROM graphs '
+                                   'WHERE id = :graph_id',
+                                   {'graph_id': graph_id})
+        else:
+            # the graph ids are collected first, the rows of graph_articles are deleted with them
+            graph_ids = [row['graph_id'] for row in await database.fetch_all(
+                'SELECT graph_id FROM graph_articles WHERE article_id = :article_id', {'article_id': article_id})]
+            await _delete_graph_ids(graph_ids)
+    _invalidate_memory_cache(graph_ids={graph_id}, article_id=article_id)
+
+
+async def delete_graph_ids(graph_ids: List[int]):
+    logger.debug(f'DELETE {len(graph_ids)} graphs')
+    _invalidate_memory_cache(graph_ids=set(graph_ids))
+    async with database.transaction():
+        await _delete_graph_ids(graph_ids)
+    _invalidate_memory_cache(graph_ids=set(graph_ids))
+
+
+async def _delete_graph_ids(graph_ids: List[int]):
+    if not graph_ids:
+        return
+    # make it save to inject into sql query
+    graph_ids = ','.join(str(i) for i in graph_ids if isinstance(i, int))
+    await database.execute(f'DELETE FROM graph_articles WHERE graph_id IN ({graph_ids})')
+    await database.execute(f'DELETE FROM graphs WHERE id IN ({graph_ids})')
 
 
 async def get_article(url: str = None, article_id: int = None) -> Mapping:
@@ -181,26 +420,57 @@ async def get_article(url: str = None, article_id: int = None) -> Mapping:
     return await database.fetch_one(query, {'article_id': article_id})
 
 
-async def get_comments(article_ids: Union[List[int], int]) -> List[models.CommentCached]:
+COMMENT_FIELDS = list(models.CommentCached.__fields__.keys())
+
+
+async def iter_comments(article_ids: Union[List[int], int],
+                        batch_size: int = 1000) -> AsyncIterator[List[models.CommentCached]]:
+    """
+    Streams the comments of the articles in batches, ordered by id.
+    The comments were validated when they were stored, so they are constructed without validation.
+    The connection of the current task is busy until the iteration is finished, don't query in between.
+    """
     # can be called for a single article_id, so wrap it.
     if isinstance(article_ids, int):
         article_ids = [article_ids]
 
-    # make it save to inject into sql query
-    article_ids = ','.join([str(i) for i in article_ids if isinstance(i, int)])
+    # bound as one JSON parameter, so the statement is the same for any number of articles
+    article_ids = json.dumps([i for i in article_ids if isinstance(i, int)])
+    # typed columns, so timestamps are converted by SQLAlchemy instead of pydantic
+    query = text('SELECT * FROM comments '
+                 'WHERE article_id IN (SELECT value FROM json_each(:article_ids)) '
+                 'ORDER BY id').bindparams(article_ids=article_ids).columns(*comments_table.columns)
+
+    batch = []
+    async for row in database.iterate(query):
+        batch.append(models.CommentCached.construct(**{field: row[field] for field in COMMENT_FIELDS}))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def get_stored_comment_ids(article_ids: List[int]) -> Set[int]:
+    """
+    Returns the ids (not comment_id) of the comments of the articles, without loading the comments.
+    """
+    rows = await database.fetch_all('SELECT id FROM comments '
+                                    'WHERE article_id IN (SELECT value FROM json_each(:article_ids))',
+                                    {'article_ids': json.dumps(article_ids)})
+    return {row['id'] for row in rows}
 
-    comments = await database.fetch_all('SELECT c1.*, c2.id as reply_to_id '
-                                        'FROM comments c1 '
-                                        'LEFT JOIN comments c2 ON c1.reply_to = c2.comment_id AND'
-                                        '                         c1.article_id = c2.article_id '
-                                        f'WHERE c1.article_id IN ({article_ids});')
+
+async def get_comments(article_ids: Union[List[int], int]) -> List[models.CommentCached]:
+    comments = [comment async for batch in iter_comments(article_ids) for comment in batch]
     logger.debug(f'Found {len(comments)} comments for article_ids: {article_ids}')
-    return [models.CommentCached(**comment) for comment in comments]
+    return comments
 
 
 async def get_article_with_comments(url: str = None, article_id: int = None) -> models.ArticleCached:
     article = await get_article(url, article_id)
-    assert bool(article)
+    if not article:
+        raise ArticleNotFoundError(f'No article cached for {url or article_id}')
     article = models.ArticleCached(**article)
 
     comments = await get_comments(article.id)
@@ -209,37 +479,210 @@ async def get_article_with_comments(url: str = None, article_id: int = None) ->
     return article
 
 
-async def get_graph_id(article_ids: List[int]) -> int:
-    article_ids = [i for i in sorted(article_ids) if isinstance(i, int)]
-    result = await database.fetch_one('SELECT id FROM graphs WHERE article_ids = :article_ids',
-                                      {'article_ids': json.dumps(article_ids)})
-    return result.get('id', None)
+async def get_comment_votes(article_id: int) -> Dict[str, Tuple]:
+    """
+    Returns the votes (in the order of VOTE_FIELDS) of all stored comments of the article by comment_id.
+    """
+    comments = await database.fetch_all(f'SELECT comment_id, {", ".join(VOTE_FIELDS)} FROM comments '
+                                        f'WHERE article_id = :article_id', {'article_id': article_id})
+    return {comment['comment_id']: tuple(comment[field] for field in VOTE_FIELDS) for comment in comments}
+
+
+async def update_comment_votes(comments: List[models.CommentScraped], article_id: int):
+    values = [{'article_id': article_id, 'comment_id': comment.comment_id,
+               **{field: getattr(comment, field) for field in VOTE_FIELDS}} for comment in comments]
+    async with database.transaction():
+        await database.execute_many(f'UPDATE comments SET {", ".join(f"{field} = :{field}" for field in VOTE_FIELDS)} '
+                                    f'WHERE article_id = :article_id AND comment_id = :comment_id', values)
+
+
+async def get_graph_id(article_ids: List[int], config_hash: str) -> int:
+    result = await database.fetch_one('SELECT id FROM graphs '
+                                      'WHERE article_key = :article_key AND config_hash = :config_hash '
+                                      'ORDER BY version DESC LIMIT 1',
+                                      {'article_key': article_key(article_ids), 'config_hash': config_hash})
+    return result['id'] if result else None
+
+
+async def get_graph(article_ids: List[int], config_hash: str) -> Optional[CompactGraph]:
+    result = await database.fetch_one('SELECT id, article_ids, data, version FROM graphs '
+                                      'WHERE article_key = :article_key AND config_hash = :config_hash '
+                                      'ORDER BY version DESC LIMIT 1',
+                                      {'article_key': article_key(article_ids), 'config_hash': config_hash})
+    if result and result['data']:
+        logger.debug(f'Retrieved graph id: {result["id"]} (version {result["version"]}) for {article_ids}')
+        touch_graph(result['id'])
+        return decode_graph(result['data'],
+                            article_ids=json.loads(result['article_ids']),
+                            graph_id=result['id'],
+                            version=result['version'])
+
 
+async def get_raw_edges(graph_id: int) -> Optional[List[models.Edge]]:
+    result = await database.fetch_one('SELECT raw_edges FROM graphs WHERE id = :graph_id', {'graph_id': graph_id})
+    if result and result['raw_edges']:
+        return unpack_edges(result['raw_edges'])
 
-async def get_graph(article_ids: List[int]) -> models.Graph:
+
+async def store_graph(article_ids: List[int], graph: models.Graph, config_hash: str,
+                      raw_edges: List[models.Edge] = None, version: int = 1):
+    _invalidate_memory_cache(article_ids, config_hash)
     # make it save to inject into sql query
-    article_ids = [i for i in sorted(article_ids) if isinstance(i, int)]
+    article_ids = json.dumps([i for i in sorted(article_ids) if isinstance(i, int)])
+    data = CompactGraph.from_graph(graph).to_bytes()
+    if raw_edges is not None:
+        raw_edges = pack_edges(raw_edges)
+
+    async with database.transaction():
+        last_record_id = await database.execute(graphs_table.insert().values({
+            'data': data,
+            'article_ids': article_ids,
+            'article_key': article_key(json.loads(article_ids)),
+            'config_hash': config_hash,
+            'version': version,
+            'raw_edges': raw_edges,
+            'last_access': datetime.now()
+        }))
+        await database.execute_many(graph_articles_table.insert(),
+                                    values=[{'graph_id': last_record_id, 'article_id': article_id}
+                                            for article_id in _article_set(json.loads(article_ids))])
+    _invalidate_memory_cache(json.loads(article_ids), config_hash)
+    logger.debug(f'INSERTed graph version {version} for {article_ids} to DB with ID: {last_record_id}!')
+    return last_record_id
+
 
-    result = await database.fetch_one('SELECT * FROM graphs WHERE article_ids = :article_ids',
-                                      {'article_ids': json.dumps(article_ids)})
+async def delete_graphs(article_ids: List[int], config_hash: str, below_version: int = None):
+    """
+    Deletes all cached versions of the graph for exactly these article_ids and config
+    (or only versions below below_version).
+    """
+    _invalidate_memory_cache(article_ids, config_hash)
+    logger.debug(f'DELETE graphs for {article_ids} and config {config_hash} below version {below_version}')
+    query = 'SELECT id FROM graphs WHERE article_key = :article_key AND config_hash = :config_hash'
+    values = {'article_key': article_key(article_ids), 'config_hash': config_hash}
+    if below_version is not None:
+        query += ' AND version < :version'
+        values['version'] = below_version
+    async with write_transaction():
+        await _delete_graph_ids([row['id'] for row in await database.fetch_all(query, values)])
+    _invalidate_memory_cache(article_ids, config_hash)
+
+
+async def get_stage(article_ids: List[int], stage_hash: str) -> Optional[StageData]:
+    article_ids = json.dumps([i for i in sorted(article_ids) if isinstance(i, int)])
+    result = await database.fetch_one('SELECT data FROM stages '
+                                      'WHERE article_ids = :article_ids AND stage_hash = :stage_hash',
+                                      {'article_ids': article_ids, 'stage_hash': stage_hash})
     if result:
-        graph = json.loads(result['graph'])
-        logger.debug(f'Retrieved graph id: {result["id"]} for {article_ids}')
-        return models.Graph(article_ids=json.loads(result['article_ids']),
-                            graph_id=result['id'],
-                            comments=graph['comments'],
-                            id2idx=graph['id2idx'],
-                            edges=graph['edges'])
+        try:
+            return StageData.from_bytes(result['data'])
+        except GraphFormatError:
+            return None
 
 
-async def store_graph(article_ids: List[int], graph: models.Graph):
-    # make it save to inject into sql query
+async def store_stage(article_ids: List[int], stage_hash: str, stage: StageData):
     article_ids = json.dumps([i for i in sorted(article_ids) if isinstance(i, int)])
-    graph = graph.json(exclude={'articles_id', 'graph_id'})
+    values = {'article_ids': article_ids, 'stage_hash': stage_hash}
+    async with database.transaction():
+        await database.execute('DELETE FROM stages WHERE article_ids = :article_ids AND stage_hash = :stage_hash',
+                               values)
+        await database.execute(stages_table.insert().values({**values, 'data': stage.to_bytes(),
+                                                             'created': datetime.now()}))
+    logger.debug(f'Stored stage with {stage.num_edges} edges for {article_ids}')
+
+
+async def delete_stages(article_id: int):
+    logger.debug(f'DELETE all stages for article_id: {article_id}')
+    await database.execute('DELETE FROM stages '
+                           'WHERE id in ('
+                           '    SELECT stages.id '
+                           '    FROM stages, json_each(stages.article_ids) as article_ids'
+                           '    WHERE article_ids.value = :article_id)',
+                           {'article_id': article_id})
 
-    last_record_id = await database.execute(graphs_table.insert().values({
-        'graph': graph,
-        'article_ids': article_ids
-    }))
-    logger.debug(f'INSERTed graph for {article_ids} to DB with ID: {last_record_id}!')
-    return last_record_id
+
+# ids of graphs served since the last flush_graph_access, so serving a graph doesn't write to the database
+_accessed_graphs = set()
+
+
+def touch_graph(graph_id: int):
+    """
+    Marks the graph as accessed now, written to graphs.last_access by the next flush_graph_access.
+    """
+    if graph_id is not None:
+        _accessed_graphs.add(graph_id)
+
+
+async def flush_graph_access():
+    graph_ids = list(_accessed_graphs)
+    _accessed_graphs.difference_update(graph_ids)
+    now = datetime.now()
+    if graph_ids:
+        # make it save to inject into sql query
+        graph_ids = ','.join(str(i) for i in graph_ids if isinstance(i, int))
+        await database.execute(f'UPDATE graphs SET last_access = :now WHERE id IN ({graph_ids})', {'now': now})
+    # rows from before last_access existed count as accessed now
+    await database.execute('UPDATE graphs SET last_access = :now WHERE last_access IS NULL', {'now': now})
+
+
+async def get_articles_scraped_before(timestamp: datetime) -> List[int]:
+    articles = await database.fetch_all('SELECT id FROM articles WHERE scrape_time < :timestamp',
+                                        {'timestamp': timestamp})
+    return [article['id'] for article in articles]
+
+
+async def get_graphs_accessed_before(timestamp: datetime) -> List[int]:
+    graphs = await database.fetch_all('SELECT id FROM graphs WHERE last_access < :timestamp',
+                                      {'timestamp': timestamp})
+    return [graph['id'] for graph in graphs]
+
+
+async def get_graph_sizes() -> List[Mapping]:
+    """
+    Returns id and stored size in bytes of all graphs, least recently accessed first.
+    """
+    return await database.fetch_all('SELECT id, IFNULL(LENGTH(data), 0) + IFNULL(LENGTH(graph), 0) + '
+                                    '       IFNULL(LENGTH(raw_edges), 0) AS size '
+                                    'FROM graphs ORDER BY last_access, id')
+
+
+async def get_orphaned_graphs() -> List[int]:
+    """
+    Returns the ids of graphs of which at least one article was deleted.
+    """
+    graphs = await database.fetch_all('SELECT DISTINCT graph_articles.graph_id FROM graph_articles '
+                                      'LEFT JOIN articles ON articles.id = graph_articles.article_id '
+                                      'WHERE articles.id IS NULL')
+    return [graph['graph_id'] for graph in graphs]
+
+
+async def delete_stages_created_before(timestamp: datetime):
+    await database.execute('UPDATE stages SET created = :now WHERE created IS NULL', {'now': datetime.now()})
+    await database.execute('DELETE FROM stages WHERE created < :timestamp', {'timestamp': timestamp})
+
+
+async def delete_orphaned_rows():
+    """
+    Deletes comments and stages of deleted articles.
+    """
+    await database.execute('DELETE FROM comments WHERE article_id NOT IN (SELECT id FROM articles)')
+    await database.execute('DELETE FROM stages '
+                           'WHERE id in ('
+                           '    SELECT stages.id '
+                           '    FROM stages, json_each(stages.article_ids) as article_ids'
+                           '    WHERE article_ids.value NOT IN (SELECT id FROM articles))')
+
+
+async def incremental_vacuum(pages: int):
+    """
+    Returns up to pages free pages to the file system, only has an effect with PRAGMA auto_vacuum = INCREMENTAL.
+    """
+    def vacuum():
+        # the pragma frees one page per step, executescript steps until it is done unlike execute
+        connection = engine.raw_connection()
+        try:
+            connection.executescript(f'PRAGMA incremental_vacuum({int(pages)});')
+        finally:
+            connection.close()
+
+    await run_in_threadpool(vacuum)
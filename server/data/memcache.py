@@ -0,0 +1,128 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Optional, Tuple
+
+from common import config
+
+logger = logging.getLogger('data.memcache')
+
+graph_cache = None
+prefix_cache = None
+_graph_cache_lock = threading.Lock()
+
+
+class LRUCache:
+    def __init__(self, max_bytes: int):
+        """
+        Process local least recently used cache bounded by the approximate size of its values.
+        :param max_bytes: the least recently used entries are evicted once the sizes sum up to more than this
+        """
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        # incremented by every invalidation, see put()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, size: int, generation: int = None):
+        """
+        Adds the value, values larger than the whole cache are not stored.
+        :param generation: the generation before the value was loaded, if entries were invalidated since then
+                           the value may be stale and is not stored
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._pop(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self.generation += 1
+            self._pop(key)
+
+    def invalidate_where(self, predicate: Callable[[Hashable, Any], bool]):
+        """
+        Removes all entries for which predicate(key, value) is true.
+        """
+        with self._lock:
+            self.generation += 1
+            for key in [key for key, (value, _) in self._entries.items() if predicate(key, value)]:
+                self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.,
+                'evictions': self.evictions
+            }
+
+    def _pop(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry[1]
+
+
+def graph_key(article_ids: List[int], config_hash: str) -> Tuple[Tuple[int, ...], str]:
+    return tuple(sorted(i for i in article_ids if isinstance(i, int))), config_hash
+
+
+def init_or_get_graph_cache() -> Optional[LRUCache]:
+    """
+    Returns the cache of ready to serve graphs, keyed like the graphs table: (sorted article_ids, config_hash).
+    None if disabled, i.e. [cache] memory_cache_mb is 0.
+    """
+    global graph_cache
+    if graph_cache is None and config.getint('cache', 'memory_cache_mb', fallback=0) > 0:
+        with _graph_cache_lock:
+            if graph_cache is None:
+                graph_cache = LRUCache(max_bytes=config.getint('cache', 'memory_cache_mb') * 1024 * 1024)
+                logger.debug(f'Graph cache initialised with {graph_cache.max_bytes} bytes')
+    return graph_cache
+
+
+def init_or_get_prefix_cache() -> Optional[LRUCache]:
+    """
+    Returns the cache of intermediate graph states during modification, keyed by the modifier chain prefix.
+    None if disabled, i.e. [cache] prefix_cache_mb is 0.
+    """
+    global prefix_cache
+    if prefix_cache is None and config.getint('cache', 'prefix_cache_mb', fallback=0) > 0:
+        with _graph_cache_lock:
+            if prefix_cache is None:
+                prefix_cache = LRUCache(max_bytes=config.getint('cache', 'prefix_cache_mb') * 1024 * 1024)
+                logger.debug(f'Prefix cache initialised with {prefix_cache.max_bytes} bytes')
+    return prefix_cache
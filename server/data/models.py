@@ -101,6 +101,11 @@ class EdgeWeightType(str, Enum):
     TEMPORAL = 'TEMPORAL'
 
 
+class ToxicityMode(str, Enum):
+    SEQUENCE = 'SEQUENCE'
+    LINEAR = 'LINEAR'
+
+
 class ClusteringAlgorithm(str, Enum):
     GirvanNewman = 'GirvanNewman'
     GreedyModularityCommunities = 'GreedyModularityCommunities'
@@ -109,6 +114,10 @@ class ClusteringAlgorithm(str, Enum):
 class ComparatorConfigBase(BaseModel):
     active: bool = True
 
+    class Config:
+        # request configs are read into a ConfigParser, which would store enums as e.g. "ToxicityMode.LINEAR"
+        use_enum_values = True
+
 
 class SameCommentComparatorConfig(ComparatorConfigBase):
     active: bool = True
@@ -164,6 +173,9 @@ class ToxicityRankerConfig(ComparatorConfigBase):
     active: bool = False
     window_length: int = 125
     whole_comment: bool = True
+    max_batch_memory: int = 256
+    bucket_by_length: bool = False
+    mode: ToxicityMode = ToxicityMode.SEQUENCE
 
 
 class CentralityDegreeCalculatorConfig(ComparatorConfigBase):
@@ -623,6 +635,8 @@ class Edge(BaseModel):
 class Graph(BaseModel):
     article_ids: Optional[List[int]]
     graph_id: Optional[int]
+    # incremented with every incremental update of the cached graph
+    version: Optional[int]
 
     comments: List[SplitComment]
     id2idx: dict
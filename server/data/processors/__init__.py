@@ -2,6 +2,7 @@ from abc import ABC, abstractmethod
 from common import config
 import data.models as models
 from typing import List, Union, Optional
+import numpy as np
 import logging
 
 logger = logging.getLogger('data.processor')
@@ -18,8 +19,17 @@ class GraphRepresentationType(ABC):
         self.edges: List[models.Edge] = []
         # self.nodes = []
 
+        # sentence vectors of orig_comments (one row per comment), computed on demand
+        self.embeddings: Optional[np.ndarray] = None
+        # columnar view of orig_comments (see data.processors.table), built on demand
+        self.table = None
+
 
 class Comparator(ABC):
+    # the weight of a pair only depends on the two comments, not on the other comments of the graph, so graphs of
+    # several articles can be composed from the edges within each article (see graph.GraphRepresentation)
+    composable = False
+
     def __init__(self, conf=None):
         self.conf = conf
 
@@ -47,6 +57,12 @@ class Comparator(ABC):
             return param
         return self.conf.get(self.__class__.__name__, key)
 
+    def prepare(self, graph: GraphRepresentationType):
+        """
+        Called once per graph before the pairwise comparisons, e.g. to precompute per comment features.
+        """
+        pass
+
     def update_edge_weights(self, edge_weights: models.EdgeWeights,
                             a: models.CommentCached, _a: models.SplitComment,
                             b: models.CommentCached, _b: models.SplitComment,
@@ -80,6 +96,15 @@ class Comparator(ABC):
 
 
 class Modifier(ABC):
+    # weights of node local modifiers only depend on the node itself, so incremental
+    # updates of a graph only have to run them on the new nodes
+    node_local = False
+    # edge local modifiers only remove edges based on the edge itself, so they can be applied
+    # to chunks of edges while these are generated (see filter_edges)
+    edge_local = False
+    # the graph state after expensive modifiers is kept in the prefix cache (see graph.GraphRepresentation._modify)
+    checkpoint = False
+
     def __init__(self, conf=None):
         self.conf = conf
 
@@ -113,3 +138,9 @@ class Modifier(ABC):
         Returns the modified, original, graph
         """
         raise NotImplementedError
+
+    def filter_edges(self, edges: List[models.Edge]) -> List[models.Edge]:
+        """
+        Returns the edges to keep, only implemented by edge local modifiers
+        """
+        raise NotImplementedError
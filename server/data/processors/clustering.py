@@ -59,6 +59,8 @@ class GenericSingleEdgeAdder(Modifier):
 
 
 class GenericNodeMerger(Modifier):
+    checkpoint = True
+
     def __init__(self, *args, threshold: float = None, smaller_as: bool = None, edge_weight_type: str = None, **kwargs):
         """
         Merges Nodes sharing edges with weights in filter condition
@@ -168,6 +170,8 @@ class TemporalNodeMerger(GenericNodeMerger):
 
 
 class MultiNodeMerger(Modifier):
+    checkpoint = True
+
     def __init__(self, *args, reply_to_threshold=None, same_comment_threshold=None, same_article_threshold=None,
                  similarity_threshold=None, same_group_threshold=None, temporal_threshold=None, smaller_as=None,
                  conj_or=None, **kwargs):
@@ -292,6 +296,8 @@ class MultiNodeMerger(Modifier):
 
 
 class GenericClusterer(Modifier):
+    checkpoint = True
+
     def __init__(self, *args, edge_weight_type: str = None, algorithm: str = None, **kwargs):
         """
         Clusters nodes with the specified algorithm.
@@ -379,6 +385,8 @@ class TemporalClusterer(GenericClusterer):
 
 
 class MultiEdgeTypeClusterer(Modifier):
+    checkpoint = True
+
     def __init__(self, *args, use_reply_to: bool = None, use_same_comment: bool = None, use_same_article: bool = None,
                  use_similarity: bool = None, use_same_group: bool = None, use_temporal: bool = None,
                  algorithm: str = None, **kwargs):
@@ -5,6 +5,7 @@ from data.processors import Comparator, Modifier, GraphRepresentationType
 import data.models as models
 import logging
 from common import config, init_or_get_fasttext_model
+from data.processors.scheduler import bind, run_batched
 
 FASTTEXT_PATH = config.get('TextProcessing', 'fasttext_path')
 logger = logging.getLogger('data.graph.embedding')
@@ -29,6 +30,32 @@ def vectorize_comments(model, comment_texts: List[str]) -> Dict[int, List[float]
     return vectorized_documents
 
 
+def vectorize_sentences(model, sentences: List[str]) -> np.ndarray:
+    """
+    Returns the sentence vectors of all sentences as one matrix, batched with other requests if enabled.
+    """
+    return run_batched('sentence_vectors', bind(_vectorize_batch, model), sentences)
+
+
+def _vectorize_batch(model, batch: List[str]) -> np.ndarray:
+    vectors = np.zeros((len(batch), model.get_dimension()), dtype='float32')
+    for i, sentence in enumerate(batch):
+        vectors[i] = vectorize_sentence(model, sentence)
+    return vectors
+
+
+def comment_embeddings(graph: GraphRepresentationType, model=None) -> np.ndarray:
+    """
+    Returns the sentence vectors of all comments in the graph (one row per comment index).
+    The matrix is computed once per graph and shared, e.g. between SimilarityComparator and ToxicityRanker.
+    """
+    if graph.embeddings is None:
+        if not model:
+            model = init_or_get_fasttext_model()
+        graph.embeddings = vectorize_sentences(model, [comment.text for comment in graph.orig_comments])
+    return graph.embeddings
+
+
 def cosine_similarity(model, text_a: str, text_b: str):
     if text_a is None or text_b is None:
         return 0
@@ -48,6 +75,8 @@ def cosine_similarity(model, text_a: str, text_b: str):
 
 
 class SimilarityComparator(Comparator):
+    composable = True
+
     def __init__(self, *args, max_similarity: float = None, base_weight=None, only_root: bool = None, **kwargs):
         super().__init__(*args, **kwargs)
         self.max_similarity = self.conf_getfloat('max_similarity', max_similarity)
@@ -59,12 +88,33 @@ class SimilarityComparator(Comparator):
         self.model = init_or_get_fasttext_model()
         logger.debug(f'loaded fast text model')
 
+        self.embeddings = None
+        self.norms = None
+        self.id2idx = None
+
+    def prepare(self, graph: GraphRepresentationType):
+        self.embeddings = comment_embeddings(graph, self.model)
+        self.norms = np.linalg.norm(self.embeddings, axis=1)
+        self.id2idx = graph.id2idx
+
+    def _cosine_similarity(self, i: int, j: int):
+        if i == j:
+            return 1
+        if self.norms[i] == 0 and self.norms[j] == 0:
+            return 1
+        if self.norms[i] == 0 or self.norms[j] == 0:
+            return 0
+        return np.dot(self.embeddings[i], self.embeddings[j]) / (self.norms[i] * self.norms[j])
+
     def _set_weight(self, edge: models.EdgeWeights, weight: float):
         edge.SIMILARITY = weight
 
     def compare(self, a: models.CommentCached, _a: models.SplitComment,
                 b: models.CommentCached, _b: models.SplitComment,
                 split_a, split_b) -> float:
-        weight = cosine_similarity(self.model, a.text, b.text)
+        if self.embeddings is None:
+            weight = cosine_similarity(self.model, a.text, b.text)
+        else:
+            weight = self._cosine_similarity(self.id2idx[a.id], self.id2idx[b.id])
         if weight < self.max_similarity:  #
             return ((1.0 - weight) / (1.0 - self.max_similarity)) * self.base_weight
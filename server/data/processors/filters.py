@@ -1,4 +1,7 @@
 import logging
+from typing import List
+
+import data.models as models
 from data.processors import Modifier, GraphRepresentationType
 from data.processors.ranking import build_edge_dict
 import operator
@@ -11,6 +14,8 @@ logger = logging.getLogger('data.graph.filters')
 #
 
 class GenericEdgeFilter(Modifier):
+    edge_local = True
+
     def __init__(self, *args, threshold: float = None, edge_type: str = None, smaller_as: bool = None, **kwargs):
         """
         Removes all edges of the specific type below a threshold
@@ -30,14 +35,17 @@ class GenericEdgeFilter(Modifier):
                      f'smaller_as={self.smaller_as} '
                      f'and edge_type={self.edge_type}')
 
-    def modify(self, graph: GraphRepresentationType):
+    def filter_edges(self, edges: List[models.Edge]) -> List[models.Edge]:
         if self.smaller_as:
             operator_filter = operator.le
         else:
             operator_filter = operator.ge
 
-        graph.edges = [edge for edge in graph.edges
-                       if edge.wgts[self.edge_type] and operator_filter(edge.wgts[self.edge_type], self.threshold)]
+        return [edge for edge in edges
+                if edge.wgts[self.edge_type] and operator_filter(edge.wgts[self.edge_type], self.threshold)]
+
+    def modify(self, graph: GraphRepresentationType):
+        graph.edges = self.filter_edges(graph.edges)
         return graph
 
 
@@ -72,6 +80,8 @@ class TemporalEdgeFilter(GenericEdgeFilter):
 
 
 class OrEdgeFilter(Modifier):
+    edge_local = True
+
     def __init__(self, *args, reply_to_threshold: float = None, same_comment_threshold: float = None,
                  same_article_threshold: float = None, similarity_threshold: float = None,
                  same_group_threshold: float = None, temporal_threshold: float = None, **kwargs):
@@ -105,21 +115,24 @@ class OrEdgeFilter(Modifier):
                      f'temporal_threshold={self.temporal_threshold} '
                      )
 
+    def filter_edges(self, edges: List[models.Edge]) -> List[models.Edge]:
+        return [edge for edge in edges
+                if (edge.wgts.REPLY_TO and 0 < self.reply_to_threshold < edge.wgts.REPLY_TO
+                    and edge.wgts.REPLY_TO)
+                or (edge.wgts.SAME_COMMENT and 0 < self.same_comment_threshold < edge.wgts.SAME_COMMENT
+                    and edge.wgts.SAME_COMMENT)
+                or (edge.wgts.SAME_ARTICLE and 0 < self.same_article_threshold < edge.wgts.SAME_ARTICLE
+                    and edge.wgts.SAME_ARTICLE)
+                or (edge.wgts.SIMILARITY and 0 < self.similarity_threshold < edge.wgts.SIMILARITY
+                    and edge.wgts.SIMILARITY)
+                or (edge.wgts.SAME_GROUP and 0 < self.same_group_threshold < edge.wgts.SAME_GROUP
+                    and edge.wgts.SAME_GROUP)
+                or (edge.wgts.TEMPORAL and 0 < edge.wgts.TEMPORAL < self.temporal_threshold
+                    and edge.wgts.TEMPORAL)
+                ]
+
     def modify(self, graph: GraphRepresentationType):
-        graph.edges = [edge for edge in graph.edges
-                       if (edge.wgts.REPLY_TO and 0 < self.reply_to_threshold < edge.wgts.REPLY_TO
-                           and edge.wgts.REPLY_TO)
-                       or (edge.wgts.SAME_COMMENT and 0 < self.same_comment_threshold < edge.wgts.SAME_COMMENT
-                           and edge.wgts.SAME_COMMENT)
-                       or (edge.wgts.SAME_ARTICLE and 0 < self.same_article_threshold < edge.wgts.SAME_ARTICLE
-                           and edge.wgts.SAME_ARTICLE)
-                       or (edge.wgts.SIMILARITY and 0 < self.similarity_threshold < edge.wgts.SIMILARITY
-                           and edge.wgts.SIMILARITY)
-                       or (edge.wgts.SAME_GROUP and 0 < self.same_group_threshold < edge.wgts.SAME_GROUP
-                           and edge.wgts.SAME_GROUP)
-                       or (edge.wgts.TEMPORAL and 0 < edge.wgts.TEMPORAL < self.temporal_threshold
-                           and edge.wgts.TEMPORAL)
-                       ]
+        graph.edges = self.filter_edges(graph.edges)
         return graph
 
 
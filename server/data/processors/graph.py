@@ -1,9 +1,18 @@
+import hashlib
+import heapq
+import json
+
+import numpy as np
+
 from data.processors import ranking
 from data.processors.clustering import *
+from data.processors.table import comment_table
 from data.processors.text import split_comment
 import data.models as models
-from typing import List
-from data.processors import GraphRepresentationType
+from data.codec import StageData, encode_edges
+from data.memcache import init_or_get_prefix_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from data.processors import GraphRepresentationType, Modifier
 from data.processors.structure import SameArticleComparator, SameCommentComparator, ReplyToComparator, \
     TemporalComparator
 from data.processors.embedding import SimilarityComparator
@@ -54,17 +63,147 @@ MODIFIERS = [
 
 logger = logging.getLogger('data.processors.graph')
 
+# config sections (besides the comparators and modifiers) that change the resulting graph
+GRAPH_CONFIG_SECTIONS = ['TextProcessing']
+# config that changes the output of split_comment and the pairwise comparisons
+STAGE_CONFIG_SECTIONS = [comparator.__name__ for comparator in COMPARATORS]
+STAGE_CONFIG_KEYS = {'TextProcessing': ['min_split_len', 'fasttext_path']}
+
+
+def effective_config(conf: dict = None) -> ConfigParser:
+    """
+    Returns a copy of the global config overridden by the given graph config.
+    """
+    parser = ConfigParser()
+    parser.read_dict(config)
+    if conf is not None:
+        parser.read_dict(conf)
+    return parser
+
+
+def config_hash(conf: dict = None) -> str:
+    """
+    Hash of the effective graph config, independent of the order and the notation of the values.
+    A request without conf and one that sends the defaults explicitly get the same hash.
+    """
+    parser = effective_config(conf)
+    normalized = _normalize_sections(parser, list(models.GraphConfig.__fields__.keys()))
+    for section in GRAPH_CONFIG_SECTIONS:
+        if parser.has_section(section):
+            normalized[section] = dict(parser[section])
+    return _hash(normalized)
+
+
+def stage_hash(conf: dict = None) -> str:
+    """
+    Like config_hash, but only covers the config of the stages before the modifiers (see STAGE_CONFIG_SECTIONS).
+    """
+    return _hash(_stage_config(effective_config(conf)))
+
+
+def composable(conf=None) -> bool:
+    """
+    True if graphs of several articles can be composed from the stages of the single articles.
+    """
+    parser = conf if isinstance(conf, ConfigParser) else effective_config(conf)
+    return all(comparator.composable for comparator in COMPARATORS if comparator.is_on(parser))
+
+
+def _stage_config(parser: ConfigParser) -> dict:
+    normalized = _normalize_sections(parser, STAGE_CONFIG_SECTIONS)
+    for section, keys in STAGE_CONFIG_KEYS.items():
+        normalized[section] = {key: parser.get(section, key, fallback=None) for key in keys}
+    return normalized
+
+
+def _hash(normalized) -> str:
+    return hashlib.sha1(json.dumps(normalized, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _normalize_sections(parser: ConfigParser, sections: List[str]) -> dict:
+    normalized = {}
+    for section in sections:
+        if not parser.has_section(section):
+            continue
+        field = models.GraphConfig.__fields__.get(section)
+        if field is None:
+            normalized[section] = dict(parser[section])
+            continue
+        values = {}
+        for key, value in parser[section].items():
+            key_field = field.type_.__fields__.get(key)
+            if key_field is None:
+                values[key] = value
+                continue
+            parsed, errors = key_field.validate(value, {}, loc=key)
+            # values the config model can't parse are hashed as they are
+            values[key] = value if errors else parsed
+        normalized[section] = values
+    return normalized
+
+
+CommentBatches = Iterable[List[models.CommentCached]]
+
 
 class GraphRepresentation(GraphRepresentationType):
-    def __init__(self, comments: List[models.CommentCached], conf: dict = None):
+    def __init__(self, comments: Union[List[models.CommentCached], CommentBatches], conf: dict = None,
+                 base: models.Graph = None, base_edges: List[models.Edge] = None,
+                 stage: StageData = None, record_stage: bool = False, parts: Dict[int, StageData] = None):
+        """
+        Builds the graph for the given comments.
+        If a previously built graph (base) and its unmodified comparator edges (base_edges) are given, the graph is
+        updated incrementally: only pairs involving a new comment are compared, node local modifiers only run on the
+        new comments and all other modifiers are recomputed on the whole graph.
+        :param comments: all comments of the graph (in case of an update the ones of base plus the new ones),
+                         either as list or as stream of batches ordered by id (e.g. from db.iter_comments),
+                         the batches are split while the next ones are loaded
+        :param conf: config overriding the global config
+        :param base: previously built graph of a subset of the comments, its comment order (id2idx) is kept
+        :param base_edges: raw_edges of the base graph
+        :param stage: split comments and unfiltered edges of an earlier build with the same stage_hash,
+                      if it matches the comments, splitting and the pairwise comparisons are skipped
+        :param record_stage: keep the split comments and unfiltered edges in self.stage for later builds
+        :param parts: stages of single articles (by article_id) with the same stage_hash, if no stage is given
+                      the pairs within these articles are taken from them and only the other pairs are compared,
+                      requires all active comparators to be composable
+        """
+        # split comments of a stream, None if they are split below
+        presplit = None
+        if not isinstance(comments, list):
+            comments, presplit = self._consume(comments, stage if base is None and not parts else None)
+        # number of comments taken from base, all of them come first and keep their index
+        self.num_base_comments = 0
+        if base is not None:
+            comments = self._extend_order(comments, base)
         super().__init__(comments)
 
         # create a temporary copy of the global config
-        self.conf = ConfigParser()
-        self.conf.read_dict(config)
-        if conf is not None:
-            self.conf.read_dict(conf)
-        self.comments: List[models.SplitComment] = [split_comment(comment) for comment in comments]
+        self.conf = effective_config(conf)
+        if stage is not None and (base is not None or not stage.matches(comments)):
+            logger.debug('Cached stage does not match the comments')
+            stage = None
+        if parts and stage is None and base is None:
+            parts = self._matching_parts(comments, parts)
+        else:
+            parts = None
+        self.stage: Optional[StageData] = stage
+        self._stage_chunks = [] if record_stage and stage is None and not parts else None
+        # articles of which the pairs within the article are taken from parts
+        self._known_articles = set(parts or [])
+
+        if stage is not None:
+            self.comments: List[models.SplitComment] = stage.split_comments()
+        elif parts:
+            split_comments = {comment.id: comment for part in parts.values() for comment in part.split_comments()}
+            self.comments: List[models.SplitComment] = [split_comments.get(comment.id) or split_comment(comment)
+                                                        for comment in comments]
+        elif presplit is not None:
+            self.comments: List[models.SplitComment] = presplit
+        else:
+            self.comments: List[models.SplitComment] = [split_comment(comment)
+                                                        for comment in comments[self.num_base_comments:]]
+        if base is not None:
+            self.comments = base.comments + self.comments
 
         # config: configuration from DEFAULT.ini
         # self.conf: configuration from code
@@ -77,12 +216,94 @@ class GraphRepresentation(GraphRepresentationType):
         # construct graph
         logger.info(f'Build index...')
         self._build_index()
+        if parts:
+            logger.info(f'Compose edges of {len(parts)} articles...')
+            self.stage = self._compose_stage(parts)
         logger.info(f'Calculate edges...')
         self._pairwise_comparisons()
+        if self._stage_chunks is not None:
+            self.stage = StageData.from_parts(self.comments, self._stage_chunks)
+            self._stage_chunks = None
+        if base_edges:
+            self.edges = list(heapq.merge(base_edges, self.edges, key=lambda e: (e.src, e.tgt)))
+        # comparator output (after edge local filters) before modification, allows to update the graph later on
+        self.raw_edges: List[models.Edge] = list(self.edges)
         logger.info(f'Modify graph...')
         self._modify()
         logger.info(f'Graph processing completed.')
 
+    @staticmethod
+    def _consume(batches: CommentBatches, stage: Optional[StageData]) \
+            -> Tuple[List[models.CommentCached], Optional[List[models.SplitComment]]]:
+        """
+        Collects the comments of the batches and splits them batch by batch, as long as they don't match the
+        cached stage (which already holds their splits). Without a stage the comments are only collected.
+        :return: the comments and their split comments, None if the stage matches or splitting is left to the caller
+        """
+        comments = []
+        if stage is None:
+            for batch in batches:
+                comments.extend(batch)
+            return comments, None
+
+        stage_ids = stage.arrays['comment_ids'].tolist()
+        split = []
+        matching = True
+        for batch in batches:
+            start = len(comments)
+            comments.extend(batch)
+            matching = matching and [comment.id for comment in batch] == stage_ids[start:len(comments)]
+            if not matching:
+                # from the first mismatch on, all comments (also the ones before) are split
+                split.extend(split_comment(comment) for comment in comments[len(split):])
+        if matching and len(comments) == len(stage_ids):
+            return comments, None
+        split.extend(split_comment(comment) for comment in comments[len(split):])
+        return comments, split
+
+    def _extend_order(self, comments: List[models.CommentCached], base: models.Graph) -> List[models.CommentCached]:
+        # id2idx keys are strings after a round trip through the cache
+        base_index = {int(comment_id): idx for comment_id, idx in base.id2idx.items()}
+        known = sorted((comment for comment in comments if comment.id in base_index),
+                       key=lambda comment: base_index[comment.id])
+        if len(known) != len(base.comments):
+            raise ValueError(f'Only {len(known)} of {len(base.comments)} comments of the base graph are given')
+        self.num_base_comments = len(known)
+        new = [comment for comment in comments if comment.id not in base_index]
+        logger.debug(f'Extending graph of {len(known)} comments by {len(new)} new comments')
+        return known + new
+
+    def _matching_parts(self, comments: List[models.CommentCached],
+                        parts: Dict[int, StageData]) -> Dict[int, StageData]:
+        if not composable(self.conf):
+            logger.debug('Graph cannot be composed, not all comparators are composable')
+            return {}
+        article_comments = {}
+        for comment in comments:
+            article_comments.setdefault(comment.article_id, []).append(comment)
+        return {article_id: part for article_id, part in parts.items()
+                if part is not None and part.matches(article_comments.get(article_id, []))}
+
+    def _compose_stage(self, parts: Dict[int, StageData]) -> StageData:
+        """
+        Combines the edges within the articles of parts with the comparisons of all other pairs.
+        """
+        chunks = []
+        for part in parts.values():
+            index = np.array([self.id2idx[comment_id] for comment_id in part.arrays['comment_ids'].tolist()],
+                             dtype=np.int64)
+            nodes = part.arrays['edge_nodes'].copy()
+            nodes[:, 0] = index[nodes[:, 0]]
+            nodes[:, 2] = index[nodes[:, 2]]
+            chunks.append({'edge_nodes': nodes, 'edge_weights': part.arrays['edge_weights']})
+        chunks.extend(encode_edges(chunk) for chunk in self._iter_edge_chunks())
+
+        nodes = np.concatenate([chunk['edge_nodes'] for chunk in chunks])
+        weights = np.concatenate([chunk['edge_weights'] for chunk in chunks])
+        # same order as the comparisons of a full build: by source, then target
+        order = np.lexsort((nodes[:, 3], nodes[:, 2], nodes[:, 1], nodes[:, 0]))
+        return StageData.from_parts(self.comments, [{'edge_nodes': nodes[order], 'edge_weights': weights[order]}])
+
     def __dict__(self) -> models.Graph.__dict__:
         return {
             'comments': self.comments,
@@ -95,12 +316,39 @@ class GraphRepresentation(GraphRepresentationType):
             self.id2idx[comment.id] = i
 
     def _pairwise_comparisons(self):
+        # edge local filters are applied to every chunk right away, so discarded edges are never accumulated
+        edge_filters = [modifier(conf=self.conf) for modifier in MODIFIERS
+                        if modifier.edge_local and modifier.is_on(self.conf)]
+        nr_unfiltered = 0
+        chunks = self.stage.iter_edge_chunks() if self.stage is not None else self._iter_edge_chunks()
+        for chunk in chunks:
+            nr_unfiltered += len(chunk)
+            if self._stage_chunks is not None:
+                self._stage_chunks.append(encode_edges(chunk))
+            for edge_filter in edge_filters:
+                chunk = edge_filter.filter_edges(chunk)
+            self.edges.extend(chunk)
+
+        logger.debug(f'{nr_unfiltered - len(self.edges)} of {nr_unfiltered} edges removed by {edge_filters}')
+
+    def _iter_edge_chunks(self) -> Iterator[List[models.Edge]]:
+        """
+        Yields the edges of the pairwise comparisons, one chunk per comment on the source side.
+        """
         comparators = [comparator(conf=self.conf) for comparator in COMPARATORS if comparator.is_on(self.conf)]
+        for comparator in comparators:
+            comparator.prepare(self)
         for i in (range(len(self.comments))):
             comment_i = self.comments[i]
             orig_comment_i = self.orig_comments[i]
+            # pairs within the base graph are already part of base_edges
+            targets = range(max(i, self.num_base_comments), len(self.comments))
+            # pairs within composed articles are part of their stages
+            if orig_comment_i.article_id in self._known_articles:
+                targets = [j for j in targets if self.orig_comments[j].article_id != orig_comment_i.article_id]
+            chunk = []
             for si in range(len(comment_i.splits)):
-                for j in range(i, len(self.comments)):
+                for j in targets:
                     comment_j = self.comments[j]
                     orig_comment_j = self.orig_comments[j]
                     # if comparing sentences within the same comment, skip lower triangle
@@ -112,17 +360,110 @@ class GraphRepresentation(GraphRepresentationType):
                                                            orig_comment_i, comment_i,
                                                            orig_comment_j, comment_j, si, sj)
                         if edge_weights.dict(exclude_unset=True):
-                            self.edges.append(models.Edge(src=[i, si],
-                                                          tgt=[j, sj],
-                                                          wgts=edge_weights))
+                            chunk.append(models.Edge(src=[i, si],
+                                                     tgt=[j, sj],
+                                                     wgts=edge_weights))
+            yield chunk
 
     def _modify(self):
-        modifiers = [modifier(conf=self.conf) for modifier in MODIFIERS if modifier.is_on(self.conf)]
+        # edge local modifiers were already applied while generating the edges
+        modifiers = [modifier(conf=self.conf) for modifier in MODIFIERS
+                     if not modifier.edge_local and modifier.is_on(self.conf)]
         logger.debug(modifiers)
-
         nr_unfiltered = len(self.edges)
-        for modifier in modifiers:
+
+        # states after checkpoint modifiers are shared between requests with the same modifier chain prefix,
+        # incremental updates don't go through the whole chain, so they don't take part
+        prefix_cache = init_or_get_prefix_cache() if not self.num_base_comments else None
+        prefix_keys = self._prefix_keys(modifiers) if prefix_cache is not None else []
+        start = 0
+        for k in reversed(range(len(prefix_keys))):
+            if modifiers[k].checkpoint:
+                state = prefix_cache.get(prefix_keys[k])
+                if state is not None:
+                    state.restore(self)
+                    start = k + 1
+                    logger.debug(f'Resuming modification after {modifiers[k].__class__.__name__}')
+                    break
+
+        for k in range(start, len(modifiers)):
+            modifier = modifiers[k]
             logger.debug(f'Currently {len(self.edges)} # edges. {modifier.__class__} started modification...')
-            modifier.modify(self)
+            if self.num_base_comments and modifier.node_local:
+                modifier.modify(_NewCommentsView(self))
+            else:
+                modifier.modify(self)
+            if prefix_cache is not None and modifier.checkpoint:
+                state = ModifierState.capture(self)
+                prefix_cache.put(prefix_keys[k], state, state.nbytes)
 
         logger.debug(f'{nr_unfiltered - len(self.edges)} edges removed')
+
+    def _prefix_keys(self, modifiers: List[Modifier]) -> List[str]:
+        """
+        Key of the graph state after every modifier: the hash of the state before the modifiers chained with the
+        configs of all modifiers up to this one, so requests sharing a prefix of the chain share the keys.
+        """
+        edge_filters = [modifier.__name__ for modifier in MODIFIERS if modifier.edge_local and modifier.is_on(self.conf)]
+        # votes and texts of a comment can change when an article is scraped again
+        table = comment_table(self)
+        content = hashlib.sha1(b''.join(column.tobytes() for column in (table.ids, table.timestamps,
+                                                                        *table.votes.values())))
+        for comment in self.orig_comments:
+            content.update(json.dumps(comment.text).encode('utf-8'))
+        key = _hash({'comments': content.hexdigest(),
+                     'stage': _stage_config(self.conf),
+                     'edge_filters': _normalize_sections(self.conf, edge_filters)})
+        keys = []
+        for modifier in modifiers:
+            name = modifier.__class__.__name__
+            key = _hash([key, name, _normalize_sections(self.conf, [name]).get(name)])
+            keys.append(key)
+        return keys
+
+
+class ModifierState:
+    # rough memory estimates per object for the cache budget
+    EDGE_BYTES = 600
+    SPLIT_BYTES = 400
+
+    def __init__(self, edges: List[models.Edge], split_weights: List[models.SplitWeights]):
+        """
+        Intermediate state of a graph during modification. Modifiers may change the weights of edges and splits
+        in place, so both are copied when the state is captured and again for every graph it is restored into.
+        """
+        self.edges = edges
+        self.split_weights = split_weights
+
+    @staticmethod
+    def _copy_edges(edges: List[models.Edge]) -> List[models.Edge]:
+        # src and tgt are tuples, only the weights are mutable
+        return [edge.copy(update={'wgts': edge.wgts.copy()}) for edge in edges]
+
+    @classmethod
+    def capture(cls, graph: GraphRepresentationType) -> 'ModifierState':
+        return cls(cls._copy_edges(graph.edges),
+                   [split.wgts.copy() for comment in graph.comments for split in comment.splits])
+
+    def restore(self, graph: GraphRepresentationType):
+        graph.edges = self._copy_edges(self.edges)
+        splits = (split for comment in graph.comments for split in comment.splits)
+        for split, wgts in zip(splits, self.split_weights):
+            split.wgts = wgts.copy()
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.edges) * self.EDGE_BYTES + len(self.split_weights) * self.SPLIT_BYTES
+
+
+class _NewCommentsView(GraphRepresentationType):
+    def __init__(self, graph: GraphRepresentation):
+        """
+        Restricts a graph update to the new comments, the splits are shared with the full graph.
+        The index refers to the new comments only, so it doesn't match the node indices of the edges.
+        """
+        super().__init__(graph.orig_comments[graph.num_base_comments:])
+        self.conf = graph.conf
+        self.comments = graph.comments[graph.num_base_comments:]
+        self.id2idx = {comment.id: i for i, comment in enumerate(self.orig_comments)}
+        self.edges = graph.edges
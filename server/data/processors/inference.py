@@ -0,0 +1,299 @@
+import json
+import logging
+from typing import Dict, List
+
+import numpy as np
+
+logger = logging.getLogger('data.graph.inference')
+
+# layers that are no-ops at inference time
+IDENTITY_LAYERS = {'InputLayer', 'Dropout', 'SpatialDropout1D', 'GaussianNoise', 'GaussianDropout',
+                   'AlphaDropout', 'ActivityRegularization'}
+RNN_LAYERS = {'LSTM', 'GRU', 'CuDNNLSTM', 'CuDNNGRU'}
+SUPPORTED_LAYERS = IDENTITY_LAYERS | RNN_LAYERS | {'Dense', 'Activation', 'Flatten', 'Conv1D', 'Bidirectional',
+                                                   'GlobalMaxPooling1D', 'GlobalAveragePooling1D',
+                                                   'Concatenate', 'Add', 'Average', 'Multiply'}
+
+GRAPH_KEY = '__graph__'
+
+
+def _sigmoid(x):
+    return 1. / (1. + np.exp(-x))
+
+
+def _softmax(x):
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    None: lambda x: x,
+    'sigmoid': _sigmoid,
+    'hard_sigmoid': lambda x: np.clip(0.2 * x + 0.5, 0., 1.),
+    'tanh': np.tanh,
+    'relu': lambda x: np.maximum(x, 0.),
+    'elu': lambda x: np.where(x > 0, x, np.expm1(np.minimum(x, 0.))),
+    'softplus': lambda x: np.logaddexp(0., x),
+    'softmax': _softmax
+}
+
+
+def _activation(name):
+    try:
+        return ACTIVATIONS[name]
+    except KeyError:
+        raise ValueError(f'Activation "{name}" is not supported by the NumPy backend')
+
+
+def export_keras_model(model, path: str):
+    """
+    Writes the topology and weights of a trained Keras model to an .npz file for the NumPy backend.
+    :param model: loaded keras model
+    :param path: target .npz file
+    """
+    model_config = model.get_config()
+    layers = []
+    weights = {}
+    previous = None
+    for layer_config in model_config['layers']:
+        class_name = layer_config['class_name']
+        config = layer_config['config']
+        name = config['name']
+        if class_name not in SUPPORTED_LAYERS:
+            raise ValueError(f'Layer {name} of type {class_name} is not supported by the NumPy backend')
+        if class_name == 'Bidirectional' and config['layer']['class_name'] not in RNN_LAYERS:
+            raise ValueError(f'Bidirectional wrapper around {config["layer"]["class_name"]} is not supported')
+
+        # functional models list their inputs, sequential models are a plain chain
+        if 'inbound_nodes' in layer_config:
+            inbound = [node[0] for nodes in layer_config['inbound_nodes'] for node in nodes]
+        else:
+            inbound = [previous] if previous else []
+        layers.append({'name': name, 'class_name': class_name, 'config': config, 'inbound': inbound})
+        previous = name
+
+        if class_name != 'InputLayer':
+            for i, w in enumerate(model.get_layer(name).get_weights()):
+                weights[f'{name}/{i}'] = w
+
+    if 'output_layers' in model_config:
+        outputs = model_config['output_layers']
+        # a single output might not be wrapped in a list
+        if outputs and isinstance(outputs[0], str):
+            outputs = [outputs]
+        outputs = [output[0] for output in outputs]
+    else:
+        outputs = [previous]
+
+    graph = {
+        'input_shape': list(model.input_shape),
+        'layers': layers,
+        'outputs': outputs
+    }
+    np.savez(path, **{GRAPH_KEY: np.array(json.dumps(graph))}, **weights)
+    logger.info(f'Exported {len(layers)} layers with {len(weights)} weight arrays to {path}')
+
+
+class NumpyModel:
+    def __init__(self, path: str):
+        """
+        Forward pass of an exported Keras model (see export_keras_model) implemented in NumPy.
+        Offers the subset of the Keras model interface that is used by the rankers.
+        :param path: path to the .npz file
+        """
+        with np.load(path) as data:
+            graph = json.loads(str(data[GRAPH_KEY]))
+            weights = {key: data[key].astype('float32') for key in data.files if key != GRAPH_KEY}
+
+        self.input_shape = tuple(graph['input_shape'])
+        self.layers = graph['layers']
+        self.outputs = graph['outputs']
+        self.weights: Dict[str, List[np.ndarray]] = {}
+        for layer in self.layers:
+            name = layer['name']
+            num_weights = len([key for key in weights if key.rsplit('/', 1)[0] == name])
+            self.weights[name] = [weights[f'{name}/{i}'] for i in range(num_weights)]
+        logger.debug(f'NumPy model loaded from {path} with {len(self.layers)} layers')
+
+    def predict(self, x, verbose=0, batch_size=512) -> np.ndarray:
+        x = np.asarray(x, dtype='float32')
+        batches = [self._forward(x[i:i + batch_size]) for i in range(0, len(x), batch_size)]
+        if not batches:
+            return np.zeros((0, 1), dtype='float32')
+        return np.concatenate(batches, axis=0)
+
+    def _forward(self, x: np.ndarray) -> np.ndarray:
+        tensors = {}
+        for layer in self.layers:
+            if not layer['inbound']:
+                inputs = [x]
+            else:
+                inputs = [tensors[name] for name in layer['inbound']]
+            tensors[layer['name']] = self._apply(layer, inputs)
+        return tensors[self.outputs[0]]
+
+    def _apply(self, layer: dict, inputs: List[np.ndarray]) -> np.ndarray:
+        class_name = layer['class_name']
+        config = layer['config']
+        weights = self.weights[layer['name']]
+        x = inputs[0]
+
+        if class_name in IDENTITY_LAYERS:
+            return x
+        if class_name == 'Dense':
+            y = x @ weights[0]
+            if config.get('use_bias', True):
+                y = y + weights[1]
+            return _activation(config.get('activation'))(y)
+        if class_name == 'Activation':
+            return _activation(config['activation'])(x)
+        if class_name == 'Flatten':
+            return x.reshape(len(x), -1)
+        if class_name == 'Conv1D':
+            return self._conv1d(x, config, weights)
+        if class_name == 'GlobalMaxPooling1D':
+            return x.max(axis=1)
+        if class_name == 'GlobalAveragePooling1D':
+            return x.mean(axis=1)
+        if class_name == 'Concatenate':
+            return np.concatenate(inputs, axis=config.get('axis', -1))
+        if class_name == 'Add':
+            return np.sum(inputs, axis=0)
+        if class_name == 'Average':
+            return np.mean(inputs, axis=0)
+        if class_name == 'Multiply':
+            return np.prod(inputs, axis=0)
+        if class_name in RNN_LAYERS:
+            return self._rnn(x, class_name, config, weights)
+        if class_name == 'Bidirectional':
+            return self._bidirectional(x, config, weights)
+        raise ValueError(f'Layer type {class_name} is not supported by the NumPy backend')
+
+    @staticmethod
+    def _conv1d(x, config, weights):
+        kernel = weights[0]
+        kernel_size = kernel.shape[0]
+        dilation = config.get('dilation_rate', [1])[0]
+        stride = config.get('strides', [1])[0]
+        if config.get('padding', 'valid') == 'same':
+            pad = dilation * (kernel_size - 1)
+            x = np.pad(x, ((0, 0), (pad // 2, pad - pad // 2), (0, 0)))
+        steps = x.shape[1] - dilation * (kernel_size - 1)
+        y = sum(x[:, k * dilation: k * dilation + steps] @ kernel[k] for k in range(kernel_size))[:, ::stride]
+        if config.get('use_bias', True):
+            y = y + weights[1]
+        return _activation(config.get('activation'))(y)
+
+    def _bidirectional(self, x, config, weights):
+        inner = config['layer']
+        half = len(weights) // 2
+        forward = self._rnn(x, inner['class_name'], inner['config'], weights[:half])
+        backward = self._rnn(x, inner['class_name'], dict(inner['config'], go_backwards=True), weights[half:])
+        if inner['config'].get('return_sequences'):
+            backward = backward[:, ::-1]
+        merge_mode = config.get('merge_mode', 'concat')
+        if merge_mode == 'concat':
+            return np.concatenate([forward, backward], axis=-1)
+        if merge_mode == 'sum':
+            return forward + backward
+        if merge_mode == 'ave':
+            return (forward + backward) / 2
+        if merge_mode == 'mul':
+            return forward * backward
+        raise ValueError(f'Bidirectional merge_mode "{merge_mode}" is not supported by the NumPy backend')
+
+    @staticmethod
+    def _rnn(x, class_name, config, weights):
+        kernel, recurrent_kernel = weights[0], weights[1]
+        units = recurrent_kernel.shape[0]
+        is_lstm = class_name in ('LSTM', 'CuDNNLSTM')
+        cudnn = class_name.startswith('CuDNN')
+        activation = _activation('tanh' if cudnn else config.get('activation', 'tanh'))
+        recurrent_activation = _activation('sigmoid' if cudnn else config.get('recurrent_activation', 'sigmoid'))
+
+        bias = weights[2] if len(weights) > 2 else np.zeros(kernel.shape[1], dtype='float32')
+        if cudnn and is_lstm:
+            # CuDNN keeps separate input and recurrent biases
+            bias = bias[:4 * units] + bias[4 * units:]
+        # GRUs with reset_after (default in tf.keras and CuDNN) have separate input and recurrent biases
+        reset_after = not is_lstm and (cudnn or config.get('reset_after', False))
+        if reset_after:
+            bias = bias.reshape(2, -1)
+            input_bias, recurrent_bias = bias[0], bias[1]
+        else:
+            input_bias, recurrent_bias = bias.reshape(-1), None
+
+        if config.get('go_backwards'):
+            x = x[:, ::-1]
+        projected = x @ kernel + input_bias
+        h = np.zeros((len(x), units), dtype='float32')
+        c = np.zeros((len(x), units), dtype='float32')
+        sequence = []
+        for t in range(x.shape[1]):
+            z = projected[:, t]
+            if is_lstm:
+                z = z + h @ recurrent_kernel
+                i = recurrent_activation(z[:, :units])
+                f = recurrent_activation(z[:, units:2 * units])
+                o = recurrent_activation(z[:, 3 * units:])
+                c = f * c + i * activation(z[:, 2 * units:3 * units])
+                h = o * activation(c)
+            else:
+                if reset_after:
+                    inner = h @ recurrent_kernel + recurrent_bias
+                    update = recurrent_activation(z[:, :units] + inner[:, :units])
+                    reset = recurrent_activation(z[:, units:2 * units] + inner[:, units:2 * units])
+                    candidate = activation(z[:, 2 * units:] + reset * inner[:, 2 * units:])
+                else:
+                    inner = h @ recurrent_kernel[:, :2 * units]
+                    update = recurrent_activation(z[:, :units] + inner[:, :units])
+                    reset = recurrent_activation(z[:, units:2 * units] + inner[:, units:])
+                    candidate = activation(z[:, 2 * units:] + (reset * h) @ recurrent_kernel[:, 2 * units:])
+                h = update * h + (1 - update) * candidate
+            if config.get('return_sequences'):
+                sequence.append(h)
+
+        if config.get('return_sequences'):
+            return np.stack(sequence, axis=1)
+        return h
+
+
+def max_deviation(keras_model, numpy_model: NumpyModel, x: np.ndarray) -> float:
+    """
+    Largest absolute difference between the predictions of the Keras model and its NumPy export.
+    """
+    expected = keras_model.predict(x, verbose=0, batch_size=512)
+    actual = numpy_model.predict(x, verbose=0, batch_size=512)
+    return float(np.max(np.abs(expected - actual)))
+
+
+class LinearToxicityModel:
+    def __init__(self, path: str):
+        """
+        Logistic regression (or a small MLP with one ReLU layer) over averaged fastText sentence vectors.
+        The .npz file holds `kernel` and `bias` of the output layer and optionally
+        `hidden_kernel` and `hidden_bias`, see scripts/train_toxicity_linear.py.
+        :param path: path to the .npz file
+        """
+        with np.load(path) as data:
+            self.kernel = data['kernel'].astype('float32').reshape(-1, 1)
+            self.bias = data['bias'].astype('float32').reshape(1)
+            if 'hidden_kernel' in data.files:
+                self.hidden_kernel = data['hidden_kernel'].astype('float32')
+                self.hidden_bias = data['hidden_bias'].astype('float32')
+            else:
+                self.hidden_kernel = None
+                self.hidden_bias = None
+        logger.debug(f'Linear toxicity model loaded from {path} '
+                     f'with {0 if self.hidden_kernel is None else self.hidden_kernel.shape[1]} hidden units')
+
+    def predict(self, x, verbose=0, batch_size=None) -> np.ndarray:
+        """
+        :param x: sentence vectors of shape (num_texts, n_features)
+        :return: toxicity scores of shape (num_texts, 1)
+        """
+        x = np.asarray(x, dtype='float32')
+        if self.hidden_kernel is not None:
+            x = np.maximum(x @ self.hidden_kernel + self.hidden_bias, 0.)
+        return _sigmoid(x @ self.kernel + self.bias)
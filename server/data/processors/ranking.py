@@ -1,17 +1,24 @@
 import logging
 import re
+import weakref
 from collections import defaultdict
-from typing import List, Callable, Tuple
+from typing import List, Callable, Tuple, Iterator, Iterable
 import numpy as np
 import data.models as models
-from common import init_or_get_fasttext_model, init_or_get_toxicity_model
+from common import init_or_get_fasttext_model, init_or_get_toxicity_model, init_or_get_toxicity_linear_model
 from data.processors import Modifier, GraphRepresentationType
+from data.processors.embedding import comment_embeddings, vectorize_sentences
+from data.processors.scheduler import bind, run_batched
+from data.processors.table import comment_table, set_split_weights, UPVOTE_FIELDS, DOWNVOTE_FIELDS
 from scipy import sparse
 from fast_pagerank import pagerank, pagerank_power
 
 
 logger = logging.getLogger('data.graph.ranking')
 
+# loaded toxicity model -> {(window_length, n_features): result of ToxicityRanker.ignores_padding}
+_padding_checks = weakref.WeakKeyDictionary()
+
 
 def build_edge_dict(graph):
     dic = defaultdict(list)
@@ -24,6 +31,8 @@ def build_edge_dict(graph):
 
 
 class SizeRanker(Modifier):
+    node_local = True
+
     def __init__(self, *args, **kwargs):
         """
         Returns a graph with size ranked node weights
@@ -35,12 +44,13 @@ class SizeRanker(Modifier):
         logger.debug(f'{self.__class__.__name__} initialised')
 
     def modify(self, graph: GraphRepresentationType):
-        for comment in graph.comments:
-            for split in comment.splits:
-                split.wgts.SIZE = split.e-split.s
+        table = comment_table(graph)
+        set_split_weights(graph, 'SIZE', table.split_ends - table.split_starts)
 
 
 class VotesRanker(Modifier):
+    node_local = True
+
     def __init__(self, *args, use_upvotes: bool = None, use_downvotes: bool = None, **kwargs):
         """
         Returns a graph with vote ranked node weights
@@ -57,26 +67,16 @@ class VotesRanker(Modifier):
                      f'use_downvotes={self.use_downvotes}')
 
     def modify(self, graph: GraphRepresentationType):
-        for comment in graph.comments:
-            vote_sum = 0
-            orig_comment = graph.orig_comments[graph.id2idx[comment.id]]
-            if self.use_upvotes:
-                if orig_comment.upvotes:
-                    vote_sum += orig_comment.upvotes
-                if orig_comment.leseempfehlungen:
-                    vote_sum += orig_comment.leseempfehlungen
-                if orig_comment.likes:
-                    vote_sum += orig_comment.likes
-                if orig_comment.love:
-                    vote_sum += orig_comment.love
-                if orig_comment.recommended:
-                    vote_sum += orig_comment.recommended
-            if self.use_downvotes:
-                if orig_comment.downvotes:
-                    vote_sum += orig_comment.downvotes
-
-            for split in comment.splits:
-                split.wgts.VOTES = vote_sum
+        table = comment_table(graph)
+        vote_sum = np.zeros(len(table), dtype=np.int64)
+        if self.use_upvotes:
+            for field in UPVOTE_FIELDS:
+                vote_sum += table.votes[field]
+        if self.use_downvotes:
+            for field in DOWNVOTE_FIELDS:
+                vote_sum += table.votes[field]
+
+        set_split_weights(graph, 'VOTES', table.to_splits(vote_sum))
 
 
 class RecencyRanker(Modifier):
@@ -92,20 +92,23 @@ class RecencyRanker(Modifier):
         logger.debug(f'{self.__class__.__name__} initialised')
 
     def modify(self, graph: GraphRepresentationType):
+        table = comment_table(graph)
+        if len(table) == 0:
+            return
         if self.use_yongest:
-            agr_timestamp = max([graph.orig_comments[graph.id2idx[comment.id]].timestamp for comment in graph.comments])
+            agr_timestamp = table.timestamps.max()
             comparison_factor = -1
         else:
-            agr_timestamp = min([graph.orig_comments[graph.id2idx[comment.id]].timestamp for comment in graph.comments])
+            agr_timestamp = table.timestamps.min()
             comparison_factor = 1
 
-        for comment in graph.comments:
-            orig_comment = graph.orig_comments[graph.id2idx[comment.id]]
-            for split in comment.splits:
-                split.wgts.RECENCY = comparison_factor*(orig_comment.timestamp-agr_timestamp).total_seconds()
+        seconds = (table.timestamps - agr_timestamp) / 1e6
+        set_split_weights(graph, 'RECENCY', table.to_splits(comparison_factor * seconds))
 
 
 class PageRanker(Modifier):
+    checkpoint = True
+
     def __init__(self, *args, num_iterations: int = None, d: float = None, edge_type: str = None,
                  user_power_mode: bool = None, **kwargs):
         """
@@ -187,30 +190,100 @@ class CentralityDegreeCalculator(Modifier):
                 split.wgts.DEGREE_CENTRALITY = counter_dict[(graph.id2idx[comment.id], j)]
 
 
+def _predict_toxicity(model, x: np.ndarray) -> np.ndarray:
+    return model.predict(x, verbose=0, batch_size=min(512, len(x)))
+
+
 class ToxicityRanker(Modifier):
-    def __init__(self, *args, window_length: int = None, whole_comment: bool = None, **kwargs):
+    node_local = True
+    checkpoint = True
+    # window lengths used for length bucketing, capped by window_length
+    BUCKET_WINDOWS = (8, 16, 32, 64)
+
+    def __init__(self, *args, window_length: int = None, whole_comment: bool = None, max_batch_memory: int = None,
+                 bucket_by_length: bool = None, mode: str = None, **kwargs):
         """
         Returns a graph with toxicity ranked node weights
         :param args:
         :param window_length: the window length to use when calculating toxicity
         :param whole_comment: calculate toxicity for whole comment or only split?
+        :param max_batch_memory: upper bound (in MB) for the input tensor of one inference chunk
+        :param bucket_by_length: group texts by token count and use the shortest window that fits
+                                 (only if the model accepts variable length inputs and its scores
+                                 don't depend on the zero padding)
+        :param mode: SEQUENCE uses the toxicity model on word vector sequences,
+                     LINEAR a lightweight scorer on averaged sentence vectors
         :param kwargs:
         """
         super().__init__(*args, **kwargs)
         self.window_length = self.conf_getint('window_length', window_length)
         self.whole_comment = self.conf_getboolean('whole_comment', whole_comment)
+        self.max_batch_memory = self.conf_getint('max_batch_memory', max_batch_memory)
+        self.bucket_by_length = self.conf_getboolean('bucket_by_length', bucket_by_length)
+        self.mode = models.ToxicityMode(self.conf_get('mode', mode))
         logger.debug(f'{self.__class__.__name__} initialised with '
-                     f'window_length={self.window_length} and '
-                     f'whole_comment={self.whole_comment}. '
+                     f'window_length={self.window_length}, '
+                     f'whole_comment={self.whole_comment}, '
+                     f'max_batch_memory={self.max_batch_memory}MB, '
+                     f'bucket_by_length={self.bucket_by_length} and '
+                     f'mode={self.mode}. '
                      f'Load ft model...')
         ft_model = init_or_get_fasttext_model()
         self.ft_model = ft_model
         self.n_features = ft_model.get_dimension()
         logger.debug(f'ft model loaded with {self.n_features} features. '
                      f'Load toxicity model...')
-        self.toxicity_model = init_or_get_toxicity_model()
+        if self.mode == models.ToxicityMode.LINEAR:
+            self.toxicity_model = init_or_get_toxicity_linear_model()
+        else:
+            self.toxicity_model = init_or_get_toxicity_model()
         logger.debug(f'toxicity model loaded.')
 
+        if self.mode == models.ToxicityMode.SEQUENCE and self.bucket_by_length and not self.accepts_variable_length():
+            logger.debug(f'toxicity model requires fixed input length, falling back to padded windows.')
+            self.bucket_by_length = False
+        if self.mode == models.ToxicityMode.SEQUENCE and self.bucket_by_length and not self.ignores_padding():
+            self.bucket_by_length = False
+
+    def accepts_variable_length(self) -> bool:
+        try:
+            return self.toxicity_model.input_shape[1] is None
+        except (AttributeError, IndexError, TypeError):
+            return False
+
+    def ignores_padding(self) -> bool:
+        """
+        Scores a random sample at every bucket window and padded to window_length, bucketing may only change
+        the window if the model (e.g. by masking) scores both the same. Checked once per loaded model.
+        """
+        checks = _padding_checks.setdefault(self.toxicity_model, {})
+        key = (self.window_length, self.n_features)
+        if key not in checks:
+            windows = [window for window in self.BUCKET_WINDOWS if window < self.window_length]
+            rnd = np.random.RandomState(0)
+            samples = [rnd.normal(size=(4, window, self.n_features)).astype('float32') for window in windows]
+            padded = np.zeros((4 * len(windows), self.window_length, self.n_features), dtype='float32')
+            for i, sample in enumerate(samples):
+                padded[4 * i:4 * (i + 1), :sample.shape[1]] = sample
+            checks[key] = not windows or np.allclose(np.concatenate([self.predict(sample) for sample in samples]),
+                                                     self.predict(padded), atol=1e-5)
+            if not checks[key]:
+                logger.warning(f'toxicity scores depend on the padding of the window, falling back to padded windows.')
+        return checks[key]
+
+    def chunk_size(self, window_length: int) -> int:
+        """
+        Number of texts per chunk, so that one (chunk_size, window_length, n_features) float32 tensor fits the budget.
+        """
+        bytes_per_text = window_length * self.n_features * np.dtype('float32').itemsize
+        return max(1, (self.max_batch_memory * 1024 * 1024) // bytes_per_text)
+
+    def bucket_window(self, num_tokens: int) -> int:
+        for window in self.BUCKET_WINDOWS:
+            if num_tokens <= window < self.window_length:
+                return window
+        return self.window_length
+
     def normalize(self, s):
         # transform to lowercase characters
         s = str(s)
@@ -221,67 +294,103 @@ class ToxicityRanker(Modifier):
         s = re.sub(r'([\;\:\|\n])', ' ', s)
         return s
 
-    def text_to_vector(self, text):
+    def tokenize(self, text) -> List[str]:
         """
-        Given a string, normalizes it, then splits it into words and finally converts
-        it to a sequence of word vectors.
+        Given a string, normalizes it, then splits it into words and keeps the last window_length words.
         """
-        text = self.normalize(text)
-        words = text.split()
-        window = words[-self.window_length:]
-        x = np.zeros((self.window_length, self.n_features))
-        for i, word in enumerate(window):
-            x[i, :] = self.ft_model.get_word_vector(word).astype('float32')
-        return x
+        words = self.normalize(text).split()
+        return words[-self.window_length:]
 
-    def orig_comment_to_data(self, comments: List[models.CommentCached]):
+    def text_to_vector(self, text, out=None):
         """
-        Convert a given list of original_comment to a dataset of inputs for the NN.
+        Given a string, normalizes it, then splits it into words and finally converts
+        it to a sequence of word vectors. If `out` is given, the vectors are written into it.
         """
-        x = np.zeros((len(comments), self.window_length, self.n_features), dtype='float32')
+        return self.words_to_vector(self.tokenize(text), out=out)
 
-        for i, comment in enumerate(comments):
-            x[i, :] = self.text_to_vector(comment.text)
+    def words_to_vector(self, words: List[str], out=None):
+        x = np.zeros((self.window_length, self.n_features), dtype='float32') if out is None else out
+        for i, word in enumerate(words):
+            x[i, :] = self.ft_model.get_word_vector(word)
         return x
 
-    def graph_comments_to_data(self, graph: GraphRepresentationType):
+    def iter_texts(self, graph: GraphRepresentationType) -> Iterator[Tuple[str, List[models.Split]]]:
         """
-        Convert a graph with slitted comments to a dataset of inputs for the NN.
+        Yields the texts to score together with the splits that receive the score.
         """
-        number_of_data_points = 0
-        for comment in graph.comments:
-            for _ in comment.splits:
-                number_of_data_points += 1
-
-        x = np.zeros((number_of_data_points, self.window_length, self.n_features), dtype='float32')
-
-        index = 0
         for comment in graph.comments:
-            for split in comment.splits:
-                text = graph.orig_comments[graph.id2idx[comment.id]].text[int(split.s): int(split.e)]
-                x[index, :] = self.text_to_vector(text)
-                index += 1
-        return x
-
-    def modify(self, graph: GraphRepresentationType):
-        # for orig_comments
+            orig_comment = graph.orig_comments[graph.id2idx[comment.id]]
+            # for orig_comments
+            if self.whole_comment:
+                yield orig_comment.text, comment.splits
+            # for sentences
+            else:
+                for split in comment.splits:
+                    yield orig_comment.text[int(split.s): int(split.e)], [split]
+
+    def _iter_window_batches(self, items: Iterable[Tuple[List[str], List[models.Split]]], window_length: int) \
+            -> Iterator[Tuple[np.ndarray, List[List[models.Split]]]]:
+        chunk_size = self.chunk_size(window_length)
+        buffer = np.zeros((chunk_size, window_length, self.n_features), dtype='float32')
+        targets = []
+        for words, splits in items:
+            row = len(targets)
+            buffer[row] = 0
+            self.words_to_vector(words, out=buffer[row])
+            targets.append(splits)
+            if len(targets) == chunk_size:
+                yield buffer, targets
+                targets = []
+        if targets:
+            yield buffer[:len(targets)], targets
+
+    def iter_batches(self, graph: GraphRepresentationType) -> Iterator[Tuple[np.ndarray, List[List[models.Split]]]]:
+        """
+        Yields input chunks for the NN together with the splits per row. Chunks never exceed max_batch_memory.
+        The input buffer is reused between chunks, so it has to be consumed before the next chunk is requested.
+        """
+        items = ((self.tokenize(text), splits) for text, splits in self.iter_texts(graph))
+        if not self.bucket_by_length:
+            yield from self._iter_window_batches(items, self.window_length)
+            return
+
+        buckets = defaultdict(list)
+        for words, splits in items:
+            buckets[self.bucket_window(len(words))].append((words, splits))
+        for window_length in sorted(buckets.keys()):
+            yield from self._iter_window_batches(buckets[window_length], window_length)
+
+    def modify_linear(self, graph: GraphRepresentationType):
         if self.whole_comment:
-            x = self.orig_comment_to_data(graph.orig_comments)
-            predictions = self.toxicity_model.predict(x, verbose=0, batch_size=512)
-
-            for comment_counter, comment in enumerate(graph.comments):
+            # reuses the sentence vectors of SimilarityComparator if it already ran on this graph
+            x = comment_embeddings(graph, self.ft_model)
+            predictions = run_batched('toxicity_linear', self.toxicity_model.predict, x)
+            for comment in graph.comments:
+                score = float(predictions[graph.id2idx[comment.id]][0])
                 for split in comment.splits:
-                    split.wgts.TOXICITY = predictions[comment_counter][0]
-        # for sentences
+                    split.wgts.TOXICITY = score
         else:
-            x = self.graph_comments_to_data(graph)
+            texts = list(self.iter_texts(graph))
+            x = vectorize_sentences(self.ft_model, [text for text, _ in texts])
+            predictions = run_batched('toxicity_linear', self.toxicity_model.predict, x)
+            for prediction, (_, splits) in zip(predictions, texts):
+                for split in splits:
+                    split.wgts.TOXICITY = float(prediction[0])
 
-            predictions = self.toxicity_model.predict(x, verbose=0, batch_size=512)
-
-            split_counter = 0
-            for comment in graph.comments:
-                for split in comment.splits:
-                    # use probability for not being toxic
-                    split.wgts.TOXICITY = predictions[split_counter][0]
-                    split_counter += 1
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        return _predict_toxicity(self.toxicity_model, x)
 
+    def modify(self, graph: GraphRepresentationType):
+        if self.mode == models.ToxicityMode.LINEAR:
+            self.modify_linear(graph)
+            return
+
+        for chunk_counter, (x, targets) in enumerate(self.iter_batches(graph)):
+            # the window length is part of the key, only inputs of the same shape can be batched together
+            predictions = run_batched(('toxicity', x.shape[1:]), bind(_predict_toxicity, self.toxicity_model), x)
+
+            # write back the scores as soon as the chunk is done
+            for prediction, splits in zip(predictions, targets):
+                for split in splits:
+                    split.wgts.TOXICITY = float(prediction[0])
+            logger.debug(f'Scored toxicity chunk {chunk_counter} of shape {x.shape}')
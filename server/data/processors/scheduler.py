@@ -0,0 +1,208 @@
+import logging
+import queue
+import threading
+import time
+import weakref
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future
+from typing import Callable, Hashable, List, Sequence, Union
+
+import numpy as np
+
+from common import config
+
+logger = logging.getLogger('data.graph.scheduler')
+
+# upper bounds of the batch size histogram
+BATCH_SIZE_BUCKETS = (1, 8, 64, 512, 4096)
+
+scheduler = None
+_scheduler_lock = threading.Lock()
+# model -> {fn: fn bound to the model}, see bind()
+_bound_fns = weakref.WeakKeyDictionary()
+
+Inputs = Union[np.ndarray, Sequence]
+
+
+class _WorkItem:
+    __slots__ = ('key', 'fn', 'inputs', 'rows', 'future', 'submitted')
+
+    def __init__(self, key: Hashable, fn: Callable[[Inputs], np.ndarray], inputs: Inputs, future: Future):
+        self.key = key
+        self.fn = fn
+        self.inputs = inputs
+        # taken in the submitting thread, so invalid inputs fail there and not in the worker
+        self.rows = len(inputs)
+        self.future = future
+        self.submitted = time.monotonic()
+
+
+class SchedulerMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.batches = 0
+        self.rows = 0
+        self.max_queue_depth = 0
+        self.wait_time = 0.
+        self.batch_sizes = defaultdict(int)
+
+    def observe_submit(self, queue_depth: int):
+        with self._lock:
+            self.submitted += 1
+            self.max_queue_depth = max(self.max_queue_depth, queue_depth)
+
+    def observe_batch(self, items: List[_WorkItem], rows: int):
+        now = time.monotonic()
+        bucket = next((b for b in BATCH_SIZE_BUCKETS if rows <= b), 'inf')
+        with self._lock:
+            self.batches += 1
+            self.rows += rows
+            self.wait_time += sum(now - item.submitted for item in items)
+            self.batch_sizes[bucket] += 1
+
+    def snapshot(self, queue_depth: int) -> dict:
+        with self._lock:
+            return {
+                'queue_depth': queue_depth,
+                'max_queue_depth': self.max_queue_depth,
+                'submitted': self.submitted,
+                'batches': self.batches,
+                'rows': self.rows,
+                'mean_batch_size': self.rows / self.batches if self.batches else 0.,
+                'mean_wait_ms': 1000 * self.wait_time / self.submitted if self.submitted else 0.,
+                'batch_sizes': {f'<={b}': self.batch_sizes[b] for b in BATCH_SIZE_BUCKETS + ('inf',)}
+            }
+
+
+class InferenceScheduler:
+    def __init__(self, max_batch_size: int = 512, max_wait_ms: float = 5.):
+        """
+        Coalesces model calls of concurrent graph builds into larger batches that run on one dedicated worker thread.
+        Work items with the same key and fn are concatenated along the first axis, so their inputs must be compatible.
+        :param max_batch_size: number of rows after which a batch is closed
+        :param max_wait_ms: maximal time to wait for more work after the first item of a batch arrived
+        """
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.metrics = SchedulerMetrics()
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name='inference-scheduler', daemon=True)
+        self._worker.start()
+        logger.debug(f'{self.__class__.__name__} started with '
+                     f'max_batch_size={self.max_batch_size} and max_wait_ms={max_wait_ms}')
+
+    def submit(self, key: Hashable, fn: Callable[[Inputs], np.ndarray], inputs: Inputs) -> Future:
+        """
+        Schedules fn(inputs) and returns a future for its result.
+        :param key: identifies the model (and input shape) so that only compatible work is batched together
+        :param fn: function that maps a batch of inputs to one output row per input row,
+                   only work with the same fn is batched together (see bind)
+        :param inputs: numpy array or list of inputs
+        """
+        future = Future()
+        self._queue.put(_WorkItem(key, fn, inputs, future))
+        self.metrics.observe_submit(self._queue.qsize())
+        return future
+
+    def stats(self) -> dict:
+        return self.metrics.snapshot(self._queue.qsize())
+
+    def _collect(self) -> List[_WorkItem]:
+        items = [self._queue.get()]
+        rows = items[0].rows
+        deadline = time.monotonic() + self.max_wait
+        while rows < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            items.append(item)
+            rows += item.rows
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            try:
+                groups = OrderedDict()
+                for item in items:
+                    if item.future.set_running_or_notify_cancel():
+                        groups.setdefault((item.key, item.fn), []).append(item)
+                for (key, _), group in groups.items():
+                    self._run_batch(key, group)
+            except Exception as e:
+                # the worker has to survive, otherwise the futures of later work are never resolved
+                logger.exception(f'Inference scheduler failed: {e}')
+                for item in items:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+
+    def _run_batch(self, key: Hashable, items: List[_WorkItem]):
+        rows = sum(item.rows for item in items)
+        try:
+            if len(items) == 1:
+                inputs = items[0].inputs
+            elif isinstance(items[0].inputs, np.ndarray):
+                inputs = np.concatenate([item.inputs for item in items], axis=0)
+            else:
+                inputs = [x for item in items for x in item.inputs]
+            outputs = items[0].fn(inputs)
+            if len(outputs) != rows:
+                raise ValueError(f'{len(outputs)} outputs for {rows} input rows')
+            results = []
+            offset = 0
+            for item in items:
+                results.append(outputs[offset:offset + item.rows])
+                offset += item.rows
+        except Exception as e:
+            if len(items) > 1:
+                # run the items one by one, so only the futures of the failing ones fail
+                logger.warning(f'Inference batch for {key} failed, retrying its {len(items)} items one by one: {e}')
+                for item in items:
+                    self._run_batch(key, [item])
+                return
+            logger.error(f'Inference batch for {key} failed: {e}')
+            items[0].future.set_exception(e)
+            return
+
+        self.metrics.observe_batch(items, rows)
+        for item, result in zip(items, results):
+            item.future.set_result(result)
+
+
+def init_or_get_scheduler():
+    global scheduler
+    if scheduler is None and config.getboolean('inference', 'batching', fallback=False):
+        with _scheduler_lock:
+            if scheduler is None:
+                scheduler = InferenceScheduler(max_batch_size=config.getint('inference', 'max_batch_size'),
+                                               max_wait_ms=config.getfloat('inference', 'max_wait_ms'))
+    return scheduler
+
+
+def bind(fn: Callable, model) -> Callable[[Inputs], np.ndarray]:
+    """
+    Returns the function inputs -> fn(model, inputs), the same object for every call with the same fn and model,
+    so that the calls of all users of a model are batched together.
+    """
+    fns = _bound_fns.setdefault(model, {})
+    if fn not in fns:
+        # the model is only referenced weakly, so its entry is removed with it
+        model_ref = weakref.ref(model)
+        fns[fn] = lambda inputs: fn(model_ref(), inputs)
+    return fns[fn]
+
+
+def run_batched(key: Hashable, fn: Callable[[Inputs], np.ndarray], inputs: Inputs) -> np.ndarray:
+    """
+    Runs fn(inputs) through the shared scheduler if batching is enabled, otherwise directly.
+    Blocks until the result is available.
+    """
+    batcher = init_or_get_scheduler()
+    if batcher is None:
+        return fn(inputs)
+    return batcher.submit(key, fn, inputs).result()
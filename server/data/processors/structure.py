@@ -6,6 +6,8 @@ logger = logging.getLogger('data.graph.structure')
 
 
 class SameCommentComparator(Comparator):
+    composable = True
+
     def __init__(self, *args, base_weight: float = None, only_consecutive: bool = None, **kwargs):
         """
         Returns base_weight iff split_a and split_b are part of the same comment.
@@ -32,6 +34,8 @@ class SameCommentComparator(Comparator):
 
 
 class SameArticleComparator(Comparator):
+    composable = True
+
     def __init__(self, *args, base_weight: float = None, only_root: bool = None, **kwargs):
         """
         Returns base_weight iff split_a and split_b are part of the same article.
@@ -58,6 +62,8 @@ class SameArticleComparator(Comparator):
 
 
 class ReplyToComparator(Comparator):
+    composable = True
+
     def __init__(self, *args, base_weight: float = None, only_root: bool = None, **kwargs):
         """
         Returns base_weight iff split_a or split_b are in reply-to relation
@@ -86,6 +92,8 @@ class ReplyToComparator(Comparator):
 
 
 class TemporalComparator(Comparator):
+    composable = True
+
     def __init__(self, *args, max_time=1000, base_weight: float = None, only_root: bool = None, **kwargs):
         """
         Returns distance between two split comments
@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta, timezone
+from typing import List, Iterator
+
+import numpy as np
+
+import data.models as models
+
+# optional vote fields of the different platforms, nulls count as 0
+UPVOTE_FIELDS = ('upvotes', 'leseempfehlungen', 'likes', 'love', 'recommended')
+DOWNVOTE_FIELDS = ('downvotes',)
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_UTC = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def to_microseconds(timestamp: datetime) -> int:
+    return (timestamp - (EPOCH_UTC if timestamp.tzinfo else EPOCH)) // MICROSECOND
+
+
+class CommentTable:
+    def __init__(self, comments: List[models.CommentCached], split_comments: List[models.SplitComment]):
+        """
+        Columnar view of the comments of a graph with one row per comment index.
+        Per split values can be derived through the comment -> split offsets.
+        :param comments: original comments, in any order
+        :param split_comments: split version of the comments, the rows follow their order
+        """
+        by_id = {comment.id: comment for comment in comments}
+        comments = [by_id[comment.id] for comment in split_comments]
+        n = len(comments)
+        self.ids = np.fromiter((c.id for c in comments), dtype=np.int64, count=n)
+        self.article_ids = np.fromiter((c.article_id for c in comments), dtype=np.int64, count=n)
+        self.reply_to_ids = np.fromiter((-1 if c.reply_to_id is None else c.reply_to_id for c in comments),
+                                        dtype=np.int64, count=n)
+        # microseconds since epoch
+        self.timestamps = np.fromiter((to_microseconds(c.timestamp) for c in comments), dtype=np.int64, count=n)
+        self.votes = {field: np.fromiter((getattr(c, field) or 0 for c in comments), dtype=np.int64, count=n)
+                      for field in UPVOTE_FIELDS + DOWNVOTE_FIELDS}
+
+        self.split_counts = np.fromiter((len(c.splits) for c in split_comments), dtype=np.int64, count=n)
+        # splits of comment i are split_offsets[i]:split_offsets[i + 1]
+        self.split_offsets = np.concatenate([[0], np.cumsum(self.split_counts)]).astype(np.int64)
+        num_splits = int(self.split_offsets[-1])
+        self.split_starts = np.fromiter((s.s for c in split_comments for s in c.splits), dtype=np.int64,
+                                        count=num_splits)
+        self.split_ends = np.fromiter((s.e for c in split_comments for s in c.splits), dtype=np.int64,
+                                      count=num_splits)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def num_splits(self) -> int:
+        return int(self.split_offsets[-1])
+
+    def to_splits(self, values: np.ndarray) -> np.ndarray:
+        """
+        Broadcasts one value per comment to all splits of the comment.
+        """
+        return np.repeat(values, self.split_counts)
+
+
+def comment_table(graph) -> CommentTable:
+    """
+    Returns the columnar comment table of the graph, it is built again if the comments of the graph changed.
+    """
+    ids = [comment.id for comment in graph.comments]
+    if graph.table is None or len(graph.table) != len(ids) or not np.array_equal(graph.table.ids, ids):
+        graph.table = CommentTable(graph.orig_comments, graph.comments)
+    return graph.table
+
+
+def iter_splits(graph) -> Iterator[models.Split]:
+    """
+    Yields the splits of all comments in the order of the comment table.
+    """
+    for comment in graph.comments:
+        yield from comment.splits
+
+
+def set_split_weights(graph, weight_type: str, values: np.ndarray):
+    """
+    Writes one value per split (in the order of iter_splits) to the given node weight.
+    """
+    for split, value in zip(iter_splits(graph), values.tolist()):
+        setattr(split.wgts, weight_type, value)
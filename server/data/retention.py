@@ -0,0 +1,93 @@
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+
+import data.database as db
+from common import config
+
+logger = logging.getLogger('data.retention')
+
+
+async def run_retention() -> Counter:
+    """
+    Applies the retention policy of [retention] once:
+    deletes expired articles (with their comments and graphs), graphs and stages, graphs and rows of deleted
+    articles, the least recently accessed graphs beyond the size budget and finally returns free pages to the
+    file system. TTLs and budget of 0 are disabled.
+    :return: number of deleted rows per kind
+    """
+    stats = Counter()
+    now = datetime.now()
+    await db.flush_graph_access()
+
+    article_ttl = config.getfloat('retention', 'article_ttl_days', fallback=0)
+    if article_ttl > 0:
+        for article_id in await db.get_articles_scraped_before(now - timedelta(days=article_ttl)):
+            await db.delete_article(article_id=article_id, recursive=True)
+            stats['articles'] += 1
+
+    graph_ttl = config.getfloat('retention', 'graph_ttl_days', fallback=0)
+    if graph_ttl > 0:
+        graph_ids = await db.get_graphs_accessed_before(now - timedelta(days=graph_ttl))
+        await db.delete_graph_ids(graph_ids)
+        stats['expired_graphs'] += len(graph_ids)
+
+    stage_ttl = config.getfloat('retention', 'stage_ttl_days', fallback=0)
+    if stage_ttl > 0:
+        await db.delete_stages_created_before(now - timedelta(days=stage_ttl))
+
+    graph_ids = await db.get_orphaned_graphs()
+    await db.delete_graph_ids(graph_ids)
+    stats['orphaned_graphs'] += len(graph_ids)
+    await db.delete_orphaned_rows()
+
+    budget = config.getint('retention', 'graph_budget_mb', fallback=0) * 1024 * 1024
+    if budget > 0:
+        graphs = await db.get_graph_sizes()
+        total = sum(graph['size'] for graph in graphs)
+        evicted = []
+        # least recently accessed first
+        for graph in graphs:
+            if total <= budget:
+                break
+            evicted.append(graph['id'])
+            total -= graph['size']
+        await db.delete_graph_ids(evicted)
+        stats['evicted_graphs'] += len(evicted)
+
+    vacuum_pages = config.getint('retention', 'vacuum_pages', fallback=0)
+    if vacuum_pages > 0:
+        await db.incremental_vacuum(vacuum_pages)
+
+    logger.info(f'Retention finished: {dict(stats)}')
+    return stats
+
+
+async def _retention_loop(interval: float):
+    while True:
+        try:
+            await run_retention()
+        except Exception as e:
+            logger.error(f'Retention failed: {e}')
+        await asyncio.sleep(interval)
+
+
+def init_retention(app):
+    """
+    Runs the retention periodically in the background of the app, if [retention] active.
+    """
+    task = None
+
+    @app.on_event("startup")
+    async def startup():
+        nonlocal task
+        if config.getboolean('retention', 'active', fallback=False):
+            interval = config.getfloat('retention', 'interval_minutes') * 60
+            task = asyncio.ensure_future(_retention_loop(interval))
+            logger.debug(f'Retention scheduled every {interval}s')
+
+    @app.on_event("shutdown")
+    async def shutdown():
+        if task is not None:
+            task.cancel()
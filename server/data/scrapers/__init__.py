@@ -2,10 +2,10 @@ from abc import ABC, abstractmethod
 from collections import defaultdict
 
 from bs4 import BeautifulSoup
-import requests
 from datetime import datetime
-from requests.exceptions import HTTPError
+from aiohttp import ClientResponseError
 import data.models as models
+from data.scrapers import http
 from typing import Tuple, List
 
 import logging
@@ -29,11 +29,22 @@ class UnknownStructureWarning(ScraperWarning):
     pass
 
 
+class ScraperTimeoutWarning(ScraperWarning):
+    pass
+
+
+class ScraperUnavailableWarning(ScraperWarning):
+    pass
+
+
 class Scraper(ABC):
+    # name of the site in the config and in the stats of the scraper pool
+    site: str = None
+
     @classmethod
-    def scrape(cls, url) -> Tuple[models.ArticleScraped, List[models.CommentScraped]]:
+    async def scrape(cls, url) -> Tuple[models.ArticleScraped, List[models.CommentScraped]]:
         url = cls.prepare_url(url)
-        article, comments = cls._scrape(url)
+        article, comments = await cls._scrape(url)
 
         if not comments:
             raise NoCommentsWarning(f'No Comments found at {url}!')
@@ -47,49 +58,47 @@ class Scraper(ABC):
         return article, comments
 
     @classmethod
-    def get_html(cls, url):
+    async def get_html(cls, url):
         try:
-            response = requests.get(url)
-            response.raise_for_status()
+            text = await http.get_text(url)
             logger.debug('     - Successfully loaded: ' + url)
-            return BeautifulSoup(response.text, 'lxml')
-        except HTTPError as http_err:
+            return BeautifulSoup(text, 'lxml')
+        except ClientResponseError as http_err:
             logger.debug(f'  !!! HTTP error occurred: {http_err}')
         except Exception as err:
             logger.debug(f'  !!! Other error occurred: {err}')
         return None
 
     @classmethod
-    def get_json(cls, url, params=None):
+    async def get_json(cls, url, params=None):
         try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
+            result = await http.get_json(url, params=params)
             logger.debug('     - Successfully loaded: ' + url)
-            return response.json()
-        except HTTPError as http_err:
+            return result
+        except ClientResponseError as http_err:
             logger.debug(f'  !!! HTTP error occurred: {http_err}')
         except Exception as err:
             logger.debug(f'  !!! Other error occurred: {err}')
         return None
 
     @classmethod
-    def post_json(cls, url, data, headers):
+    async def post_json(cls, url, data, headers):
         try:
-            response = requests.post(url, data=data, headers=headers)
-            response.raise_for_status()
+            result = await http.post_json(url, data=data, headers=headers)
             logger.debug('     - Successfully loaded: ' + url)
-            return response.json()
-        except HTTPError as http_err:
+            return result
+        except ClientResponseError as http_err:
             logger.debug(f'  !!! HTTP error occurred: {http_err}')
         except Exception as err:
             logger.debug(f'  !!! Other error occurred: {err}')
         return None
 
     @classmethod
-    def test_scraper(cls, test_urls):
+    async def test_scraper(cls, test_urls):
         for test_url in test_urls:
             logger.debug(f' TESTING: {test_url}')
-            cls.scrape(test_url)
+            await cls.scrape(test_url)
+        await http.close_session()
 
     @staticmethod
     def prepare_url(url):
@@ -107,7 +116,7 @@ class Scraper(ABC):
         raise NotImplementedError
 
     @classmethod
-    def _scrape(cls, url) -> Tuple[models.ArticleScraped, List[models.CommentScraped]]:
+    async def _scrape(cls, url) -> Tuple[models.ArticleScraped, List[models.CommentScraped]]:
         """
         This function will return an object in the form of
 
@@ -168,11 +177,12 @@ def prepare_url(url):
     return scraper.prepare_url(url)
 
 
-def scrape(url: str) -> Tuple[models.ArticleScraped, List[models.CommentScraped]]:
+async def scrape(url: str) -> Tuple[models.ArticleScraped, List[models.CommentScraped]]:
     scraper = get_matching_scraper(url)
-    article, comments = scraper.scrape(url)
+    article, comments = await scraper.scrape(url)
     return article, comments
 
 
 __all__ = ['Scraper', 'SCRAPERS', 'scrape', 'get_matching_scraper', 'prepare_url',
-           'NoScraperException', 'ScraperWarning', 'NoCommentsWarning', 'UnknownStructureWarning']
+           'NoScraperException', 'ScraperWarning', 'NoCommentsWarning', 'UnknownStructureWarning',
+           'ScraperTimeoutWarning', 'ScraperUnavailableWarning']
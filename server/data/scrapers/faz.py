@@ -1,3 +1,4 @@
+import asyncio
 import re
 from data.scrapers import Scraper, NoCommentsWarning, UnknownStructureWarning
 from datetime import datetime
@@ -9,6 +10,7 @@ logger = logging.getLogger('scraper')
 
 
 class FAZScraper(Scraper):
+    site = 'faz'
 
     @staticmethod
     def assert_url(url):
@@ -21,11 +23,11 @@ class FAZScraper(Scraper):
         return url
 
     @classmethod
-    def _scrape(cls, url):
+    async def _scrape(cls, url):
         query_url = f'{url}?printPagedArticle=true#pageIndex_2'
-        bs = Scraper.get_html(query_url)
+        bs = await Scraper.get_html(query_url)
         article = cls._scrape_article(bs, url)
-        comments = cls._scrape_comments(bs)
+        comments = await cls._scrape_comments(bs)
 
         return article, comments
 
@@ -57,32 +59,46 @@ class FAZScraper(Scraper):
         return article
 
     @classmethod
-    def _scrape_comments(cls, bs):
+    async def _scrape_comments(cls, bs):
         clean_url = bs.select_one('[data-customsharelink]')['data-customsharelink']
 
         page = 1
+        window = 1
         comments = []
         MAX_PAGE = 100
-        while True:
-            cbs = Scraper.get_html(
-                f'{clean_url}?ot=de.faz.ArticleCommentsElement.comments.ajax.ot&action=commentList&page={page}&onlyTopArguments=false')
-            if not cbs or len(cbs) == 0:
-                break
-
-            for comment_bs in cbs.select('li.lst-Comments_Item-level1'):
-                comment = cls._parse_comment(comment_bs.select_one('div.lst-Comments_CommentTextContainer'))
-                comments.append(comment)
-                for reply_bs in comment_bs.select('li.lst-Comments_Item-level2'):
-                    reply = cls._parse_comment(reply_bs.select_one('div.lst-Comments_CommentTextContainer'),
-                                               parent_id=comment.comment_id)
-                    comments.append(reply)
-
-            page = cbs.select_one('[data-next-page-count]')
-            if not page:
-                break
-            page = page.get('data-next-page-count', None)
-            if not page or int(page) > MAX_PAGE:
-                break
+        MAX_WINDOW = 8
+        while page:
+            # pages usually link to the following number, so the next pages are loaded at once
+            # with a window that grows for long discussions, pages beyond the last one are discarded
+            numbers = list(range(page, min(page + window, MAX_PAGE + 1)))
+            pages = await asyncio.gather(*[Scraper.get_html(
+                f'{clean_url}?ot=de.faz.ArticleCommentsElement.comments.ajax.ot&action=commentList&page={number}&onlyTopArguments=false')
+                for number in numbers])
+            window = min(2 * window, MAX_WINDOW)
+
+            for number, cbs in zip(numbers, pages):
+                if number != page:
+                    # the page links somewhere else, continue from there
+                    break
+                page = None
+                if not cbs or len(cbs) == 0:
+                    break
+
+                for comment_bs in cbs.select('li.lst-Comments_Item-level1'):
+                    comment = cls._parse_comment(comment_bs.select_one('div.lst-Comments_CommentTextContainer'))
+                    comments.append(comment)
+                    for reply_bs in comment_bs.select('li.lst-Comments_Item-level2'):
+                        reply = cls._parse_comment(reply_bs.select_one('div.lst-Comments_CommentTextContainer'),
+                                                   parent_id=comment.comment_id)
+                        comments.append(reply)
+
+                next_page = cbs.select_one('[data-next-page-count]')
+                if not next_page:
+                    break
+                next_page = next_page.get('data-next-page-count', None)
+                if not next_page or int(next_page) > MAX_PAGE:
+                    break
+                page = int(next_page)
 
         return comments
 
@@ -109,7 +125,7 @@ class FAZScraper(Scraper):
 
 
 if __name__ == '__main__':
-    FAZScraper.test_scraper(
+    asyncio.run(FAZScraper.test_scraper(
         [
             'https://www.faz.net/aktuell/politik/trumps-praesidentschaft/coronavirus-donald-trump-verhaengt-nationalen-notstand-in-usa-16678564.html#lesermeinungen',
             'https://www.faz.net/aktuell/gesellschaft/menschen/rapper-fler-im-interview-ueber-bushido-und-arafat-abou-chaker-16518885.html',
@@ -117,4 +133,4 @@ if __name__ == '__main__':
             'https://www.faz.net/aktuell/feuilleton/medien/tv-kritik-maischberger-mit-stefan-aust-und-dirk-rossmann-16472805.html',
             'https://www.faz.net/aktuell/rhein-main/drei-mutmassliche-is-anhaenger-in-offenbach-festgenommen-16481443.html',
             'https://www.faz.net/aktuell/politik/inland/bauernproteste-agrarwende-hat-harte-fronten-geschaffen-16505290.html'
-        ][:])
+        ][:]))
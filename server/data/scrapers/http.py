@@ -0,0 +1,172 @@
+import asyncio
+import contextvars
+import json
+import logging
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from common import config
+from data.scrapers.http_cache import CachedResponse, init_or_get_http_cache
+
+logger = logging.getLogger('scraper')
+
+# sessions (and their connection pools) are bound to the event loop they were created in,
+# so http_pool_size and http_pool_size_per_host apply per scraper worker
+_sessions = weakref.WeakKeyDictionary()
+# host -> limit of the requests in flight to that host, shared by the loops of all scraper workers
+_host_limits = {}
+_host_limits_lock = threading.Lock()
+# set by the scraper pool for each job, collects the site errors of its requests (also of the pages a scraper skips)
+site_errors = contextvars.ContextVar('site_errors', default=None)
+
+
+def _create_session() -> aiohttp.ClientSession:
+    compression = config.getboolean('scrapers', 'http_compression', fallback=True)
+    connector = aiohttp.TCPConnector(
+        limit=config.getint('scrapers', 'http_pool_size', fallback=100),
+        limit_per_host=config.getint('scrapers', 'http_pool_size_per_host', fallback=8),
+        # idle connections are kept open for the next page of the same host
+        keepalive_timeout=config.getfloat('scrapers', 'http_keepalive_seconds', fallback=30),
+        ttl_dns_cache=300
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=config.getfloat('scrapers', 'http_timeout_seconds', fallback=30),
+        sock_connect=config.getfloat('scrapers', 'http_connect_timeout_seconds', fallback=10)
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=timeout, raise_for_status=True,
+                                 auto_decompress=compression,
+                                 # aiohttp asks for gzip and deflate by default
+                                 headers=None if compression else {'Accept-Encoding': 'identity'})
+
+
+def get_session() -> aiohttp.ClientSession:
+    """
+    Returns the session of the running event loop, creates it on first use.
+    """
+    loop = asyncio.get_event_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        session = _sessions[loop] = _create_session()
+    return session
+
+
+class HostLimit:
+    def __init__(self, limit: int):
+        """
+        Async context manager around a semaphore that is shared between threads. If the limit is reached,
+        the acquire blocks in the limit's own thread, so neither the event loop nor a thread of its executor waits.
+        The single thread also hands out the freed slots in the order the requests waited for them.
+        """
+        self._semaphore = threading.BoundedSemaphore(limit)
+        self._waiter = ThreadPoolExecutor(max_workers=1, thread_name_prefix='host-limit')
+
+    async def __aenter__(self):
+        if self._semaphore.acquire(blocking=False):
+            return
+        acquired = self._waiter.submit(self._semaphore.acquire)
+        try:
+            await asyncio.wrap_future(acquired)
+        except asyncio.CancelledError:
+            # a waiting acquire can't be interrupted, the slot is given back once it got one
+            if not acquired.cancel():
+                acquired.add_done_callback(lambda _: self._semaphore.release())
+            raise
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._semaphore.release()
+
+
+def host_limit(url: str) -> HostLimit:
+    """
+    Returns the limit for the host of the url, scrapers may start many requests at once
+    but each site only gets [scrapers] http_requests_per_host of them at the same time, over all workers.
+    """
+    host = urlsplit(url).hostname
+    with _host_limits_lock:
+        if host not in _host_limits:
+            _host_limits[host] = HostLimit(config.getint('scrapers', 'http_requests_per_host', fallback=4))
+        return _host_limits[host]
+
+
+async def close_session():
+    session = _sessions.pop(asyncio.get_event_loop(), None)
+    if session is not None:
+        await session.close()
+
+
+class ReplayMiss(aiohttp.ClientError):
+    pass
+
+
+def is_site_error(e: BaseException) -> bool:
+    """
+    Whether the error is one of the site rather than of the requested page: transport errors, timeouts and 5xx.
+    """
+    if isinstance(e, aiohttp.ClientResponseError):
+        return e.status >= 500
+    return isinstance(e, (aiohttp.ClientError, asyncio.TimeoutError)) and not isinstance(e, ReplayMiss)
+
+
+async def _request(method: str, url: str, params: dict = None, data=None, headers: dict = None) -> CachedResponse:
+    """
+    Sends the request, through the HTTP cache if it is enabled: GET requests of cached responses are sent
+    conditionally and answered from the cache on 304, in replay mode all requests are answered from the cache.
+    """
+    cache = init_or_get_http_cache()
+    # the cache reads and writes files, which must not block the event loop
+    loop = asyncio.get_event_loop()
+    key = entry = None
+    if cache is not None:
+        key = cache.key(method, url, params, data)
+        entry = await loop.run_in_executor(None, cache.get, key)
+        if cache.replay:
+            if entry is None:
+                raise ReplayMiss(f'No recorded response for {method} {url}')
+            await loop.run_in_executor(None, cache.hit, key)
+            return entry
+
+    headers = dict(headers or {})
+    if entry is not None and method == 'GET':
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+
+    try:
+        async with host_limit(url), get_session().request(method, url, params=params, data=data,
+                                                          headers=headers) as response:
+            if response.status == 304 and entry is not None:
+                await loop.run_in_executor(None, cache.hit, key, True)
+                return entry
+            body = await response.read()
+            result = CachedResponse(url=url, body=body, encoding=response.get_encoding(),
+                                    etag=response.headers.get('ETag'),
+                                    last_modified=response.headers.get('Last-Modified'))
+    except Exception as e:
+        errors = site_errors.get()
+        if errors is not None and is_site_error(e):
+            errors.append(e)
+        raise
+    if cache is not None:
+        await loop.run_in_executor(None, cache.put, key, result)
+    return result
+
+
+async def get_text(url: str, params: dict = None) -> str:
+    response = await _request('GET', url, params=params)
+    return response.body.decode(response.encoding, errors='replace')
+
+
+async def get_json(url: str, params: dict = None):
+    response = await _request('GET', url, params=params)
+    # some APIs don't send application/json
+    return json.loads(response.body.decode(response.encoding))
+
+
+async def post_json(url: str, data, headers: dict = None):
+    response = await _request('POST', url, data=data, headers=headers)
+    return json.loads(response.body.decode(response.encoding))
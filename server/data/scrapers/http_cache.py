@@ -0,0 +1,137 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from common import config
+
+logger = logging.getLogger('scraper')
+
+http_cache = None
+_http_cache_lock = threading.Lock()
+
+
+class CachedResponse(NamedTuple):
+    url: str
+    body: bytes
+    encoding: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+
+class HTTPCache:
+    def __init__(self, directory: str, max_bytes: int = 0, replay: bool = False):
+        """
+        On-disk store of response bodies with their validators (ETag, Last-Modified), one file per response.
+        Shared by all scraper workers, the least recently used responses are evicted beyond max_bytes.
+        :param directory: folder of the cache files, entries of earlier runs are reused
+        :param max_bytes: size bound of all stored files, 0 is unbounded
+        :param replay: only answer from the cache and never touch the network, e.g. for tests
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.replay = replay
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+        # key -> file size, least recently used first
+        self._sizes = OrderedDict()
+        self._bytes = 0
+
+        os.makedirs(directory, exist_ok=True)
+        entries = [entry for entry in os.scandir(directory) if entry.name.endswith('.http')]
+        for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+            self._sizes[entry.name[:-5]] = entry.stat().st_size
+            self._bytes += entry.stat().st_size
+        logger.debug(f'{self.__class__.__name__} {"replaying" if replay else "using"} {len(self._sizes)} '
+                     f'responses ({self._bytes / 1024 / 1024:.1f}MB) in {directory}')
+
+    @staticmethod
+    def key(method: str, url: str, params: dict = None, data=None) -> str:
+        request = [method, url, sorted((str(k), str(v)) for k, v in (params or {}).items()), data]
+        return hashlib.sha1(json.dumps(request).encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            if key not in self._sizes:
+                self.misses += 1
+                return None
+            try:
+                with open(self._path(key), 'rb') as f:
+                    meta = json.loads(f.readline())
+                    body = f.read()
+            except (OSError, ValueError) as e:
+                logger.warning(f'Dropping unreadable HTTP cache entry {key}: {e}')
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._sizes.move_to_end(key)
+            return CachedResponse(body=body, **meta)
+
+    def hit(self, key: str, revalidated: bool = False):
+        """
+        Marks the entry as used, revalidated if the server answered 304.
+        """
+        with self._lock:
+            if revalidated:
+                self.revalidated += 1
+            else:
+                self.hits += 1
+            if key in self._sizes:
+                os.utime(self._path(key))
+
+    def put(self, key: str, response: CachedResponse):
+        meta = json.dumps({field: getattr(response, field) for field in ('url', 'encoding', 'etag', 'last_modified')})
+        data = meta.encode('utf-8') + b'\n' + response.body
+        with self._lock:
+            tmp_path = f'{self._path(key)}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+            self._bytes += len(data) - self._sizes.pop(key, 0)
+            self._sizes[key] = len(data)
+            while self.max_bytes and self._bytes > self.max_bytes and len(self._sizes) > 1:
+                self._remove(next(iter(self._sizes)))
+                self.evicted += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'replay': self.replay,
+                'entries': len(self._sizes),
+                'size_mb': self._bytes / 1024 / 1024,
+                'hits': self.hits,
+                'revalidated': self.revalidated,
+                'misses': self.misses,
+                'evicted': self.evicted
+            }
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.http')
+
+    def _remove(self, key: str):
+        self._bytes -= self._sizes.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+def init_or_get_http_cache():
+    """
+    Returns the shared cache according to [scrapers] http_cache (no, yes or replay), None if disabled.
+    """
+    global http_cache
+    mode = config.get('scrapers', 'http_cache', fallback='no').lower()
+    if http_cache is None and mode not in ('no', 'off', 'false', '0'):
+        with _http_cache_lock:
+            if http_cache is None:
+                http_cache = HTTPCache(config.get('scrapers', 'http_cache_dir', fallback='./http_cache'),
+                                       max_bytes=config.getint('scrapers', 'http_cache_mb', fallback=512) * 1024 * 1024,
+                                       replay=mode == 'replay')
+    return http_cache
@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, List, Tuple
+
+import data.models as models
+from common import config
+from data.scrapers import Scraper, get_matching_scraper, http, NoCommentsWarning, ScraperTimeoutWarning, \
+    ScraperUnavailableWarning
+
+logger = logging.getLogger('scraper')
+
+scraper_pool = None
+_scraper_pool_lock = threading.Lock()
+
+
+class CircuitBreaker:
+    def __init__(self, max_failures: int = 5, reset_seconds: float = 300.):
+        """
+        Stops sending jobs to a site after max_failures consecutive failures. After reset_seconds one job is let
+        through to test the site again, it closes the breaker on success and opens it again on failure.
+        """
+        self.max_failures = max_failures
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if self._trial else 'open'
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if not self._trial and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self._trial = True
+            return True
+        return False
+
+    def record(self, success: bool):
+        self._trial = False
+        if success:
+            self.failures = 0
+            self.opened_at = None
+            return
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.max_failures:
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """
+        The job was cancelled, neither success nor failure.
+        """
+        self._trial = False
+
+
+class _Worker:
+    def __init__(self, name: str):
+        """
+        Thread with its own event loop, so it has its own HTTP session and parsing pages doesn't block the API.
+        """
+        self.in_flight = 0
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, coro) -> asyncio.Future:
+        # cancelling the returned future also cancels the job in the worker loop
+        return asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.loop))
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+        tasks = asyncio.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.run_until_complete(http.close_session())
+        self.loop.close()
+
+
+class ScraperPool:
+    def __init__(self, workers: int = 2, max_failures: int = 5, reset_seconds: float = 300.):
+        """
+        Runs scrape jobs on worker threads with a wall-clock timeout per scraper and a circuit breaker per site.
+        :param workers: number of worker threads, with 0 jobs run on the loop of the caller
+        :param max_failures: consecutive failures after which a site is not scraped anymore
+        :param reset_seconds: time after which a failing site is tried again
+        """
+        self.max_failures = max_failures
+        self.reset_seconds = reset_seconds
+        self.jobs = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._workers = [_Worker(f'scraper-{i}') for i in range(workers)]
+        logger.debug(f'{self.__class__.__name__} started with {workers} workers')
+
+    async def scrape(self, url: str) -> Tuple[models.ArticleScraped, List[models.CommentScraped]]:
+        scraper = get_matching_scraper(url)
+        breaker = self._breaker(scraper)
+        if not breaker.allow():
+            self.rejected += 1
+            raise ScraperUnavailableWarning(f'Scraping {scraper.site} is paused after {breaker.failures} '
+                                            f'failures in a row, retry later')
+
+        timeout = self.timeout(scraper)
+        self.jobs += 1
+        # scrapers skip pages that failed to load, so the site errors of all requests of the job are collected
+        errors = []
+        try:
+            result = await asyncio.wait_for(self._run(scraper, url, errors), timeout)
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            breaker.record(False)
+            raise ScraperTimeoutWarning(f'Scraping {url} took longer than {timeout}s')
+        except Exception as e:
+            if http.is_site_error(e) or errors:
+                breaker.record(False)
+            elif isinstance(e, NoCommentsWarning):
+                # the site works, the article just has no comments
+                breaker.record(True)
+            else:
+                # e.g. a 404 or an unknown layout, a problem of this article and not of the site
+                breaker.release()
+            raise
+        breaker.record(True)
+        return result
+
+    @staticmethod
+    def timeout(scraper) -> float:
+        default = config.getfloat('scrapers', 'scrape_timeout_seconds', fallback=120)
+        return config.getfloat('scrapers', f'{scraper.site}_scrape_timeout_seconds', fallback=default)
+
+    def stats(self) -> dict:
+        return {
+            'workers': len(self._workers),
+            'in_flight': sum(worker.in_flight for worker in self._workers),
+            'jobs': self.jobs,
+            'timeouts': self.timeouts,
+            'rejected': self.rejected,
+            'breakers': {site: {'state': breaker.state, 'failures': breaker.failures}
+                         for site, breaker in self._breakers.items()}
+        }
+
+    def shutdown(self):
+        for worker in self._workers:
+            worker.stop()
+
+    def _breaker(self, scraper) -> CircuitBreaker:
+        if scraper.site not in self._breakers:
+            self._breakers[scraper.site] = CircuitBreaker(self.max_failures, self.reset_seconds)
+        return self._breakers[scraper.site]
+
+    async def _run(self, scraper: Scraper, url: str, errors: list):
+        if not self._workers:
+            return await self._job(scraper, url, errors)
+        worker = min(self._workers, key=lambda w: w.in_flight)
+        worker.in_flight += 1
+        try:
+            return await worker.submit(self._job(scraper, url, errors))
+        finally:
+            worker.in_flight -= 1
+
+    @staticmethod
+    async def _job(scraper: Scraper, url: str, errors: list):
+        # the tasks started by the scraper inherit the context and thus the list
+        token = http.site_errors.set(errors)
+        try:
+            return await scraper.scrape(url)
+        finally:
+            http.site_errors.reset(token)
+
+
+def init_or_get_scraper_pool() -> ScraperPool:
+    global scraper_pool
+    if scraper_pool is None:
+        with _scraper_pool_lock:
+            if scraper_pool is None:
+                scraper_pool = ScraperPool(workers=config.getint('scrapers', 'workers', fallback=2),
+                                           max_failures=config.getint('scrapers', 'breaker_failures', fallback=5),
+                                           reset_seconds=config.getfloat('scrapers', 'breaker_reset_seconds',
+                                                                         fallback=300))
+    return scraper_pool
+
+
+async def scrape(url: str) -> Tuple[models.ArticleScraped, List[models.CommentScraped]]:
+    """
+    Scrapes the url through the shared scraper pool.
+    """
+    return await init_or_get_scraper_pool().scrape(url)
+
+
+def init_scraper_pool(app):
+    """
+    Stops the scraper workers and closes the pooled connections when the app shuts down.
+    """
+
+    @app.on_event("shutdown")
+    async def shutdown():
+        if scraper_pool is not None:
+            scraper_pool.shutdown()
+        await http.close_session()
@@ -1,3 +1,4 @@
+import asyncio
 from data.scrapers import Scraper, NoCommentsWarning, UnknownStructureWarning
 import re
 from datetime import datetime
@@ -10,6 +11,7 @@ logger = logging.getLogger('scraper')
 
 
 class SueddeutscheScraper(Scraper):
+    site = 'sz'
     API_KEY = config.get('scrapers', 'sz_api_key')
 
     @staticmethod
@@ -17,10 +19,10 @@ class SueddeutscheScraper(Scraper):
         return re.match(r'(https?://)?(www\.)?sueddeutsche\.de/.*', url)
 
     @classmethod
-    def _scrape(cls, url):
-        bs = cls.get_html(url)
+    async def _scrape(cls, url):
+        bs = await cls.get_html(url)
         article = cls._scrape_article(bs, url)
-        comments = cls._scrape_comments(bs, url)
+        comments = await cls._scrape_comments(bs, url)
 
         return article, comments
 
@@ -86,17 +88,17 @@ class SueddeutscheScraper(Scraper):
         return data
 
     @classmethod
-    def _scrape_comments(cls, bs, url):
+    async def _scrape_comments(cls, bs, url):
         discussion_url = [e['href'] for e in bs.select('div.sz-article-body__asset a.sz-teaser--article')
                           if 'leserdiskussion' in e['href']]
         if len(discussion_url) > 0:
-            return cls._scrape_comments_disqus(discussion_url[0])
+            return await cls._scrape_comments_disqus(discussion_url[0])
 
         conf = json.loads(bs.select_one('#szde-article-config').get_text())
         print(conf)
 
     @classmethod
-    def _scrape_comments_disqus(cls, url):
+    async def _scrape_comments_disqus(cls, url):
         comments = []
 
         parameters = {
@@ -111,7 +113,7 @@ class SueddeutscheScraper(Scraper):
         responses = []
 
         # raw return includes metadata about the page of comments (e.g.if any more pages)
-        raw_return = cls.get_json('https://disqus.com/api/3.0/posts/list.json', params=parameters)
+        raw_return = await cls.get_json('https://disqus.com/api/3.0/posts/list.json', params=parameters)
         responses.extend(raw_return['response'])
 
         # pagination: keep adding comments from next pages.
@@ -121,7 +123,7 @@ class SueddeutscheScraper(Scraper):
         # scrape all next pages, but do not go into infinite loop
         while raw_return['cursor']['hasNext'] and counter < max_counter:
             parameters['cursor'] = raw_return['cursor']['next']
-            raw_return = cls.get_json('https://disqus.com/api/3.0/posts/list.json', params=parameters)
+            raw_return = await cls.get_json('https://disqus.com/api/3.0/posts/list.json', params=parameters)
             responses.extend(raw_return['response'])
 
         for comment_data in responses:
@@ -136,7 +138,7 @@ class SueddeutscheScraper(Scraper):
 
 
 if __name__ == '__main__':
-    SueddeutscheScraper.test_scraper([
+    asyncio.run(SueddeutscheScraper.test_scraper([
         'https://www.sueddeutsche.de/politik/brexit-johnson-unterhaus-neuwahlen-1.4647880',
         'https://www.sueddeutsche.de/politik/groko-csu-spd-einigung-grundrente-1.4676599'
-    ])
+    ]))
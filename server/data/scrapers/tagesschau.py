@@ -1,3 +1,4 @@
+import asyncio
 import re
 from data.scrapers import Scraper, NoCommentsWarning
 from datetime import datetime
@@ -8,18 +9,20 @@ logger = logging.getLogger('scraper')
 
 
 class TagesschauScraper(Scraper):
+    site = 'tagesschau'
+
     @staticmethod
     def assert_url(url):
         return re.match(r'(https?://)?(www\.)?tagesschau\.de/.*', url)
 
     @classmethod
-    def _scrape(cls, url):
-        bs = cls.get_html(url)
+    async def _scrape(cls, url):
+        bs = await cls.get_html(url)
         article = cls._scrape_article(bs, url)
 
         try:
             meta_url = bs.select('div.modConComments h3.headline a')[0]['href']
-            comments = cls._scrape_comments(meta_url)
+            comments = await cls._scrape_comments(meta_url)
         except IndexError:
             raise NoCommentsWarning('No Comments found!')
 
@@ -51,10 +54,10 @@ class TagesschauScraper(Scraper):
         return article
 
     @classmethod
-    def _scrape_comments(cls, url):
+    async def _scrape_comments(cls, url):
         comments = []
 
-        bs = cls.get_html(url)
+        bs = await cls.get_html(url)
         for e in bs.select('div#comments div.comment'):
             comments.append(cls._parse_comment(e))
 
@@ -83,9 +86,9 @@ class TagesschauScraper(Scraper):
 
 
 if __name__ == '__main__':
-    TagesschauScraper.test_scraper([
+    asyncio.run(TagesschauScraper.test_scraper([
         'https://www.tagesschau.de/inland/cdu-parteitag-185.html',
         'https://www.tagesschau.de/ausland/impeachment-schiff-101~_origin-5edd7d7c-309b-445b-8cc1-d98aa2901486.html',
         'https://www.tagesschau.de/investigativ/ndr/antibiotika-gefluegel-101.html',
         'https://www.tagesschau.de/ausland/griechisch-tuerkische-grenze-101.html'
-    ])
+    ]))
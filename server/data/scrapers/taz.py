@@ -1,3 +1,4 @@
+import asyncio
 import re
 from data.scrapers import Scraper, NoCommentsWarning
 from datetime import datetime
@@ -8,13 +9,15 @@ logger = logging.getLogger('scraper')
 
 
 class TAZScraper(Scraper):
+    site = 'taz'
+
     @staticmethod
     def assert_url(url):
         return re.match(r'(https?://)?(www\.)?taz\.de/.*', url)
 
     @classmethod
-    def _scrape(cls, url):
-        bs = cls.get_html(url)
+    async def _scrape(cls, url):
+        bs = await cls.get_html(url)
         article = cls._scrape_article(bs, url)
         comments = cls._scrape_comments(bs)
 
@@ -80,10 +83,10 @@ class TAZScraper(Scraper):
 
 
 if __name__ == '__main__':
-    TAZScraper.test_scraper([
+    asyncio.run(TAZScraper.test_scraper([
         'https://taz.de/Die-Gruenen-und-die-K-Frage/!5642445/',
         'https://taz.de/Von-Israel-besetzte-Gebiete/!5637101/',
         'https://taz.de/Abwahl-von-AfD-Politiker-im-Ausschuss/!5641977/',
         'https://taz.de/Machtambitionen-der-Gruenen/!5638650/',
         'https://taz.de/Gruene-Bundesvorsitzende-bestaetigt/!5642426/'
-    ])
+    ]))
@@ -1,3 +1,4 @@
+import asyncio
 import re
 from data.scrapers import Scraper, UnknownStructureWarning, ScraperWarning
 from datetime import datetime
@@ -8,6 +9,8 @@ logger = logging.getLogger('scraper')
 
 
 class WeltScraper(Scraper):
+    site = 'welt'
+
     @staticmethod
     def assert_url(url):
         return re.match(r'https?://(www\.)?welt\.de/.*', url)
@@ -18,14 +21,14 @@ class WeltScraper(Scraper):
         return url
 
     @classmethod
-    def _scrape(cls, url):
-        bs = Scraper.get_html(url)
+    async def _scrape(cls, url):
+        bs = await Scraper.get_html(url)
 
         if not bs:
             raise ScraperWarning('HTTP request failed!')
 
         article = cls._scrape_article(bs, url)
-        comments = cls._scrape_comments(url)
+        comments = await cls._scrape_comments(url)
 
         return article, comments
 
@@ -64,7 +67,7 @@ class WeltScraper(Scraper):
             return None
 
     @classmethod
-    def _scrape_comments(cls, url):
+    async def _scrape_comments(cls, url):
         comments = {}
         doc_id = re.search(r'/(?:article|plus|live)(\d+)/', url).group(1)
         base_url = f'https://api-co.la.welt.de/api/comments?document-id={doc_id}&sort=NEWEST&limit=100'
@@ -76,7 +79,7 @@ class WeltScraper(Scraper):
             url = base_url
             if cursor:
                 url = f'{base_url}&created-cursor={cursor}'
-            raw_comments = cls.get_json(url)['comments']
+            raw_comments = (await cls.get_json(url))['comments']
 
             if raw_comments:
                 if raw_comments[-1]['created'] == cursor:
@@ -90,9 +93,10 @@ class WeltScraper(Scraper):
             else:
                 break
 
-        for parent_id in parents:
-            raw_comments = cls.get_json(f'{base_url}&parent-id={parent_id}')['comments']
-            for c in raw_comments:
+        # the replies of all threads are loaded at once
+        replies = await asyncio.gather(*[cls.get_json(f'{base_url}&parent-id={parent_id}') for parent_id in parents])
+        for raw_replies in replies:
+            for c in raw_replies['comments']:
                 comment = cls._parse_comment(c)
                 comments[comment.comment_id] = comment
 
@@ -120,10 +124,10 @@ class WeltScraper(Scraper):
 
 
 if __name__ == '__main__':
-    WeltScraper.test_scraper([
+    asyncio.run(WeltScraper.test_scraper([
         'https://www.welt.de/politik/deutschland/article203182606/Aus-Syrien-Deutschland-muss-mutmassliche-IS-Anhaengerin-zurueckholen.html',
         'https://www.welt.de/politik/deutschland/article203346702/Grundrente-FDP-Chef-Lindner-tadelt-Willkuerrente.html',
         'https://www.welt.de/kultur/kunst-und-architektur/article194890561/Humboldt-Forum-Das-Museum-fuer-innere-Leere-mitten-in-Berlin.html',
         'https://www.welt.de/politik/ausland/plus203109148/Wolfgang-Ischinger-Wir-tun-das-nicht-fuer-Trump-wir-tun-das-fuer-uns.html'
 
-    ])
+    ]))
@@ -1,3 +1,4 @@
+import asyncio
 import re
 from data.scrapers import Scraper
 from datetime import datetime, timedelta
@@ -8,15 +9,17 @@ logger = logging.getLogger('scraper')
 
 
 class ZONScraper(Scraper):
+    site = 'zon'
+
     @staticmethod
     def assert_url(url):
         return re.match(r'(https?://)?(www\.)?zeit\.de/.*', url)
 
     @classmethod
-    def _scrape(cls, url):
-        bs = cls.get_html(url + '?sort=desc')
+    async def _scrape(cls, url):
+        bs = await cls.get_html(url + '?sort=desc')
         article = cls._scrape_article(bs, url)
-        comments = cls._scrape_comments(bs, url)
+        comments = await cls._scrape_comments(bs, url)
         return article, comments
 
     @classmethod
@@ -50,36 +53,36 @@ class ZONScraper(Scraper):
         return author
 
     @classmethod
-    def _scrape_comments(cls, bs, url):
-        page_url_stack = set()
-        resolved_urls = [url + '?sort=desc#comments']
-        resolved_urls = set(resolved_urls)
+    async def _scrape_comments(cls, bs, url):
+        resolved_urls = {url + '?sort=desc#comments'}
         comments = []
-
-        while True:
-            # get direct comments
-            for e in bs.select('#comments article'):
-                comments.append(cls._parse_comment(e))
-
-            # get async load comments
-            for nested in bs.select('#comments div.comment-section__body > div.comment__container a'):
-                bss = Scraper.get_html(nested['data-url'])
-                for e in bss.select('article'):
+        pages = [bs]
+
+        while pages:
+            page_urls = set()
+            nested_urls = []
+            for bs in pages:
+                # get direct comments
+                for e in bs.select('#comments article'):
                     comments.append(cls._parse_comment(e))
 
-            # get pagination
-            for e in bs.select('ul.pager__pages li a'):
-                page_url_stack.add(e['href'])
-            page_url_stack = page_url_stack.difference(resolved_urls)
+                # get async load comments
+                for nested in bs.select('#comments div.comment-section__body > div.comment__container a'):
+                    nested_urls.append(nested['data-url'])
 
-            # am I done?
-            if len(page_url_stack) == 0:
-                break
+                # get pagination
+                for e in bs.select('ul.pager__pages li a'):
+                    page_urls.add(e['href'])
+            page_urls = page_urls.difference(resolved_urls)
+            resolved_urls.update(page_urls)
 
-            # load next comment page
-            next_url = page_url_stack.pop()
-            resolved_urls.add(next_url)
-            bs = cls.get_html(next_url)
+            # load nested threads and all newly linked comment pages at once
+            results = await asyncio.gather(*[Scraper.get_html(nested_url) for nested_url in nested_urls],
+                                           *[cls.get_html(page_url) for page_url in page_urls])
+            for bss in results[:len(nested_urls)]:
+                for e in bss.select('article'):
+                    comments.append(cls._parse_comment(e))
+            pages = results[len(nested_urls):]
 
         return comments
 
@@ -144,11 +147,11 @@ class ZONScraper(Scraper):
 
 
 if __name__ == '__main__':
-    ZONScraper.test_scraper([
+    asyncio.run(ZONScraper.test_scraper([
         'https://www.zeit.de/wissen/2020-01/buschfeuer-australien-waldbraende-buschbraende-region-duerre-3',
         'https://www.zeit.de/wirtschaft/2017-11/weltklimakonferenz-bonn-naivitaet-politik-5vor8',
         'https://zeit.de/zeit-geschichte/2017/04/orientalismus-kino-hollywood-georg-seesslen',
         'https://www.zeit.de/kultur/film/2019-10/preis-der-freiheit-zdf-dreiteiler-ddr-rezension/komplettansicht',
         'https://www.zeit.de/politik/ausland/2019-11/brexit-grossbritannien-boris-johnson-deutsche-wirtschaft-jeremy-corbyn',
         'https://www.zeit.de/politik/deutschland/2019-11/annegret-kramp-karrenbauer-cdu-parteitag-gegner'
-    ])
+    ]))
@@ -0,0 +1,54 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+logger = logging.getLogger('data.singleflight')
+
+T = TypeVar('T')
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        """
+        Coalesces concurrent calls for the same key: the first call does the work, later calls for the same key
+        await the same task until it is finished.
+        :param name: used for logging
+        """
+        self.name = name
+        self.calls = 0
+        self.coalesced = 0
+        self._tasks: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Returns the result of fn() or of the call already running for key. Exceptions are raised in all callers.
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda finished: self._forget(key, finished))
+        else:
+            self.coalesced += 1
+            logger.debug(f'{self.name}: joining running call for {key}')
+        # a cancelled caller (e.g. a closed connection) must not cancel the work the other callers wait for
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {
+            'in_flight': len(self._tasks),
+            'calls': self.calls,
+            'coalesced': self.coalesced
+        }
+
+    def _forget(self, key: Hashable, task: asyncio.Future):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # avoid "exception was never retrieved" warnings if all callers were cancelled
+        if not task.cancelled():
+            task.exception()
+
+
+graph_builds = SingleFlight('graph_builds')
+article_scrapes = SingleFlight('article_scrapes')
@@ -0,0 +1,50 @@
+import logging
+import sqlite3
+
+from common import config
+
+logger = logging.getLogger('data.storage')
+
+# [cache] option -> (PRAGMA, default), applied to every new SQLite connection
+SQLITE_PRAGMAS = {
+    # lets the retention return free pages with PRAGMA incremental_vacuum, only takes effect for new
+    # databases or after a full VACUUM (scripts/retention.py --vacuum)
+    'sqlite_auto_vacuum': ('auto_vacuum', 'INCREMENTAL'),
+    # readers don't block the writer and vice versa
+    'sqlite_journal_mode': ('journal_mode', 'WAL'),
+    # with WAL, NORMAL only risks the last transactions on power loss, not corruption
+    'sqlite_synchronous': ('synchronous', 'NORMAL'),
+    'sqlite_mmap_size': ('mmap_size', '268435456'),
+    # negative values are KiB
+    'sqlite_cache_size': ('cache_size', '-65536'),
+    'sqlite_busy_timeout': ('busy_timeout', '5000')
+}
+
+
+def sqlite_pragmas() -> dict:
+    return {pragma: config.get('cache', option, fallback=default)
+            for option, (pragma, default) in SQLITE_PRAGMAS.items()}
+
+
+class TunedConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        """
+        SQLite connection that applies the configured pragmas when it is opened.
+        Used for the aiosqlite connections of the databases package as well as for the engine.
+        """
+        super().__init__(*args, **kwargs)
+        for pragma, value in sqlite_pragmas().items():
+            self.execute(f'PRAGMA {pragma} = {value}')
+
+
+def connect_args(database_url: str) -> dict:
+    """
+    Arguments for sqlite3.connect, passed through by the engine (connect_args) and databases.Database.
+    """
+    if not database_url.startswith('sqlite'):
+        return {}
+    return {
+        'factory': TunedConnection,
+        # size of the per connection cache of prepared statements, queries are cached by their SQL text
+        'cached_statements': config.getint('cache', 'sqlite_cached_statements', fallback=256)
+    }
@@ -7,11 +7,15 @@ def run(args=None):
     init_config(args)
 
     from data.database import init_db
+    from data.retention import init_retention
+    from data.scrapers.pool import init_scraper_pool
     from api import Server
 
     init_logging()
     server = Server()
     init_db(server.app)
+    init_retention(server.app)
+    init_scraper_pool(server.app)
 
     return server
 
@@ -1,27 +1,33 @@
 import argparse
+import asyncio
 import json
 import os
-import hashlib
 import time
-from collections import defaultdict
-from typing import Dict, Any
-from fastapi.testclient import TestClient
-from server.main import run
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List
 from urllib.parse import quote
-import data.models as models
-import pytest
-import requests
 
-# server = run(['--config', 'configs/testing.ini'])
-# client = TestClient(server.app)
+import requests
 
-parser = argparse.ArgumentParser(description='Process some integers.')
+parser = argparse.ArgumentParser(description='Scrape and cache articles (and optionally their graphs) '
+                                             'through the API of a running server')
 parser.add_argument('-f', type=str, dest='collection_folder', default=None,
                     help='Folder of files with lists of URLs to scrape')
 parser.add_argument('-c', type=str, dest='collection', default=None,
                     help='File with list of all URLs to scrape')
 parser.add_argument('-u', type=str, dest='base_url', default='http://0.0.0.0:9080',
-                    help='File with list of all URLs to scrape')
+                    help='Base URL of the server')
+parser.add_argument('-n', type=int, dest='concurrency', default=4,
+                    help='Number of articles processed at the same time')
+parser.add_argument('-j', type=str, dest='journal', default='backfill_journal.jsonl',
+                    help='Progress journal, URLs finished in an earlier run with this journal are skipped')
+parser.add_argument('--precompute', action='store_true',
+                    help='Also build and cache the graph with the default config for each article')
+parser.add_argument('--retry-failed', action='store_true',
+                    help='Retry URLs that failed in an earlier run')
+parser.add_argument('--timeout', type=float, default=300.,
+                    help='Timeout in seconds for a single request')
 args = parser.parse_args()
 
 
@@ -38,6 +44,98 @@ def process_collections_folder(folder):
         yield from process_collections_file(os.path.join(folder, f))
 
 
+def read_journal(path: str) -> Dict[str, dict]:
+    """
+    Returns the last journal entry per URL.
+    """
+    entries = {}
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line may be incomplete if the run was killed
+                    continue
+                entries[entry['url']] = entry
+    return entries
+
+
+def is_done(entry: dict) -> bool:
+    if entry is None:
+        return False
+    if entry['status'] != 'OK':
+        return not args.retry_failed
+    return entry.get('graph') or not args.precompute
+
+
+def unique(urls: Iterator[str]) -> List[str]:
+    return list(dict.fromkeys(urls))
+
+
+def fetch_article(url: str) -> dict:
+    response = requests.get(f'{args.base_url}/api/platforms/article?identifier={quote(url)}', timeout=args.timeout)
+    result = response.json()
+    if response.status_code != 200:
+        return {'status': result['detail']['status'], 'error': result['detail'].get('error')}
+    return {'status': 'OK', 'article_id': result['payload']['id'],
+            'comments': len(result['payload']['comments'])}
+
+
+def fetch_graph(article_id: int) -> int:
+    response = requests.post(f'{args.base_url}/api/graph/', json={'article_ids': [article_id]}, timeout=args.timeout)
+    response.raise_for_status()
+    return len(response.json()['edges'])
+
+
+class Backfill:
+    def __init__(self, journal, executor: ThreadPoolExecutor):
+        """
+        Processes URLs with bounded concurrency, the blocking requests run in the executor.
+        :param journal: open file the result of every URL is appended to
+        """
+        self.journal = journal
+        self.executor = executor
+        self.semaphore = asyncio.Semaphore(args.concurrency)
+        self.stats = Counter()
+
+    async def run(self, url: str):
+        async with self.semaphore:
+            loop = asyncio.get_event_loop()
+            start = time.time()
+            try:
+                entry = await loop.run_in_executor(self.executor, fetch_article, url)
+                if entry['status'] == 'OK' and args.precompute:
+                    entry['edges'] = await loop.run_in_executor(self.executor, fetch_graph, entry['article_id'])
+                    entry['graph'] = True
+            except Exception as e:
+                entry = {'status': 'REQUEST_ERROR', 'error': str(e)}
+            entry = {'url': url, **entry, 'seconds': round(time.time() - start, 3)}
+
+            self.journal.write(json.dumps(entry) + '\n')
+            self.journal.flush()
+            self.stats[entry['status']] += 1
+            self.stats['graphs'] += int(entry.get('graph', False))
+            print(f"{entry['status']} for {url} in {entry['seconds']}s"
+                  + (f": {entry['error']}" if entry.get('error') else ''))
+
+
+async def main(urls: List[str]):
+    with open(args.journal, 'a') as journal, ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        backfill = Backfill(journal, executor)
+        start = time.time()
+        await asyncio.gather(*[backfill.run(url) for url in urls])
+        elapsed = time.time() - start
+
+    processed = sum(count for status, count in backfill.stats.items() if status != 'graphs')
+    print(f'Processed {processed} URLs in {elapsed:.1f}s ({processed / max(elapsed, 1e-9):.2f} URLs/s), '
+          f"{backfill.stats['OK']} cached, {processed - backfill.stats['OK']} failed, "
+          f"{backfill.stats['graphs']} graphs precomputed")
+    for status, count in sorted(backfill.stats.items()):
+        if status not in ('OK', 'graphs'):
+            print(f'  {status}: {count}')
+
+
 if __name__ == '__main__':
     urls = []
     if args.collection:
@@ -48,11 +146,9 @@ if __name__ == '__main__':
         print('No collection source given!')
         exit(1)
 
-    for url in urls:
-        # response = client.get(f'/api/platforms/article?url={quote(url)}')
-        response = requests.get(f'{args.base_url}/api/platforms/article?url={quote(url)}')
+    urls = unique(urls)
+    journal = read_journal(args.journal)
+    todo = [url for url in urls if not is_done(journal.get(url))]
+    print(f'{len(urls) - len(todo)} of {len(urls)} URLs already done according to {args.journal}')
 
-        try:
-            print(f"{response.status_code} {response.json()['detail']['status']} for {url}")
-        except Exception as e:
-            print(f'ERROR: {e} for {url}')
+    asyncio.run(main(todo))
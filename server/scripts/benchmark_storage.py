@@ -0,0 +1,95 @@
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from common import init_config
+import common
+
+parser = argparse.ArgumentParser(description='Measure comment read latency while articles are written concurrently')
+parser.add_argument('--config', type=str, default='configs/example.ini',
+                    help='Path to the config file to use')
+parser.add_argument('--journal-mode', type=str, default=None,
+                    help='Overrides [cache] sqlite_journal_mode, e.g. DELETE to compare with WAL')
+parser.add_argument('--articles', type=int, default=50,
+                    help='Number of articles stored before the measurement')
+parser.add_argument('--comments', type=int, default=500,
+                    help='Number of comments per article')
+parser.add_argument('--writers', type=int, default=2,
+                    help='Number of concurrent tasks storing new articles')
+parser.add_argument('--readers', type=int, default=4,
+                    help='Number of concurrent tasks reading comments')
+parser.add_argument('--duration', type=float, default=10.,
+                    help='Seconds to measure')
+args = parser.parse_args()
+
+WORDS = ['die', 'Regierung', 'hat', 'heute', 'nicht', 'genug', 'getan', 'Klima', 'Wahl', 'warum', 'immer']
+
+
+def make_article(n: int):
+    import data.models as models
+    article = models.ArticleScraped(url=f'https://example.com/article-{n}-{random.random()}', title='Benchmark',
+                                    text='Benchmark', published_time=datetime(2020, 5, 1), scraper='benchmark')
+    comments = []
+    for i in range(args.comments):
+        reply_to = f'c{random.randrange(i)}' if i and random.random() < 0.3 else None
+        comments.append(models.CommentScraped(username='user', comment_id=f'c{i}', reply_to=reply_to,
+                                              timestamp=datetime(2020, 5, 1) + timedelta(seconds=i),
+                                              text=' '.join(random.choices(WORDS, k=30))))
+    return article, comments
+
+
+async def writer(db, stop: float, counter: list):
+    while time.time() < stop:
+        await db.insert_article_with_comments(*make_article(counter[0]))
+        counter[0] += 1
+
+
+async def reader(db, article_ids: list, stop: float, latencies: list):
+    while time.time() < stop:
+        start = time.perf_counter()
+        await db.get_comments(random.choice(article_ids))
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0)
+
+
+async def store_articles(db) -> list:
+    return [(await db.insert_article_with_comments(*make_article(n))).id for n in range(args.articles)]
+
+
+async def main(db):
+    await db.database.connect()
+    # databases binds a connection to the task context, so the tasks started below
+    # must not inherit one from this task and share it
+    article_ids = await asyncio.ensure_future(store_articles(db))
+
+    latencies = []
+    written = [0]
+    stop = time.time() + args.duration
+    await asyncio.gather(*[writer(db, stop, written) for _ in range(args.writers)],
+                         *[reader(db, article_ids, stop, latencies) for _ in range(args.readers)])
+    await db.database.disconnect()
+
+    latencies = np.array(latencies) * 1000
+    print(f'journal_mode={common.config.get("cache", "sqlite_journal_mode", fallback="WAL")}: '
+          f'{len(latencies)} reads, {written[0]} articles written')
+    print(f'read latency ms: p50={np.percentile(latencies, 50):.2f} p95={np.percentile(latencies, 95):.2f} '
+          f'p99={np.percentile(latencies, 99):.2f} max={latencies.max():.2f}')
+
+
+if __name__ == '__main__':
+    init_config(['--config', args.config])
+    directory = tempfile.mkdtemp()
+    common.config.set('cache', 'db_url', f'sqlite:///{os.path.join(directory, "benchmark.db")}')
+    if args.journal_mode:
+        common.config.set('cache', 'sqlite_journal_mode', args.journal_mode)
+
+    # the database module connects on import, so it is imported after the config is set
+    import data.database as db
+
+    asyncio.run(main(db))
@@ -0,0 +1,36 @@
+import argparse
+import sys
+import numpy as np
+
+from common import init_config
+import common
+
+parser = argparse.ArgumentParser(description='Export the keras toxicity model for the NumPy inference backend')
+parser.add_argument('--config', type=str, default='configs/example.ini',
+                    help='Path to the config file to use')
+parser.add_argument('--samples', type=int, default=64,
+                    help='Number of random inputs used to compare both backends')
+parser.add_argument('--tolerance', type=float, default=1e-4,
+                    help='Maximal absolute deviation between keras and NumPy predictions')
+args = parser.parse_args()
+
+if __name__ == '__main__':
+    init_config(['--config', args.config])
+
+    from tensorflow.keras.models import load_model as load_keras_model
+    from data.processors.inference import export_keras_model, max_deviation, NumpyModel
+
+    keras_model = load_keras_model(common.config.get('TextProcessing', 'toxicity_path'))
+    npz_path = common.config.get('TextProcessing', 'toxicity_npz_path')
+    export_keras_model(keras_model, npz_path)
+
+    numpy_model = NumpyModel(npz_path)
+    window_length = common.config.getint('ToxicityRanker', 'window_length')
+    n_features = common.init_or_get_fasttext_model().get_dimension()
+    x = np.random.normal(scale=0.1, size=(args.samples, window_length, n_features)).astype('float32')
+    deviation = max_deviation(keras_model, numpy_model, x)
+
+    print(f'Exported {npz_path}; max deviation from keras: {deviation:.2e}')
+    if deviation > args.tolerance:
+        print(f'ERROR: deviation exceeds tolerance of {args.tolerance}')
+        sys.exit(1)
@@ -0,0 +1,29 @@
+import argparse
+import asyncio
+
+from common import init_config
+
+parser = argparse.ArgumentParser(description='Apply the cache retention policy of the config once')
+parser.add_argument('--config', type=str, default='configs/example.ini',
+                    help='Path to the config file to use')
+parser.add_argument('--vacuum', action='store_true',
+                    help='Run a full VACUUM afterwards, also enables incremental vacuum for existing databases')
+args = parser.parse_args()
+
+
+async def main():
+    import data.database as db
+    from data.retention import run_retention
+
+    await db.database.connect()
+    stats = await run_retention()
+    print(f'Deleted: {dict(stats)}')
+    if args.vacuum:
+        print('Running VACUUM, this can take a while for large databases')
+        await db.database.execute('VACUUM')
+    await db.database.disconnect()
+
+
+if __name__ == '__main__':
+    init_config(['--config', args.config])
+    asyncio.run(main())
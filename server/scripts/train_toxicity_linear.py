@@ -0,0 +1,83 @@
+import argparse
+import csv
+import numpy as np
+
+from common import init_config
+import common
+
+parser = argparse.ArgumentParser(description='Train the linear toxicity scorer on averaged fastText sentence vectors')
+parser.add_argument('--config', type=str, default='configs/example.ini',
+                    help='Path to the config file to use')
+parser.add_argument('-d', type=str, dest='dataset', required=True,
+                    help='CSV file with the labelled comments used for the toxicity model (columns: text, label)')
+parser.add_argument('--hidden', type=int, default=0,
+                    help='Number of hidden ReLU units, 0 trains a logistic regression')
+parser.add_argument('--epochs', type=int, default=200,
+                    help='Number of full batch training epochs')
+parser.add_argument('--lr', type=float, default=0.01,
+                    help='Learning rate for Adam')
+parser.add_argument('--l2', type=float, default=1e-4,
+                    help='L2 regularisation of the weights')
+args = parser.parse_args()
+
+
+def load_dataset(path, model):
+    texts, labels = [], []
+    with open(path, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            texts.append(row['text'])
+            labels.append(float(row['label']))
+
+    from data.processors.embedding import vectorize_sentence
+    x = np.array([vectorize_sentence(model, text) for text in texts], dtype='float32')
+    return x, np.array(labels, dtype='float32').reshape(-1, 1)
+
+
+def train(x, y, hidden, epochs, lr, l2):
+    rng = np.random.RandomState(42)
+    params = {}
+    if hidden:
+        params['hidden_kernel'] = rng.normal(scale=np.sqrt(2 / x.shape[1]), size=(x.shape[1], hidden))
+        params['hidden_bias'] = np.zeros(hidden)
+        params['kernel'] = rng.normal(scale=np.sqrt(1 / hidden), size=(hidden, 1))
+    else:
+        params['kernel'] = np.zeros((x.shape[1], 1))
+    params['bias'] = np.zeros(1)
+    moments = {k: (np.zeros_like(v), np.zeros_like(v)) for k, v in params.items()}
+
+    for epoch in range(1, epochs + 1):
+        # forward
+        h = np.maximum(x @ params['hidden_kernel'] + params['hidden_bias'], 0.) if hidden else x
+        p = 1. / (1. + np.exp(-(h @ params['kernel'] + params['bias'])))
+        loss = -np.mean(y * np.log(p + 1e-7) + (1 - y) * np.log(1 - p + 1e-7))
+
+        # backward
+        grad_out = (p - y) / len(x)
+        grads = {'kernel': h.T @ grad_out + l2 * params['kernel'], 'bias': grad_out.sum(axis=0)}
+        if hidden:
+            grad_h = (grad_out @ params['kernel'].T) * (h > 0)
+            grads['hidden_kernel'] = x.T @ grad_h + l2 * params['hidden_kernel']
+            grads['hidden_bias'] = grad_h.sum(axis=0)
+
+        # adam
+        for k, g in grads.items():
+            m, v = moments[k]
+            m[:] = 0.9 * m + 0.1 * g
+            v[:] = 0.999 * v + 0.001 * g ** 2
+            params[k] -= lr * (m / (1 - 0.9 ** epoch)) / (np.sqrt(v / (1 - 0.999 ** epoch)) + 1e-8)
+
+        if epoch % 20 == 0:
+            print(f'epoch {epoch}: loss={loss:.4f} accuracy={np.mean((p > 0.5) == (y > 0.5)):.4f}')
+    return params
+
+
+if __name__ == '__main__':
+    init_config(['--config', args.config])
+
+    x, y = load_dataset(args.dataset, common.init_or_get_fasttext_model())
+    print(f'Loaded {len(x)} labelled comments ({int(y.sum())} toxic)')
+    params = train(x, y, args.hidden, args.epochs, args.lr, args.l2)
+
+    path = common.config.get('TextProcessing', 'toxicity_linear_path')
+    np.savez(path, **{k: v.astype('float32') for k, v in params.items()})
+    print(f'Saved linear toxicity scorer to {path}')
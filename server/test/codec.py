@@ -0,0 +1,28 @@
+import json
+
+import pytest
+
+import data.models as models
+from data.codec import CompactGraph, decode_graph, pack_edges, unpack_edges
+from data.processors.graph import GraphRepresentation
+
+pytestmark = pytest.mark.usefixtures('fake_models')
+
+
+def test_stored_graph_serialises_like_the_model(make_comments):
+    graph = GraphRepresentation(make_comments(30), conf={'SizeRanker': {'active': 'yes'}})
+    model = models.Graph(**graph.__dict__())
+    model.article_ids = [1]
+    model.graph_id = 7
+    model.version = 2
+
+    # as in store_graph and get_graph of the database
+    loaded = decode_graph(CompactGraph.from_graph(model).to_bytes(), article_ids=[1], graph_id=7, version=2)
+    assert loaded.num_edges == len(model.edges)
+    assert json.loads(loaded.to_json()) == json.loads(model.json())
+    assert json.loads(loaded.to_model().json()) == json.loads(model.json())
+
+
+def test_packed_edges_round_trip(make_comments):
+    edges = GraphRepresentation(make_comments(20)).edges
+    assert unpack_edges(pack_edges(edges)) == edges
@@ -0,0 +1,84 @@
+import json
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from common import init_config
+
+init_config(['--config', 'configs/testing.ini'])
+
+import data.models as models
+import data.processors.embedding as embedding
+import data.processors.ranking as ranking
+
+WORDS = 'der die das ist nicht gut schlecht Politik Regierung Wahl Meinung richtig falsch immer'.split()
+
+
+class WordVectors:
+    # deterministic replacement of the fastText model
+    def get_dimension(self):
+        return 8
+
+    def get_word_vector(self, word):
+        return np.random.RandomState(sum(map(ord, word))).normal(size=8).astype('float32')
+
+    def get_sentence_vector(self, sentence):
+        words = sentence.split()
+        if not words:
+            return np.zeros(8, dtype='float32')
+        return np.mean([self.get_word_vector(word) for word in words], axis=0)
+
+
+class ToxicityModel:
+    # scores depend on the input only, like the trained models
+    input_shape = (None, 125, 8)
+
+    def predict(self, x, verbose=0, batch_size=512):
+        x = np.asarray(x)
+        return np.tanh(x.reshape(len(x), -1).sum(axis=1, keepdims=True))
+
+
+@pytest.fixture
+def fake_models(monkeypatch):
+    """
+    Replaces the fastText and toxicity models, which are not available in tests.
+    """
+    monkeypatch.setattr(ranking, 'init_or_get_fasttext_model', WordVectors)
+    monkeypatch.setattr(embedding, 'init_or_get_fasttext_model', WordVectors)
+    monkeypatch.setattr(ranking, 'init_or_get_toxicity_model', ToxicityModel)
+    monkeypatch.setattr(ranking, 'init_or_get_toxicity_linear_model', ToxicityModel)
+
+
+def generate_comments(n, article_id=1, start_id=1, seed=0):
+    rnd = random.Random(seed)
+    comments = []
+    for i in range(start_id, start_id + n):
+        text = ' '.join(' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(4, 15))) + '.'
+                        for _ in range(rnd.randint(1, 3)))
+        reply_to_id = rnd.choice(comments).id if comments and rnd.random() < 0.3 else None
+        comments.append(models.CommentCached(id=i, article_id=article_id, username='user', comment_id=f'c{i}',
+                                             timestamp=datetime(2020, 5, 1) + timedelta(seconds=rnd.randint(0, 3000)),
+                                             text=text, reply_to_id=reply_to_id, upvotes=rnd.choice([None, 3, 5])))
+    return comments
+
+
+@pytest.fixture
+def make_comments():
+    """
+    Returns a function that generates comments with random texts, replies and votes.
+    """
+    return generate_comments
+
+
+def _graph_json(graph) -> dict:
+    return json.loads(models.Graph(**graph.__dict__()).json())
+
+
+@pytest.fixture
+def graph_json():
+    """
+    Returns a function that serialises a GraphRepresentation like the API does.
+    """
+    return _graph_json
@@ -0,0 +1,75 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# tables as created before graphs.article_key, graph_articles and comments.reply_to_id existed
+BASELINE_SCHEMA = '''
+CREATE TABLE articles (
+    id INTEGER NOT NULL PRIMARY KEY, url VARCHAR UNIQUE, title VARCHAR, subtitle VARCHAR, summary VARCHAR,
+    author VARCHAR, text VARCHAR NOT NULL, published_time DATETIME, scrape_time DATETIME, scraper VARCHAR
+);
+CREATE TABLE comments (
+    id INTEGER NOT NULL PRIMARY KEY, article_id INTEGER NOT NULL REFERENCES articles (id),
+    comment_id VARCHAR NOT NULL, username VARCHAR, timestamp DATETIME, text VARCHAR,
+    reply_to VARCHAR REFERENCES comments (comment_id), num_replies INTEGER, user_id VARCHAR, upvotes INTEGER,
+    downvotes INTEGER, love INTEGER, likes INTEGER, recommended INTEGER, child_count INTEGER,
+    leseempfehlungen INTEGER, title VARCHAR
+);
+CREATE TABLE graphs (id INTEGER NOT NULL PRIMARY KEY, article_ids VARCHAR, graph VARCHAR);
+'''
+
+
+@pytest.fixture
+def baseline_db(tmp_path):
+    path = str(tmp_path / 'baseline.db')
+    with sqlite3.connect(path) as connection:
+        connection.executescript(BASELINE_SCHEMA)
+        connection.executemany('INSERT INTO articles (id, url, text) VALUES (?, ?, ?)',
+                               [(1, 'https://a.example/1', 'a'), (2, 'https://b.example/2', 'b')])
+        # comment ids are only unique within an article
+        connection.executemany('INSERT INTO comments (id, article_id, comment_id, reply_to) VALUES (?, ?, ?, ?)',
+                               [(1, 1, 'c1', None), (2, 1, 'c2', 'c1'), (3, 2, 'c1', None),
+                                (4, 2, 'c3', 'c1'), (5, 2, 'c4', 'c3'), (6, 2, 'c5', 'deleted')])
+        connection.executemany('INSERT INTO graphs (id, article_ids, graph) VALUES (?, ?, ?)',
+                               [(1, '[1]', '{}'), (2, '[2, 1, 1]', '{}')])
+    return path
+
+
+def import_database(path: str):
+    # the database module migrates the database of [cache] db_url when it is imported
+    code = ('import common\n'
+            'common.init_config(["--config", "configs/testing.ini"])\n'
+            f'common.config.set("cache", "db_url", "sqlite:///{path}")\n'
+            'import data.database\n')
+    subprocess.run([sys.executable, '-c', code], cwd=SERVER_DIR, check=True)
+
+
+def query(path: str, sql: str) -> list:
+    with sqlite3.connect(path) as connection:
+        return connection.execute(sql).fetchall()
+
+
+def test_graph_articles_are_migrated(baseline_db):
+    import_database(baseline_db)
+    assert query(baseline_db, 'SELECT id, article_key, version FROM graphs ORDER BY id') == [(1, '1', 1),
+                                                                                            (2, '1,2', 1)]
+    expected = [(1, 1), (2, 1), (2, 2)]
+    assert query(baseline_db, 'SELECT graph_id, article_id FROM graph_articles ORDER BY graph_id, article_id') \
+        == expected
+
+    # the migration only runs once
+    import_database(baseline_db)
+    assert query(baseline_db, 'SELECT graph_id, article_id FROM graph_articles ORDER BY graph_id, article_id') \
+        == expected
+
+
+def test_reply_to_ids_are_migrated(baseline_db):
+    import_database(baseline_db)
+    # replies are resolved within the article, unknown parents stay unresolved
+    assert query(baseline_db, 'SELECT id, reply_to_id FROM comments ORDER BY id') == [(1, None), (2, 1), (3, None),
+                                                                                      (4, 3), (5, 4), (6, None)]
@@ -0,0 +1,73 @@
+import pytest
+
+import data.processors.graph as graph
+from data.processors.graph import GraphRepresentation
+from data.memcache import LRUCache
+from data.processors.table import comment_table
+
+pytestmark = pytest.mark.usefixtures('fake_models')
+
+CONF = {'SizeRanker': {'active': 'yes'}, 'VotesRanker': {'active': 'yes'}}
+
+
+def batches(comments, size=7):
+    return (comments[i:i + size] for i in range(0, len(comments), size))
+
+
+def test_streamed_comments_equal_list(make_comments, graph_json, monkeypatch):
+    comments = make_comments(40)
+    full = GraphRepresentation(comments, conf=CONF, record_stage=True)
+    assert graph_json(GraphRepresentation(batches(comments), conf=CONF)) == graph_json(full)
+
+    # the splits of a matching stage are reused, the stream isn't split again
+    split_comment = graph.split_comment
+    splits = []
+    monkeypatch.setattr(graph, 'split_comment', lambda comment: splits.append(comment.id) or split_comment(comment))
+    from_stage = GraphRepresentation(batches(comments), conf=CONF, stage=full.stage)
+    assert graph_json(from_stage) == graph_json(full)
+    assert splits == []
+
+    # all comments are split once the stream stops matching the stage
+    more = make_comments(45)
+    expected = graph_json(GraphRepresentation(more, conf=CONF))
+    splits.clear()
+    assert graph_json(GraphRepresentation(batches(more), conf=CONF, stage=full.stage)) == expected
+    assert splits == [comment.id for comment in more]
+
+
+def test_comment_table_follows_split_comments(make_comments):
+    comments = make_comments(20)
+    graph = GraphRepresentation(comments, conf=CONF)
+    graph.orig_comments = list(reversed(comments))
+    graph.table = None
+
+    table = comment_table(graph)
+    assert table.ids.tolist() == [comment.id for comment in graph.comments]
+    assert table.votes['upvotes'].tolist() == [comment.upvotes or 0 for comment in comments]
+
+    # the table is rebuilt once the comments of the graph change
+    graph.comments = graph.comments[:10]
+    assert comment_table(graph).ids.tolist() == [comment.id for comment in comments[:10]]
+
+
+def test_prefix_cache_states_are_not_shared(make_comments, graph_json, monkeypatch):
+    comments = make_comments(40)
+    # both configs run the same modifiers up to the PageRankBottomFilter
+    confs = [{'PageRankBottomFilter': {'active': 'yes', 'top_k': '30'}},
+             {'PageRankBottomFilter': {'active': 'yes', 'top_k': '15'}}]
+    monkeypatch.setattr(graph, 'init_or_get_prefix_cache', lambda: None)
+    expected = [graph_json(GraphRepresentation(comments, conf=conf)) for conf in confs]
+
+    prefix_cache = LRUCache(max_bytes=64 * 1024 * 1024)
+    monkeypatch.setattr(graph, 'init_or_get_prefix_cache', lambda: prefix_cache)
+    for k in range(2):
+        for conf, expected_json in zip(confs, expected):
+            built = GraphRepresentation(comments, conf=conf)
+            assert graph_json(built) == expected_json
+            # changes to a built graph must not reach the states cached for later builds
+            for edge in built.edges:
+                edge.wgts.TEMPORAL = -1.
+            for comment in built.comments:
+                for split in comment.splits:
+                    split.wgts.PAGERANK = -1.
+    assert prefix_cache.hits > 0
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import data.scrapers.http as http
+from data.scrapers.http_cache import CachedResponse, HTTPCache
+
+
+def serve(handler, requests):
+    """
+    Runs the requests coroutine against a local server with the handler for every path.
+    """
+    async def run():
+        app = web.Application()
+        app.router.add_get('/{path:.*}', handler)
+        async with TestServer(app) as server:
+            try:
+                return await requests(str(server.make_url('/')))
+            finally:
+                await http.close_session()
+
+    return asyncio.run(run())
+
+
+def test_replay_answers_from_the_recorded_responses(tmp_path, monkeypatch):
+    recorder = HTTPCache(str(tmp_path))
+    url = 'https://www.example.com/article'
+    recorder.put(recorder.key('GET', url, {'page': 2}),
+                 CachedResponse(url=url, body='<p>Grüße</p>'.encode('utf-8'), encoding='utf-8',
+                                etag=None, last_modified=None))
+
+    # the recorded entries of an earlier run are found by a new cache
+    cache = HTTPCache(str(tmp_path), replay=True)
+    monkeypatch.setattr(http, 'init_or_get_http_cache', lambda: cache)
+
+    async def requests():
+        assert await http.get_text(url, params={'page': 2}) == '<p>Grüße</p>'
+        # unrecorded requests fail without touching the network and aren't errors of the site
+        with pytest.raises(http.ReplayMiss) as error:
+            await http.get_text(url, params={'page': 3})
+        assert not http.is_site_error(error.value)
+
+    asyncio.run(requests())
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_unmodified_responses_are_revalidated(tmp_path, monkeypatch):
+    cache = HTTPCache(str(tmp_path))
+    monkeypatch.setattr(http, 'init_or_get_http_cache', lambda: cache)
+    conditional = []
+
+    async def handler(request):
+        conditional.append(request.headers.get('If-None-Match'))
+        if request.headers.get('If-None-Match') == '"v1"':
+            return web.Response(status=304)
+        return web.Response(text='{"comments": []}', content_type='application/json', headers={'ETag': '"v1"'})
+
+    async def requests(base_url):
+        return [await http.get_json(base_url + 'comments') for _ in range(2)]
+
+    assert serve(handler, requests) == [{'comments': []}] * 2
+    # the second request is sent with the validator and answered from the cache
+    assert conditional == [None, '"v1"']
+    assert cache.stats()['entries'] == 1
+    assert cache.stats()['revalidated'] == 1
@@ -0,0 +1,23 @@
+import pytest
+
+import data.models as models
+from data.processors.graph import GraphRepresentation
+
+pytestmark = pytest.mark.usefixtures('fake_models')
+
+
+@pytest.mark.parametrize('toxicity', [
+    {'active': 'yes', 'mode': 'SEQUENCE', 'whole_comment': 'no'},
+    {'active': 'yes', 'mode': 'LINEAR', 'whole_comment': 'yes'}
+])
+def test_incremental_equals_full_build(toxicity, make_comments, graph_json):
+    conf = {'ToxicityRanker': toxicity, 'SizeRanker': {'active': 'yes'}, 'VotesRanker': {'active': 'yes'}}
+    comments = make_comments(40)
+
+    old = GraphRepresentation(comments[:30], conf=conf)
+    base = models.Graph.parse_raw(models.Graph(**old.__dict__()).json())
+    base_edges = [models.Edge(**edge.dict(exclude_unset=True)) for edge in old.raw_edges]
+    updated = GraphRepresentation(comments, conf=conf, base=base, base_edges=base_edges)
+    full = GraphRepresentation(comments, conf=conf)
+
+    assert graph_json(updated) == graph_json(full)
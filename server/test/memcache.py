@@ -0,0 +1,59 @@
+from data.memcache import LRUCache
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = LRUCache(max_bytes=30)
+    for key in 'abc':
+        cache.put(key, key.upper(), 10)
+    assert cache.get('a') == 'A'
+
+    # b is the least recently used entry now
+    cache.put('d', 'D', 10)
+    assert cache.get('b') is None
+    assert [cache.get(key) for key in 'acd'] == ['A', 'C', 'D']
+    assert cache.stats()['evictions'] == 1
+
+    # the entries are evicted until the new one fits
+    cache.put('e', 'E', 25)
+    assert [cache.get(key) for key in 'acde'] == [None, None, None, 'E']
+    assert cache.stats()['evictions'] == 4
+
+
+def test_bytes_are_accounted():
+    cache = LRUCache(max_bytes=100)
+    cache.put('a', 1, 40)
+    cache.put('b', 2, 30)
+    assert cache.current_bytes == 70
+
+    # replacing an entry accounts for its new size only
+    cache.put('a', 3, 10)
+    assert cache.current_bytes == 40
+    cache.invalidate('b')
+    assert cache.current_bytes == 10
+    cache.invalidate_where(lambda key, value: value == 3)
+    assert cache.current_bytes == 0
+
+    # values larger than the whole cache are not stored
+    cache.put('c', 4, 101)
+    assert cache.get('c') is None
+    assert cache.stats()['bytes'] == 0
+
+
+def test_values_read_before_an_invalidation_are_not_stored():
+    cache = LRUCache(max_bytes=100)
+    cache.put('a', 'old', 10)
+
+    # a reader misses, the entry is invalidated while it loads the value from the database
+    generation = cache.generation
+    cache.invalidate('a')
+    cache.put('a', 'stale', 10, generation=generation)
+    assert cache.get('a') is None
+
+    generation = cache.generation
+    cache.put('a', 'new', 10, generation=generation)
+    assert cache.get('a') == 'new'
+
+    generation = cache.generation
+    cache.clear()
+    cache.put('a', 'stale', 10, generation=generation)
+    assert cache.get('a') is None
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from data.processors.scheduler import InferenceScheduler, bind
+
+
+class Model:
+    def __init__(self, factor):
+        self.factor = factor
+        self.calls = []
+
+    def predict(self, x):
+        self.calls.append(len(x))
+        if (x < 0).any():
+            raise ValueError('negative input')
+        return x * self.factor
+
+
+def submit_all(scheduler, work):
+    # the batch is closed as soon as all rows arrived, so all work is collected at once
+    scheduler.max_batch_size = sum(len(x) for _, _, x in work)
+    return [scheduler.submit(key, fn, x) for key, fn, x in work]
+
+
+def test_batches_are_split_by_key_and_fn():
+    scheduler = InferenceScheduler(max_wait_ms=10000)
+    double, triple = Model(2), Model(3)
+    x = np.arange(4.).reshape(2, 2)
+    futures = submit_all(scheduler, [('a', double.predict, x), ('a', double.predict, x + 1),
+                                     ('b', double.predict, x + 2), ('a', triple.predict, x + 3)])
+
+    results = [future.result(timeout=10) for future in futures]
+    for result, expected in zip(results, [x * 2, (x + 1) * 2, (x + 2) * 2, (x + 3) * 3]):
+        np.testing.assert_array_equal(result, expected)
+    assert double.calls == [4, 2]
+    assert triple.calls == [2]
+    assert scheduler.stats()['batches'] == 3
+
+
+def test_bound_fns_batch_together():
+    model = Model(2)
+    assert bind(Model.predict, model) is bind(Model.predict, model)
+    assert bind(Model.predict, model) is not bind(Model.predict, Model(2))
+
+    scheduler = InferenceScheduler(max_wait_ms=10000)
+    x = np.ones((3, 2))
+    futures = submit_all(scheduler, [('a', bind(Model.predict, model), x) for _ in range(3)])
+    assert all(np.array_equal(future.result(timeout=10), x * 2) for future in futures)
+    assert model.calls == [9]
+
+
+def test_failing_item_only_fails_itself():
+    scheduler = InferenceScheduler(max_wait_ms=10000)
+    model = Model(2)
+    x = np.ones((2, 2))
+    futures = submit_all(scheduler, [('a', model.predict, x), ('a', model.predict, -x), ('a', model.predict, x + 1)])
+
+    np.testing.assert_array_equal(futures[0].result(timeout=10), x * 2)
+    with pytest.raises(ValueError, match='negative input'):
+        futures[1].result(timeout=10)
+    np.testing.assert_array_equal(futures[2].result(timeout=10), (x + 1) * 2)
+    # the whole batch failed first, then its items were run one by one
+    assert model.calls == [6, 2, 2, 2]
+
+    # the worker is still alive
+    futures = submit_all(scheduler, [('a', model.predict, x)])
+    np.testing.assert_array_equal(futures[0].result(timeout=10), x * 2)
@@ -0,0 +1,58 @@
+import asyncio
+
+from data.singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    async def run():
+        flight = SingleFlight('test')
+        started = asyncio.Event()
+        release = asyncio.Event()
+        builds = []
+
+        async def build():
+            builds.append(1)
+            started.set()
+            await release.wait()
+            return 'graph'
+
+        callers = [asyncio.ensure_future(flight.do('key', build)) for _ in range(5)]
+        await started.wait()
+        assert flight.stats() == {'in_flight': 1, 'calls': 1, 'coalesced': 4}
+
+        # a caller that goes away doesn't cancel the build of the others
+        callers[0].cancel()
+        await asyncio.sleep(0)
+        release.set()
+        assert await asyncio.gather(*callers[1:]) == ['graph'] * 4
+        assert callers[0].cancelled()
+        assert builds == [1]
+        assert flight.stats()['in_flight'] == 0
+
+        # the next call after the build finished starts a new one
+        assert await flight.do('key', build) == 'graph'
+        assert builds == [1, 1]
+
+    asyncio.run(run())
+
+
+def test_errors_are_raised_in_all_callers():
+    async def run():
+        flight = SingleFlight('test')
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError('no comments')
+
+        results = await asyncio.gather(*[flight.do('key', fail) for _ in range(3)], return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        assert flight.stats() == {'in_flight': 0, 'calls': 1, 'coalesced': 2}
+
+        # calls for other keys are not coalesced
+        async def succeed():
+            return 'graph'
+
+        assert await asyncio.gather(flight.do('a', succeed), flight.do('b', succeed)) == ['graph', 'graph']
+        assert flight.stats() == {'in_flight': 0, 'calls': 3, 'coalesced': 2}
+
+    asyncio.run(run())